@@ -0,0 +1,84 @@
+"""
+async_database.py — واجهة غير متزامنة لقاعدة البيانات
+
+تنفّذ دوال database.py على خيوط (threads) مخصصة لقاعدة البيانات حتى لا
+تتوقف حلقة الأحداث (event loop) أثناء الاستعلامات أو الكتابة على القرص.
+كل دالة هنا تحمل نفس اسم ومعاملات نظيرتها في database.py لكنها تُستدعى بـ await.
+"""
+
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+import metrics
+
+# عدد خيوط قاعدة البيانات. لكل خيط اتصال دائم من مجمع database.py،
+# ومع وضع WAL يعمل القراء بالتوازي بينما تنتظر الكتابات دورها عبر busy_timeout.
+DB_WORKERS = int(os.getenv("DB_WORKERS", 4))
+
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+
+async def run(func, *args, **kwargs):
+    """تشغيل أي دالة متزامنة على خيط قاعدة البيانات وانتظار نتيجتها."""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    finally:
+        metrics.observe_db_call(func.__name__, time.perf_counter() - start)
+
+
+def _wrap(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+    return wrapper
+
+
+def shutdown(wait=True):
+    """إيقاف خيوط قاعدة البيانات بعد إنهاء الاستعلامات المعلقة ثم إغلاق اتصالاتها."""
+    _executor.shutdown(wait=wait)
+    db.close_all_connections()
+
+
+# === نظائر دوال database.py ===
+create_booking = _wrap(db.create_booking)
+get_booking = _wrap(db.get_booking)
+get_all_bookings = _wrap(db.get_all_bookings)
+get_bookings_page = _wrap(db.get_bookings_page)
+update_booking_status = _wrap(db.update_booking_status)
+delete_booking = _wrap(db.delete_booking)
+hold_slot = _wrap(db.hold_slot)
+release_slot_hold = _wrap(db.release_slot_hold)
+purge_expired_slot_holds = _wrap(db.purge_expired_slot_holds)
+check_time_slot_available = _wrap(db.check_time_slot_available)
+get_booked_time_slots = _wrap(db.get_booked_time_slots)
+save_rating = _wrap(db.save_rating)
+get_ratings = _wrap(db.get_ratings)
+get_statistics = _wrap(db.get_statistics)
+rebuild_statistics = _wrap(db.rebuild_statistics)
+rebuild_search_index = _wrap(db.rebuild_search_index)
+search_bookings = _wrap(db.search_bookings)
+get_pending_bookings = _wrap(db.get_pending_bookings)
+get_confirmed_bookings_for_reminders = _wrap(db.get_confirmed_bookings_for_reminders)
+get_upcoming_confirmed_bookings = _wrap(db.get_upcoming_confirmed_bookings)
+mark_reminder_sent = _wrap(db.mark_reminder_sent)
+add_to_waiting_list = _wrap(db.add_to_waiting_list)
+remove_from_waiting_list = _wrap(db.remove_from_waiting_list)
+get_waiting_list = _wrap(db.get_waiting_list)
+get_user_profile = _wrap(db.get_user_profile)
+save_user_profiles = _wrap(db.save_user_profiles)
+get_user_profile_stats = _wrap(db.get_user_profile_stats)
+get_notification_preferences = _wrap(db.get_notification_preferences)
+save_notification_preferences = _wrap(db.save_notification_preferences)
+get_persisted_data = _wrap(db.get_persisted_data)
+get_conversation_states = _wrap(db.get_conversation_states)
+save_persistence_batch = _wrap(db.save_persistence_batch)
+match_waiting_list = _wrap(db.match_waiting_list)
+get_availability = _wrap(db.get_availability)
+get_available_days_for_booking = _wrap(db.get_available_days_for_booking)
+get_available_time_slots_for_day = _wrap(db.get_available_time_slots_for_day)
@@ -0,0 +1,371 @@
+"""
+backup.py — نسخ احتياطي لقاعدة البيانات أثناء عمل البوت
+
+لقطات (snapshots): تُنسخ القاعدة بواجهة النسخ الاحتياطي في SQLite على خطوات من
+BACKUP_PAGES_PER_STEP صفحة مع توقف قصير بين الخطوات، فلا يُحجز قفل طويل على الحجوزات.
+تُضغط كل لقطة (gzip) في BACKUP_DIR ويُحتفظ بآخر BACKUP_KEEP لقطة فقط.
+
+شحن WAL (اختياري، BACKUP_WAL_SHIPPING=1): كل BACKUP_WAL_INTERVAL_SECONDS تُنسخ إطارات
+ملف WAL المؤكدة الجديدة إلى BACKUP_DIR/wal، فلا يضيع عند تعطل الخادم إلا ما كُتب بعد آخر شحنة.
+في هذا الوضع تُعطل نقاط التفتيش التلقائية (database.WAL_AUTOCHECKPOINT) ولا يجري التفتيش
+إلا من الشاحن وهو يحمل قفل الكتابة، حتى لا يُعاد استخدام ملف WAL قبل شحن كل إطاراته.
+كل إعادة بدء لملف WAL (salt جديد) تبدأ "جيلاً" جديداً من المقاطع، واسم كل لقطة يحمل
+الجيل الذي أُخذت خلاله؛ الاستعادة = اللقطة + إعادة تطبيق كل الأجيال من جيلها فصاعداً.
+
+الاستخدام (أوقف البوت قبل الاستعادة):
+    python backup.py snapshot
+    python backup.py list
+    python backup.py restore [ملف_اللقطة] [--db bookings.db] [--no-wal]
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import database as db
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INTERVAL = int(os.getenv("BACKUP_INTERVAL_SECONDS", 3600))  # 0 لتعطيل اللقطات الدورية
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", 24))
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", 256))
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", 0.005))
+WAL_SHIPPING = db.WAL_SHIPPING
+WAL_SHIP_INTERVAL = float(os.getenv("BACKUP_WAL_INTERVAL_SECONDS", 5))
+WAL_CHECKPOINT_BYTES = 4 << 20  # التفتيش (ونقل الإطارات إلى ملف القاعدة) بعد هذا الحجم من WAL
+
+SnapshotResult = namedtuple("SnapshotResult", ["path", "pages", "size", "seconds"])
+
+_SNAPSHOT_NAME = re.compile(r"^(?P<stem>.+)-(?P<stamp>\d{8}-\d{6})(?:-g(?P<generation>\d+))?\.db\.gz$")
+_SEGMENT_NAME = re.compile(r"^(?P<generation>\d{6})-(?P<offset>\d{12})\.wal\.gz$")
+
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+
+
+def _stem(db_path):
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+def _write_compressed(source, path):
+    """ضغط source (ملف أو bytes) إلى path بكتابة ذرية (ملف مؤقت ثم os.replace) مع fsync."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as out:
+        with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6) as gz:
+            if isinstance(source, bytes):
+                gz.write(source)
+            else:
+                shutil.copyfileobj(source, gz, 1 << 20)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, path)
+
+
+# === اللقطات ===
+def list_snapshots(backup_dir=None, db_path=None):
+    """اللقطات الموجودة من الأقدم للأحدث: [(المسار، الجيل أو None)]."""
+    backup_dir = backup_dir or BACKUP_DIR
+    stem = _stem(db_path or db.DB_PATH)
+    if not os.path.isdir(backup_dir):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(backup_dir)):
+        match = _SNAPSHOT_NAME.match(name)
+        if match and match["stem"] == stem:
+            generation = int(match["generation"]) if match["generation"] else None
+            snapshots.append((os.path.join(backup_dir, name), generation))
+    return snapshots
+
+
+def create_snapshot(db_path=None, backup_dir=None, keep=None, pages=None, sleep=None, generation=None):
+    """
+    لقطة متسقة للقاعدة أثناء عملها. generation: جيل WAL الحالي عند شحن WAL (يُكتب في اسم اللقطة).
+    إذا تغيرت القاعدة من اتصال آخر أثناء النسخ تعيد SQLite النسخ من البداية تلقائياً.
+    """
+    db_path = db_path or db.DB_PATH
+    backup_dir = backup_dir or BACKUP_DIR
+    keep = BACKUP_KEEP if keep is None else keep
+    pages = BACKUP_PAGES_PER_STEP if pages is None else pages
+    sleep = BACKUP_STEP_SLEEP if sleep is None else sleep
+    os.makedirs(backup_dir, exist_ok=True)
+
+    name = f"{_stem(db_path)}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    if generation is not None:
+        name += f"-g{generation:06d}"
+    path = os.path.join(backup_dir, f"{name}.db.gz")
+
+    start = time.perf_counter()
+    total_pages = 0
+
+    def progress(status, remaining, total):
+        nonlocal total_pages
+        total_pages = total
+
+    fd, raw_path = tempfile.mkstemp(suffix=".db", dir=backup_dir)
+    os.close(fd)
+    try:
+        source = sqlite3.connect(db_path, timeout=db.BUSY_TIMEOUT_MS / 1000)
+        dest = sqlite3.connect(raw_path)
+        try:
+            source.execute(f"PRAGMA wal_autocheckpoint={db.WAL_AUTOCHECKPOINT}")
+            source.backup(dest, pages=pages, progress=progress, sleep=sleep)
+        finally:
+            dest.close()
+            source.close()
+        with open(raw_path, "rb") as raw:
+            _write_compressed(raw, path)
+    finally:
+        os.remove(raw_path)
+
+    _rotate(backup_dir, db_path, keep)
+    return SnapshotResult(path, total_pages, os.path.getsize(path), time.perf_counter() - start)
+
+
+def _rotate(backup_dir, db_path, keep):
+    if keep <= 0:
+        return
+    snapshots = list_snapshots(backup_dir, db_path)
+    for path, _ in snapshots[:-keep]:
+        os.remove(path)
+        logger.info(f"Removed old snapshot {path}")
+
+    # مقاطع WAL الأقدم من جيل أقدم لقطة باقية لم تعد تلزم لأي استعادة
+    generations = [generation for _, generation in snapshots[-keep:] if generation is not None]
+    if generations:
+        for generation, segments in _wal_generations(os.path.join(backup_dir, "wal")):
+            if generation < min(generations):
+                for _, segment in segments:
+                    os.remove(segment)
+
+
+# === شحن WAL ===
+def _wal_generations(wal_dir, from_generation=0):
+    """[(الجيل، [(الإزاحة، المسار)...])] مرتبة، للأجيال >= from_generation."""
+    if not os.path.isdir(wal_dir):
+        return []
+    generations = {}
+    for name in os.listdir(wal_dir):
+        match = _SEGMENT_NAME.match(name)
+        if match and int(match["generation"]) >= from_generation:
+            generations.setdefault(int(match["generation"]), []).append(
+                (int(match["offset"]), os.path.join(wal_dir, name))
+            )
+    return [(generation, sorted(segments)) for generation, segments in sorted(generations.items())]
+
+
+class WalShipper:
+    """ينسخ إطارات WAL المؤكدة الجديدة إلى مقاطع مضغوطة: wal/<الجيل>-<الإزاحة>.wal.gz"""
+
+    def __init__(self, db_path=None, backup_dir=None, checkpoint_bytes=WAL_CHECKPOINT_BYTES):
+        self.db_path = db_path or db.DB_PATH
+        self.wal_path = f"{self.db_path}-wal"
+        self.wal_dir = os.path.join(backup_dir or BACKUP_DIR, "wal")
+        self.state_path = os.path.join(self.wal_dir, "state.json")
+        self.checkpoint_bytes = checkpoint_bytes
+        self._lock = threading.Lock()
+        self._writer = None
+        self._checkpointer = None
+        os.makedirs(self.wal_dir, exist_ok=True)
+        try:
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.state = {"generation": -1, "salt": None, "offset": 0}
+
+    @property
+    def generation(self):
+        with self._lock:
+            return max(self.state["generation"], 0)
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path, timeout=db.BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA wal_autocheckpoint=0")
+        return conn
+
+    def ship(self):
+        """شحن الإطارات الجديدة (ثم تفتيش إذا كبر WAL). يعيد عدد البايتات المشحونة."""
+        with self._lock:
+            if self._writer is None:
+                self._writer = self._connect()
+                self._checkpointer = self._connect()
+            # القراءة فقط تحت قفل الكتابة؛ الضغط والكتابة على القرص بعد تحريره
+            shipped = self._write_segment(self._read_locked())
+            if self.state["offset"] >= self.checkpoint_bytes:
+                # ما أُضيف منذ القراءة الأولى صغير، فيُشحن تحت القفل ثم يُفتش:
+                # لا يُعاد بدء WAL (salt جديد) إلا وكل إطاراته محفوظة في مقاطع
+                self._writer.execute("BEGIN IMMEDIATE")
+                try:
+                    shipped += self._write_segment(self._read_frames())
+                    self._checkpointer.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+                finally:
+                    self._writer.execute("ROLLBACK")
+            return shipped
+
+    def _read_locked(self):
+        # قفل الكتابة: لا يُكتب أي إطار أثناء القراءة، ولا يُعاد بدء WAL قبل انتهائها
+        self._writer.execute("BEGIN IMMEDIATE")
+        try:
+            return self._read_frames()
+        finally:
+            self._writer.execute("ROLLBACK")
+
+    def _read_frames(self):
+        """الإطارات المؤكدة منذ آخر شحنة: (الجيل، salt، الإزاحة، النهاية، البيانات) أو None."""
+        try:
+            wal = open(self.wal_path, "rb")
+        except FileNotFoundError:
+            return None
+        with wal:
+            header = wal.read(WAL_HEADER_SIZE)
+            if len(header) < WAL_HEADER_SIZE:
+                return None
+            page_size = struct.unpack(">I", header[8:12])[0]
+            salt = header[16:24]
+            generation, offset = self.state["generation"], self.state["offset"]
+            if salt.hex() != self.state["salt"]:
+                generation, offset = generation + 1, 0
+
+            # نهاية آخر إطار commit بنفس salt (ما بعده إطارات قديمة من جيل سابق أو معاملة لم تكتمل)
+            position = end = max(offset, WAL_HEADER_SIZE)
+            wal.seek(position)
+            while True:
+                frame_header = wal.read(WAL_FRAME_HEADER_SIZE)
+                if len(frame_header) < WAL_FRAME_HEADER_SIZE or frame_header[8:16] != salt:
+                    break
+                if len(wal.read(page_size)) < page_size:
+                    break
+                position += WAL_FRAME_HEADER_SIZE + page_size
+                if struct.unpack(">I", frame_header[4:8])[0]:
+                    end = position
+            if end <= max(offset, WAL_HEADER_SIZE):
+                return None
+            wal.seek(offset)
+            return generation, salt.hex(), offset, end, wal.read(end - offset)
+
+    def _write_segment(self, frames):
+        if frames is None:
+            return 0
+        generation, salt, offset, end, data = frames
+        segment = os.path.join(self.wal_dir, f"{generation:06d}-{offset:012d}.wal.gz")
+        _write_compressed(data, segment)
+        # الحالة تُحفظ بعد المقطع: عند التعطل بينهما يُعاد شحن نفس الإطارات بنفس الاسم
+        self.state = {"generation": generation, "salt": salt, "offset": end}
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+        return len(data)
+
+    def close(self):
+        with self._lock:
+            for conn in (self._writer, self._checkpointer):
+                if conn is not None:
+                    conn.close()
+            self._writer = self._checkpointer = None
+
+
+# === الاستعادة ===
+def _replay_wal(work_path, wal_dir, from_generation):
+    """تطبيق أجيال WAL المشحونة على نسخة العمل بالترتيب. يعيد عدد المقاطع المطبقة."""
+    applied = 0
+    for generation, segments in _wal_generations(wal_dir, from_generation):
+        expected = 0
+        with open(f"{work_path}-wal", "wb") as wal:
+            for offset, segment in segments:
+                if offset != expected:
+                    logger.warning(f"WAL generation {generation} has a gap at {expected}, replaying up to it")
+                    break
+                with gzip.open(segment, "rb") as data:
+                    shutil.copyfileobj(data, wal)
+                expected = wal.tell()
+                applied += 1
+        # SQLite تستعيد إطارات WAL الصالحة عند الفتح، ثم ينقلها التفتيش إلى ملف القاعدة
+        conn = sqlite3.connect(work_path)
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        finally:
+            conn.close()
+    return applied
+
+
+def restore_snapshot(snapshot=None, db_path=None, backup_dir=None, replay_wal=True):
+    """
+    استعادة لقطة (الأحدث افتراضياً) مع مقاطع WAL اللاحقة لها إلى db_path.
+    يجب إيقاف البوت قبل الاستعادة. يعيد (مسار اللقطة، عدد مقاطع WAL المطبقة).
+    """
+    db_path = db_path or db.DB_PATH
+    backup_dir = backup_dir or BACKUP_DIR
+    snapshots = list_snapshots(backup_dir, db_path)
+    if snapshot is None:
+        if not snapshots:
+            raise FileNotFoundError(f"No snapshots of {db_path} in {backup_dir}")
+        snapshot, generation = snapshots[-1]
+    else:
+        match = _SNAPSHOT_NAME.match(os.path.basename(snapshot))
+        generation = int(match["generation"]) if match and match["generation"] else None
+
+    with tempfile.TemporaryDirectory(dir=backup_dir) as tmp:
+        work_path = os.path.join(tmp, "restore.db")
+        with gzip.open(snapshot, "rb") as data, open(work_path, "wb") as work:
+            shutil.copyfileobj(data, work, 1 << 20)
+
+        applied = 0
+        if replay_wal and generation is not None:
+            applied = _replay_wal(work_path, os.path.join(backup_dir, "wal"), generation)
+
+        source = sqlite3.connect(work_path)
+        try:
+            result = source.execute("PRAGMA integrity_check").fetchone()[0]
+            if result != "ok":
+                raise sqlite3.DatabaseError(f"Restored database failed integrity check: {result}")
+            dest = sqlite3.connect(db_path)
+            try:
+                source.backup(dest)
+            finally:
+                dest.close()
+        finally:
+            source.close()
+    return snapshot, applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backup and restore bookings.db")
+    parser.add_argument("--db", default=db.DB_PATH, help="database file")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="backup directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("snapshot", help="take a snapshot now")
+    commands.add_parser("list", help="list snapshots")
+    restore = commands.add_parser("restore", help="restore a snapshot (stop the bot first)")
+    restore.add_argument("snapshot", nargs="?", help="snapshot file (default: latest)")
+    restore.add_argument("--no-wal", action="store_true", help="do not replay shipped WAL segments")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.command == "snapshot":
+        result = create_snapshot(args.db, args.dir)
+        print(f"{result.path}: {result.pages} pages, {result.size / 1024:.1f} KiB, {result.seconds:.2f}s")
+    elif args.command == "list":
+        for path, generation in list_snapshots(args.dir, args.db):
+            suffix = f"  (WAL generation {generation})" if generation is not None else ""
+            print(f"{path}  {os.path.getsize(path) / 1024:.1f} KiB{suffix}")
+    else:
+        snapshot, applied = restore_snapshot(args.snapshot, args.db, args.dir, replay_wal=not args.no_wal)
+        print(f"Restored {args.db} from {snapshot} (+{applied} WAL segments)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+قياس إنتاجية التحديثات مع 200 مستخدم متزامن: استدعاء database.py مباشرة
+داخل async (قبل) مقابل async_database عبر خيط قاعدة البيانات (بعد).
+
+كل "تحديث" يحاكي معالجاً حقيقياً: استعلام/كتابة في قاعدة البيانات ثم
+رد عبر شبكة Telegram (محاكى بـ asyncio.sleep).
+
+الاستخدام:
+    python benchmarks/bench_async_db.py [--users 200] [--rounds 5]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="amal-bench-"), "bench.db")
+
+import database as db  # noqa: E402
+import async_database as adb  # noqa: E402
+
+NETWORK_DELAY = 0.02  # زمن الرد من Telegram
+FIRST_USER_ID = 1000
+SERVICE = "تصوير بانورامي"
+FIRST_DAY = datetime.now().date() + timedelta(days=1)
+
+
+def user_slot(user_id):
+    """موعد مختلف لكل مستخدم (يوم ووحدة) حتى لا يرفع create_booking الخطأ SlotTakenError."""
+    index = user_id - FIRST_USER_ID
+    day = FIRST_DAY + timedelta(days=index // db.START_TICKS)
+    tick = index % db.START_TICKS
+    return day, (db.WEEKDAY_NAMES[day.weekday()], db.TICK_LABELS[tick], day.strftime("%d/%m/%Y"),
+                 "عادي", db.tick_datetime(day, tick))
+
+
+async def sync_update(user_id, step):
+    day, slot = user_slot(user_id)
+    if step == 0:
+        db.get_available_time_slots_for_day(day, user_id, SERVICE)
+    elif step == 1:
+        db.create_booking(user_id, f"user {user_id}", "0590000000", SERVICE, *slot)
+    else:
+        db.get_booking(user_id)
+    await asyncio.sleep(NETWORK_DELAY)
+
+
+async def async_update(user_id, step):
+    day, slot = user_slot(user_id)
+    if step == 0:
+        await adb.get_available_time_slots_for_day(day, user_id, SERVICE)
+    elif step == 1:
+        await adb.create_booking(user_id, f"user {user_id}", "0590000000", SERVICE, *slot)
+    else:
+        await adb.get_booking(user_id)
+    await asyncio.sleep(NETWORK_DELAY)
+
+
+async def heartbeat(stop, stalls):
+    """يقيس أطول توقف لحلقة الأحداث أثناء الحمل."""
+    interval = 0.005
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - start - interval)
+
+
+async def run(handler, users, rounds):
+    stop = asyncio.Event()
+    stalls = []
+    beat = asyncio.create_task(heartbeat(stop, stalls))
+
+    async def user_flow(user_id):
+        for _ in range(rounds):
+            for step in range(3):
+                await handler(user_id, step)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user_flow(FIRST_USER_ID + i) for i in range(users)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    updates = users * rounds * 3
+    return updates / elapsed, max(stalls, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    db.init_database()
+    for label, handler in (("sync (before)", sync_update), ("async (after)", async_update)):
+        rate, stall = asyncio.run(run(handler, args.users, args.rounds))
+        print(f"{label:15s} {rate:10.1f} updates/s   max loop stall {stall * 1000:8.2f} ms")
+    adb.shutdown()
+
+
+if __name__ == "__main__":
+    main()
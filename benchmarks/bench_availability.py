@@ -0,0 +1,104 @@
+"""
+مقارنة عدد الاستعلامات وزمن حساب توفر المواعيد لأسبوع كامل:
+الحلقة القديمة (استعلام COUNT واتصال جديد لكل موعد) مقابل get_availability.
+
+الاستخدام:
+    python benchmarks/bench_availability.py [--bookings 5000] [--repeat 50]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="amal-bench-"), "bench.db")
+
+import database as db  # noqa: E402
+
+queries = 0
+
+
+def count_query(statement):
+    global queries
+    if statement.lstrip().upper().startswith("SELECT"):
+        queries += 1
+
+
+def legacy_connect():
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.set_trace_callback(count_query)
+    return conn
+
+
+def legacy_week():
+    """الطريقة القديمة: 7 أيام × 12 موعد، كل موعد باتصال واستعلام مستقلين."""
+    result = {}
+    for i in range(db.BOOKING_HORIZON_DAYS):
+        day_name = db.WEEKDAY_NAMES[(datetime.now() + timedelta(days=i)).weekday()]
+        free = []
+        for slot in db.TIME_SLOTS:
+            conn = legacy_connect()
+            count = conn.execute("""
+                SELECT COUNT(*) FROM bookings
+                WHERE day = ? AND time = ? AND status NOT IN ('لم يحضر', 'ملغي', 'تم التصوير')
+            """, (day_name, slot)).fetchone()[0]
+            conn.close()
+            if count == 0:
+                free.append(slot)
+        result[day_name] = free
+    return result
+
+
+def engine_week():
+    today = datetime.now().date()
+    return db.get_availability(today, today + timedelta(days=db.BOOKING_HORIZON_DAYS - 1))
+
+
+def populate(count):
+    rng = random.Random(42)
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=365)
+    for user_id in range(1, count + 1):
+        appointment = start + timedelta(days=rng.randrange(372))
+        appointment = appointment.replace(hour=rng.choice(db.SLOT_HOURS))
+        slot = db.TIME_SLOTS[db.SLOT_HOURS.index(appointment.hour)]
+        try:
+            db.create_booking(user_id, f"user {user_id}", "0590000000", "تصوير بانورامي",
+                              db.WEEKDAY_NAMES[appointment.weekday()], slot,
+                              appointment.strftime("%d/%m/%Y"), "عادي", appointment)
+        except db.SlotTakenError:
+            pass
+
+
+def measure(label, func, repeat):
+    global queries
+    queries = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:8s} {queries / repeat:6.0f} queries/week   {elapsed * 1000:8.3f} ms/week")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    db.init_database()
+    populate(args.bookings)
+    with db.get_db_connection() as conn:
+        conn.set_trace_callback(count_query)
+
+    measure("legacy", legacy_week, args.repeat)
+    measure("engine", engine_week, args.repeat)
+    db.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
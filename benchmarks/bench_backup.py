@@ -0,0 +1,183 @@
+"""
+كلفة النسخ الاحتياطي على البوت أثناء عمله:
+
+    - زمن اللقطة (create_snapshot) وحجمها لعدة قيم pages-per-step، مع وبدون كتابات متزامنة
+    - زمن الكتابة (update_booking_status من خيط آخر، p50/p99) بدون نسخ، وأثناء اللقطات،
+      وأثناء نسخ بخطوة واحدة (pages=-1، الطريقة البسيطة)، ومع شحن WAL كل --ship-interval
+    - كلفة كل استدعاء WalShipper.ship وحجم ما يشحنه
+    - استعادة آخر لقطة مع WAL المشحون ومطابقتها للقاعدة الحية
+
+الاستخدام:
+    python benchmarks/bench_backup.py [--bookings 20000] [--seconds 3] [--ship-interval 0.1]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="amal-bench-"), "bench.db")
+
+import backup  # noqa: E402
+import database as db  # noqa: E402
+
+SERVICES = ["تصوير بانورامي", "تصوير سيفالومتري", "تصوير مقطعي CBCT", "تصوير ذرّي"]
+STATUSES = ["قيد الانتظار", "مؤكد", "تم التصوير", "لم يحضر"]
+
+
+def populate(count):
+    rng = random.Random(42)
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=730)
+    users = []
+    for user_id in range(1, count + 1):
+        appointment = start + timedelta(days=rng.randrange(737), hours=rng.choice(db.SLOT_HOURS))
+        slot = db.TIME_SLOTS[db.SLOT_HOURS.index(appointment.hour)]
+        try:
+            db.create_booking(user_id, f"user {user_id}", "0590000000", rng.choice(SERVICES),
+                              db.WEEKDAY_NAMES[appointment.weekday()], slot,
+                              appointment.strftime("%d/%m/%Y"), "عادي", appointment)
+        except db.SlotTakenError:
+            continue
+        users.append(user_id)
+    return users
+
+
+def legacy_backup(path):
+    """نسخ بخطوة واحدة: معاملة قراءة واحدة تغطي القاعدة كلها، بدون ضغط أو تدوير."""
+    source = sqlite3.connect(db.DB_PATH)
+    dest = sqlite3.connect(path)
+    try:
+        source.backup(dest)
+    finally:
+        dest.close()
+        source.close()
+
+
+class Writer(threading.Thread):
+    """كتابات متتالية (تغيير حالة حجز) مع تسجيل زمن كل كتابة."""
+
+    def __init__(self, users, pause):
+        super().__init__(daemon=True)
+        self.users = users
+        self.pause = pause
+        self.latencies = []
+        self.stop = threading.Event()
+
+    def run(self):
+        rng = random.Random(7)
+        while not self.stop.is_set():
+            start = time.perf_counter()
+            db.update_booking_status(rng.choice(self.users), rng.choice(STATUSES))
+            self.latencies.append(time.perf_counter() - start)
+            time.sleep(self.pause)
+        db.close_all_connections()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def with_writer(users, pause, seconds, work):
+    """تشغيل work في حلقة حتى انتهاء المدة بينما يكتب Writer، وإعادة أزمنة الكتابة ونتائج work."""
+    writer = Writer(users, pause)
+    writer.start()
+    results = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        results.append(work())
+    writer.stop.set()
+    writer.join()
+    return writer.latencies, [r for r in results if r is not None]
+
+
+def report_writes(label, latencies):
+    print(f"{label:28s} writes {len(latencies):6d}   "
+          f"p50 {percentile(latencies, 0.50) * 1e3:7.3f} ms   p99 {percentile(latencies, 0.99) * 1e3:7.3f} ms   "
+          f"max {max(latencies) * 1e3:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=20000)
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of each concurrent-write run")
+    parser.add_argument("--write-pause", type=float, default=0.001, help="pause between writes in seconds")
+    parser.add_argument("--ship-interval", type=float, default=0.1)
+    args = parser.parse_args()
+
+    workdir = os.path.dirname(db.DB_PATH)
+    db.init_database()
+    users = populate(args.bookings)
+    db.close_all_connections()
+    print(f"database: {len(users)} bookings, {os.path.getsize(db.DB_PATH) / 1e6:.1f} MB")
+
+    # === زمن اللقطة ===
+    for pages in (-1, 64, 256, 1024):
+        snapshot_dir = os.path.join(workdir, f"snapshots-{pages}")
+        result = backup.create_snapshot(backup_dir=snapshot_dir, pages=pages)
+        print(f"snapshot pages={pages:5d} idle        {result.seconds * 1e3:8.1f} ms   "
+              f"{result.pages} pages -> {result.size / 1e6:.2f} MB gz")
+        _, results = with_writer(users, args.write_pause, args.seconds,
+                                 lambda: backup.create_snapshot(backup_dir=snapshot_dir, pages=pages))
+        seconds = [r.seconds for r in results]
+        print(f"snapshot pages={pages:5d} under writes {sum(seconds) / len(seconds) * 1e3:8.1f} ms avg   "
+              f"{len(seconds)} snapshots")
+
+    # === زمن الكتابة ===
+    report_writes("writes, no backup", with_writer(users, args.write_pause, args.seconds, lambda: time.sleep(0.01))[0])
+    report_writes("writes, one-step backup", with_writer(
+        users, args.write_pause, args.seconds, lambda: legacy_backup(os.path.join(workdir, "legacy.db")))[0])
+    for pages in (64, 256):
+        snapshot_dir = os.path.join(workdir, f"snapshots-{pages}")
+        report_writes(f"writes, snapshots pages={pages}", with_writer(
+            users, args.write_pause, args.seconds, lambda: backup.create_snapshot(backup_dir=snapshot_dir, pages=pages))[0])
+
+    # === شحن WAL (التفتيش التلقائي معطل كما في BACKUP_WAL_SHIPPING=1) ===
+    db.close_all_connections()
+    db.WAL_AUTOCHECKPOINT = 0
+    ship_dir = os.path.join(workdir, "shipping")
+    shipper = backup.WalShipper(backup_dir=ship_dir)
+    shipper.ship()
+    base = backup.create_snapshot(backup_dir=ship_dir, generation=shipper.generation)
+    ship_times = []
+    shipped = []
+
+    def ship():
+        start = time.perf_counter()
+        shipped.append(shipper.ship())
+        ship_times.append(time.perf_counter() - start)
+        time.sleep(args.ship_interval)
+
+    latencies, _ = with_writer(users, args.write_pause, args.seconds, ship)
+    report_writes(f"writes, shipping every {args.ship_interval}s", latencies)
+    shipper.ship()
+    print(f"ship: {len(ship_times)} calls   p50 {percentile(ship_times, 0.5) * 1e3:.3f} ms   "
+          f"p99 {percentile(ship_times, 0.99) * 1e3:.3f} ms   "
+          f"{sum(shipped) / 1e6:.1f} MB shipped, generation {shipper.generation}")
+
+    restored = os.path.join(workdir, "restored.db")
+    start = time.perf_counter()
+    _, applied = backup.restore_snapshot(base.path, db_path=restored, backup_dir=ship_dir)
+    print(f"restore: {applied} WAL segments in {(time.perf_counter() - start) * 1e3:.1f} ms")
+    shipper.close()
+
+    query = "SELECT id, status, updated_at FROM bookings ORDER BY id"
+    with db.get_db_connection() as conn:
+        live = [tuple(row) for row in conn.execute(query)]
+    check = sqlite3.connect(restored)
+    copy = check.execute(query).fetchall()
+    check.close()
+    db.close_all_connections()
+    if live != copy:
+        sys.exit("Restored database differs from the live database")
+    print("restored database matches the live database")
+
+
+if __name__ == "__main__":
+    main()
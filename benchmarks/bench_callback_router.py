@@ -0,0 +1,173 @@
+"""
+قياس زمن توجيه كل قيم callback_data الحالية: سلسلة if/elif القديمة في
+button_handler مقابل CallbackRouter (قاموس للمفاتيح الثابتة + trie للبادئات).
+
+يقيس التوجيه وتحليل المعاملات فقط، بدون تنفيذ المعالجات.
+
+الاستخدام:
+    python benchmarks/bench_callback_router.py [--iterations 20000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="amal-bench-"), "bench.db")
+
+import bot  # noqa: E402
+
+CALLBACK_DATA = [
+    'book', 'admin_menu', 'admin_view', 'admin_pending', 'admin_stats', 'admin_ratings',
+    'admin_waiting_list', 'admin_user_data', 'admin_filters', 'admin_page_filtered',
+    'admin_page_n_20261018085309_42', 'admin_page_p_20261018085309_41',
+    *(f'admin_filter_status_{code}' for code in bot.STATUS_CODES),
+    'admin_filter_date_0', 'admin_filter_date_1',
+    *(f'admin_filter_service_{i}' for i in range(len(bot.SERVICES))),
+    'admin_edit_7855827103', 'admin_confirm_delete_7855827103', 'admin_delete_7855827103',
+    'admin_confirm_7855827103', 'admin_set_done_7855827103', 'admin_set_absent_7855827103',
+    *(bot.encode_service(index) for index in range(len(bot.SERVICES))),
+    'type_normal', 'type_emergency',
+    *(f'rate_{stars}' for stars in range(1, 6)),
+    'faq_menu', *(f'faq_{key}' for key in bot.faq_manager.faq_data),
+    'user_preferences', 'toggle_morning', 'toggle_evening', 'toggle_weather', 'toggle_promotions',
+    'use_saved_data', 'update_data', 'join_waiting_list', 'about_center', 'video',
+    'before_imaging', 'location', 'my_bookings', 'cancel_my_booking',
+    'confirm_cancel_my_booking', 'back',
+]
+
+# نفس الأزرار بصيغتها القديمة (اسم الخدمة بالعربية داخل callback_data)
+LEGACY_CALLBACK_DATA = [
+    f'service_{bot.decode_service(data)}' if data.startswith(bot.SERVICE_TOKEN) else data
+    for data in CALLBACK_DATA
+]
+
+
+def legacy_route(data):
+    """نسخة من سلسلة if/elif السابقة، تعيد اسم المسار والمعاملات كما كانت تُحلل داخل المعالجات."""
+    if data == 'book':
+        return 'book', ()
+    elif data == 'admin_menu':
+        return 'admin_menu', ()
+    elif data == 'admin_view':
+        return 'admin_view', ()
+    elif data == 'admin_pending':
+        return 'admin_pending', ()
+    elif data == 'admin_stats':
+        return 'admin_stats', ()
+    elif data == 'admin_ratings':
+        return 'admin_ratings', ()
+    elif data == 'admin_waiting_list':
+        return 'admin_waiting_list', ()
+    elif data == 'admin_user_data':
+        return 'admin_user_data', ()
+    elif data == 'admin_filters':
+        return 'admin_filters', ()
+    elif data == 'admin_page_filtered':
+        return 'admin_page_filtered', ()
+    elif data.startswith('admin_page_'):
+        _, _, direction, token = data.split("_", 3)
+        return 'admin_page', (direction, bot._decode_page_key(token))
+    elif data.startswith('admin_filter_'):
+        _, _, kind, code = data.split("_", 3)
+        if kind == "status":
+            value = bot.STATUS_CODES[code]
+        elif kind == "date":
+            value = (bot.datetime.now().date() + bot.timedelta(days=int(code))).strftime("%d/%m/%Y")
+        else:
+            value = bot.SERVICES[int(code)][0]
+        return 'admin_filter', (kind, value)
+    elif data.startswith('admin_edit_'):
+        return 'admin_edit', (int(data.split("_")[-1]),)
+    elif data.startswith('admin_confirm_delete_'):
+        return 'admin_confirm_delete', (data.split("_")[-1],)
+    elif data.startswith('admin_delete_'):
+        return 'admin_delete', (int(data.split("_")[-1]),)
+    elif data.startswith('admin_confirm_'):
+        return 'admin_confirm', (int(data.split("_")[-1]),)
+    elif data.startswith('admin_set_done_'):
+        return 'admin_set_done', (int(data.split("_")[-1]),)
+    elif data.startswith('admin_set_absent_'):
+        return 'admin_set_absent', (int(data.split("_")[-1]),)
+    elif data.startswith('service_'):
+        return 'service', ()
+    elif data.startswith('type_'):
+        return 'type', ()
+    elif data.startswith('rate_'):
+        return 'rate', ()
+    elif data == 'faq_menu':
+        return 'faq_menu', ()
+    elif data.startswith('faq_'):
+        return 'faq', ()
+    elif data == 'user_preferences':
+        return 'user_preferences', ()
+    elif data.startswith('toggle_'):
+        return 'toggle', ()
+    elif data == 'use_saved_data':
+        return 'use_saved_data', ()
+    elif data == 'update_data':
+        return 'update_data', ()
+    elif data == 'join_waiting_list':
+        return 'join_waiting_list', ()
+    elif data == 'about_center':
+        return 'about_center', ()
+    elif data == 'video':
+        return 'video', ()
+    elif data == 'before_imaging':
+        return 'before_imaging', ()
+    elif data == 'location':
+        return 'location', ()
+    elif data == 'my_bookings':
+        return 'my_bookings', ()
+    elif data == 'cancel_my_booking':
+        return 'cancel_my_booking', ()
+    elif data == 'confirm_cancel_my_booking':
+        return 'confirm_cancel_my_booking', ()
+    elif data == 'back':
+        return 'back', ()
+    return None, ()
+
+
+def measure(label, route, callback_data, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for data in callback_data:
+            route(data)
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / (iterations * len(callback_data))
+    worst, worst_data = worst_case(route, callback_data)
+    print(f"{label:8s} {per_call * 1e9:8.0f} ns/callback   (worst: {worst * 1e9:8.0f} ns, {worst_data})")
+
+
+def worst_case(route, callback_data, repeat=2000, rounds=5):
+    """أبطأ قيمة: لكل قيمة أقل زمن من عدة جولات (كما في timeit) حتى لا يحسم الضجيج النتيجة."""
+    times = {}
+    for _ in range(rounds):
+        for data in callback_data:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                route(data)
+            elapsed = (time.perf_counter() - start) / repeat
+            times[data] = min(times.get(data, elapsed), elapsed)
+    worst_data = max(times, key=times.get)
+    return times[worst_data], worst_data
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    unrouted = [data for data in CALLBACK_DATA if bot.callback_router.resolve(data)[0] is None]
+    if unrouted:
+        sys.exit(f"Callback data without a route: {unrouted}")
+
+    print(f"{len(CALLBACK_DATA)} callback_data values")
+    measure("legacy", legacy_route, LEGACY_CALLBACK_DATA, args.iterations)
+    measure("router", bot.callback_router.resolve, CALLBACK_DATA, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+سعة المركز اليومية: النموذج القديم (موعد واحد لكل ساعة في المركز كله) مقابل نموذج
+الأجهزة والوحدات (database.SERVICE_PROFILES على DEVICES بوحدات TICK_MINUTES دقيقة).
+
+يحاكي مرضى بمزيج خدمات واقعي يطلب كل منهم أقرب وقت بعد ساعة يفضلها في أحد أيام الأسبوع،
+ويطبع عدد الحجوزات المقبولة في اليوم ونسبة إشغال كل جهاز، ثم زمن حساب التوفر لأسبوع
+ومطابقة قائمة الانتظار على التقويم الممتلئ جزئياً.
+
+الاستخدام:
+    python benchmarks/bench_capacity.py [--requests 1500] [--waiters 2000] [--repeat 50]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="amal-bench-"), "bench.db")
+
+import database as db  # noqa: E402
+
+SERVICE_MIX = (
+    ("تصوير بانورامي", 0.50),
+    ("تصوير CBCT ثلاثي الأبعاد", 0.25),
+    ("تصوير الجيوب الأنفية", 0.10),
+    ("تصوير مفصل الفك", 0.10),
+    ("غير متأكد", 0.05),
+)
+
+
+def requests(count, seed):
+    rng = random.Random(seed)
+    services, weights = zip(*SERVICE_MIX)
+    first_day = datetime.now().date() + timedelta(days=1)
+    for user_id in range(1, count + 1):
+        day = first_day + timedelta(days=rng.randrange(db.BOOKING_HORIZON_DAYS - 1))
+        yield user_id, rng.choices(services, weights)[0], day, rng.randrange(len(db.SLOT_HOURS))
+
+
+def legacy_capacity(count, seed):
+    """النموذج القديم: 12 موعداً بالساعة لكل يوم، أي خدمة تشغل الساعة كاملة."""
+    taken = set()
+    accepted = 0
+    for _, _, day, hour in requests(count, seed):
+        free = [i for i in range(len(db.TIME_SLOTS)) if (day, i) not in taken]
+        later = [i for i in free if i >= hour] or free
+        if later:
+            taken.add((day, later[0]))
+            accepted += 1
+    return accepted
+
+
+def device_capacity(count, seed):
+    """نفس الطلبات عبر get_available_time_slots_for_day و create_booking."""
+    accepted = 0
+    for user_id, service, day, hour in requests(count, seed):
+        slots = db.get_available_time_slots_for_day(day, user_id, service)
+        if not slots:
+            continue
+        later = [slot for slot in slots if db.TICK_INDEX[slot] >= hour * db.TICKS_PER_HOUR] or slots
+        db.create_booking(user_id, f"user {user_id}", "0590000000", service, db.WEEKDAY_NAMES[day.weekday()],
+                          later[0], day.strftime("%d/%m/%Y"), "عادي", db.tick_datetime(day, db.TICK_INDEX[later[0]]))
+        accepted += 1
+    return accepted
+
+
+def utilisation(days):
+    with db.get_db_connection() as conn:
+        rows = conn.execute("SELECT device, COUNT(*) FROM slot_calendar GROUP BY device").fetchall()
+    return {device: ticks / (days * db.DAY_TICKS) for device, ticks in rows}
+
+
+def measure(label, func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    print(f"{label:34s} {(time.perf_counter() - start) / repeat * 1000:8.3f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1500)
+    parser.add_argument("--waiters", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    db.init_database()
+    days = db.BOOKING_HORIZON_DAYS - 1
+    legacy = legacy_capacity(args.requests, args.seed)
+    start = time.perf_counter()
+    accepted = device_capacity(args.requests, args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"{args.requests} requests over {days} days")
+    print(f"hourly slots:     {legacy:5d} accepted   {legacy / days:5.1f} bookings/day")
+    print(f"devices + ticks:  {accepted:5d} accepted   {accepted / days:5.1f} bookings/day   "
+          f"({elapsed / args.requests * 1000:.2f} ms per availability + booking)")
+    print("device utilisation: " + ", ".join(f"{device} {share:.0%}" for device, share in sorted(utilisation(days).items())))
+
+    # أسبوع مزدحم جزئياً: نصف الحجوزات تُلغى حتى يبقى للمنتظرين مكان
+    with db.get_db_connection() as conn:
+        conn.execute("DELETE FROM slot_calendar WHERE user_id % 2 = 0")
+    today = datetime.now().date()
+    week = (today, today + timedelta(days=db.BOOKING_HORIZON_DAYS - 1))
+    for service, _ in SERVICE_MIX[:2]:
+        measure(f"get_availability week ({service[:12]})", lambda: db.get_availability(*week, service=service), args.repeat)
+
+    rng = random.Random(args.seed)
+    services, weights = zip(*SERVICE_MIX)
+    for user_id in range(1, args.waiters + 1):
+        db.add_to_waiting_list(100000 + user_id, f"waiter {user_id}", "0590000000", rng.choices(services, weights)[0],
+                               today, today + timedelta(days=db.WAITING_LIST_WINDOW_DAYS - 1))
+    offers = measure(f"match_waiting_list ({args.waiters} waiters)", lambda: db.match_waiting_list(*week),
+                     max(1, args.repeat // 10))
+    print(f"waiting-list offers: {len(offers)}")
+    db.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
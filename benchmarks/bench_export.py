@@ -0,0 +1,130 @@
+"""
+ذاكرة /export من القراءة حتى انتهاء الرفع: export.write_export ثم send_document إلى خادم
+Bot API محلي يقرأ الطلب على أجزاء ويتجاهله.
+
+يقارن إرسال الملف المؤقت مباشرة (PTB يلفه في InputFile الذي يقرأ الملف كاملاً بـ read())
+مع InputFile(..., read_file_handle=False) كما في bot.export_command، حيث يرفع httpx من
+المقبض على أجزاء. يطبع أعلى ذاكرة متتبعة (tracemalloc) لكل مرحلة وحجم ما وصل للخادم.
+
+الاستخدام:
+    python benchmarks/bench_export.py [--bookings 200000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="amal-bench-"), "bench.db")
+
+from telegram import Bot, InputFile  # noqa: E402
+
+import database as db  # noqa: E402
+import export  # noqa: E402
+
+TOKEN = "123456:EXPORT"
+CHUNK = 1 << 16
+
+
+class DrainHandler(BaseHTTPRequestHandler):
+    """يقرأ جسم الطلب (Content-Length أو chunked) على أجزاء دون الاحتفاظ به."""
+    protocol_version = "HTTP/1.1"
+    received = 0
+
+    def _drain(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                self._read(size)
+                self.rfile.readline()
+                if size == 0:
+                    return
+        self._read(int(self.headers.get("Content-Length", 0)))
+
+    def _read(self, size):
+        while size:
+            data = self.rfile.read(min(CHUNK, size))
+            size -= len(data)
+            DrainHandler.received += len(data)
+
+    def do_POST(self):
+        self._drain()
+        if self.path.endswith("/getMe"):
+            result = '{"id": 123456, "is_bot": true, "first_name": "Amal", "username": "amal_bench_bot"}'
+        else:
+            result = '{"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}}'
+        body = f'{{"ok": true, "result": {result}}}'.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def populate(count):
+    rng = random.Random(42)
+    rows = [(booking_id, booking_id, f"مريض رقم {booking_id}", f"059{rng.randrange(10 ** 7):07d}", "تصوير بانورامي",
+             "الاثنين", db.TIME_SLOTS[0], "01/01/2026", "عادي", "تم التصوير", 0)
+            for booking_id in range(1, count + 1)]
+    with db.get_db_connection() as conn:
+        conn.executemany("""
+            INSERT INTO bookings (id, user_id, name, phone, service, day, time, date, type, status, is_current)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+
+async def send(bot, streaming):
+    tracemalloc.start()
+    start = time.perf_counter()
+    spool, count, filename = await asyncio.to_thread(export.write_export, "bookings")
+    _, write_peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    with spool:
+        size = spool.seek(0, os.SEEK_END)
+        spool.seek(0)
+        DrainHandler.received = 0
+        document = InputFile(spool, filename=filename, read_file_handle=False) if streaming else spool
+        await bot.send_document(1, document=document, filename=None if streaming else filename,
+                                read_timeout=120, write_timeout=120)
+    _, send_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    label = "InputFile(read_file_handle=False)" if streaming else "spool passed directly"
+    print(f"{label:34s} {count} rows, {size / 1e6:5.1f} MB   write_export peak {write_peak / 1e6:5.1f} MB   "
+          f"send peak {send_peak / 1e6:6.1f} MB   received {DrainHandler.received / 1e6:5.1f} MB   "
+          f"{time.perf_counter() - start:.2f}s")
+
+
+async def run(args):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DrainHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    bot = Bot(TOKEN, base_url=f"http://127.0.0.1:{server.server_address[1]}/bot")
+    async with bot:
+        for streaming in (False, True):
+            await send(bot, streaming)
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=200000)
+    args = parser.parse_args()
+
+    db.init_database()
+    populate(args.bookings)
+    asyncio.run(run(args))
+    db.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
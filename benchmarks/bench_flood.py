@@ -0,0 +1,180 @@
+"""
+أثر الإغراق على المرضى: مستخدمون مسيئون يكررون /start ويضغطون الأزرار بأقصى سرعة بينما
+يحجز مرضى عاديون، مع الحد من الإغراق (flood_control) وبدونه (السلوك السابق).
+
+يستخدم نفس Application الحقيقي وخادم Bot API الوهمي من bench_load.py، ويطبع لكل حالة
+زمن استجابة تحديثات المرضى (p50/p99) وعدد الحجوزات المحفوظة، وكم من تحديثات المسيئين
+وصلت إلى المعالجات، واستدعاءات قاعدة البيانات وطلبات Bot API، ثم كلفة الفحص لكل تحديث.
+
+الاستخدام:
+    python benchmarks/bench_flood.py [--patients 100] [--abusers 5] [--abuse-rate 200] [--seconds 5]
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="amal-bench-"), "bench.db")
+
+from telegram import Update  # noqa: E402
+from telegram.ext import TypeHandler  # noqa: E402
+
+import async_database as adb  # noqa: E402
+import bench_load  # noqa: E402  (يعطل الحد العام FLOOD_GLOBAL_RATE؛ هنا نقيس حد كل مستخدم)
+import bot  # noqa: E402
+import database as db  # noqa: E402
+import flood_control  # noqa: E402
+import metrics  # noqa: E402
+
+ABUSE_STEPS = (("command", "/start"), ("callback", "book"), ("callback", "faq_menu"), ("callback", "back"))
+PATIENT_TIMEOUT = 10
+
+
+class CommandUpdateFactory(bench_load.UpdateFactory):
+    def command(self, user_id, text):
+        # CommandHandler يطابق الرسائل التي تحمل كيان bot_command فقط
+        update = self.text(user_id, text).to_dict()
+        update["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        return Update.de_json(update, self.bot)
+
+    def make(self, user_id, kind, payload):
+        return getattr(self, kind)(user_id, payload)
+
+
+class FloodTest(bench_load.LoadTest):
+    def __init__(self, application, rate):
+        super().__init__(application, rate)
+        self.factory = CommandUpdateFactory(application)
+        self.lost = 0
+        self.abuse_sent = 0
+
+    async def send(self, user_id, kind, payload):
+        await self.pacer.acquire()
+        update = self.factory.make(user_id, kind, payload)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[update.update_id] = future
+        start = time.perf_counter()
+        await self.application.update_queue.put(update)
+        try:
+            self.latencies.append(await asyncio.wait_for(future, PATIENT_TIMEOUT) - start)
+        except asyncio.TimeoutError:
+            # أُهمل التحديث (الحد من الإغراق أو حد المحادثة في OrderedUpdateProcessor)
+            self.pending.pop(update.update_id, None)
+            self.lost += 1
+
+    async def abuse(self, user_id, rate, deadline):
+        """إرسال بلا انتظار للنتيجة، كما يفعل سكربت أو إصبع على زر."""
+        pacer = bot.TokenBucket(rate, capacity=1)
+        steps = itertools.cycle(ABUSE_STEPS)
+        while time.perf_counter() < deadline:
+            await pacer.acquire()
+            await self.application.update_queue.put(self.factory.make(user_id, *next(steps)))
+            self.abuse_sent += 1
+
+
+def counter_total(counter):
+    return sum(counter._values.values())
+
+
+def histogram_count(histogram):
+    return sum(child.count for child in histogram._children.values())
+
+
+async def run(args, protected):
+    server, sent = bench_load.start_fake_api(args.api_delay)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/bot"
+
+    with db.get_db_connection() as conn:
+        conn.execute("DELETE FROM slot_calendar")
+        conn.execute("DELETE FROM bookings")
+    bot.flood_control = flood_control.FloodControl(exempt_ids=bot.ADMIN_IDS)
+    application = bot.build_application(token=bench_load.TOKEN, base_url=base_url, concurrent_updates=args.concurrency)
+    bot.register_handlers(application)
+    if not protected:
+        # الفحص داخل OrderedUpdateProcessor، أو معالج المجموعة -1 مع --concurrency 1
+        application.update_processor.flood_control = None
+        for handler in list(application.handlers.get(-1, ())):
+            application.remove_handler(handler, group=-1)
+    test = FloodTest(application, args.rate)
+    application.add_handler(TypeHandler(Update, test.on_processed), group=100)
+
+    await application.initialize()
+    await application.start()
+
+    db_calls = histogram_count(metrics.DB_LATENCY)
+    handled = histogram_count(metrics.HANDLER_LATENCY)
+    throttled = counter_total(flood_control.UPDATES_THROTTLED)
+    rng = random.Random(args.seed)
+
+    async def patient(user_id):
+        await asyncio.sleep(rng.uniform(0, args.seconds / 2))
+        await test.run_flow(user_id, [("command", "/start"), *bench_load.booking_flow(rng, user_id)])
+
+    start = time.perf_counter()
+    deadline = start + args.seconds
+    abusers = [asyncio.create_task(test.abuse(bench_load.FIRST_USER_ID - 1 - i, args.abuse_rate, deadline))
+               for i in range(args.abusers)]
+    await asyncio.gather(*(patient(bench_load.FIRST_USER_ID + i) for i in range(args.patients)))
+    await asyncio.gather(*abusers)
+    elapsed = time.perf_counter() - start
+
+    await application.stop()
+    await application.shutdown()
+    bookings = len(await adb.get_all_bookings())
+    server.shutdown()
+
+    latencies = test.latencies
+    print(f"flood control {'on' if protected else 'off'}: {elapsed:.2f}s")
+    print(f"  patients: {len(latencies)} updates answered, {test.lost} lost   "
+          f"p50 {bench_load.percentile(latencies, 0.50) * 1000:.1f} ms   "
+          f"p99 {bench_load.percentile(latencies, 0.99) * 1000:.1f} ms   bookings stored: {bookings}")
+    print(f"  abusers: {test.abuse_sent} updates sent   "
+          f"throttled: {counter_total(flood_control.UPDATES_THROTTLED) - throttled}   "
+          f"dropped by chat limit: {counter_total(bench_load.update_processor.UPDATES_DROPPED)}")
+    print(f"  handler calls (all users): {histogram_count(metrics.HANDLER_LATENCY) - handled}   "
+          f"db calls: {histogram_count(metrics.DB_LATENCY) - db_calls}   bot api calls: {sum(sent.values())}")
+    bench_load.update_processor.UPDATES_DROPPED._values.clear()
+
+
+def check_cost(users, repeat):
+    # ساعة وهمية تتقدم 10ms لكل تحديث: كل مستخدم يرسل تحديثاً كل users/100 ثانية فلا يُحظر
+    ticks = itertools.count(step=0.01)
+    control = flood_control.FloodControl(clock=lambda: next(ticks))
+    user_ids = list(range(users))
+    start = time.perf_counter()
+    for i in range(repeat):
+        control.check(user_ids[i % users])
+    elapsed = time.perf_counter() - start
+    print(f"FloodControl.check: {elapsed / repeat * 1e9:.0f} ns/update ({users} users tracked)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, default=100)
+    parser.add_argument("--abusers", type=int, default=5)
+    parser.add_argument("--abuse-rate", type=int, default=200, help="updates per second from each abuser")
+    parser.add_argument("--seconds", type=float, default=5.0, help="how long the abusers keep flooding")
+    parser.add_argument("--rate", type=int, default=500, help="pacing of patient updates")
+    parser.add_argument("--api-delay", type=float, default=0.02, help="simulated Bot API latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=bot.CONCURRENT_UPDATES)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("flood_control").setLevel(logging.ERROR)
+    db.init_database()
+    for protected in (False, True):
+        asyncio.run(run(args, protected))
+    adb.shutdown()
+    check_cost(10000, 1_000_000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+قياس إنتاجية زر "العودة للقائمة" (button_handler مع 'back') وحجم الذاكرة
+المخصصة لكل ضغطة: لوحات مفاتيح مخزنة مسبقاً مقابل إعادة بنائها في كل مرة كما كان سابقاً.
+
+الاستخدام:
+    python benchmarks/bench_keyboards.py [--iterations 20000]
+"""
+
+import argparse
+import asyncio
+import copy
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="amal-bench-"), "bench.db")
+
+import bot  # noqa: E402
+
+
+class StubQuery:
+    data = "back"
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        return reply_markup
+
+
+class StubUpdate:
+    callback_query = StubQuery()
+
+
+async def cached_back(update):
+    await bot.button_handler(update, None)
+
+
+async def legacy_back(update):
+    # السلوك السابق: نسخة جديدة من قاموس المواضيع ولوحة القائمة في كل ضغطة
+    theme = copy.deepcopy(bot.THEMES)[bot.theme_manager.current_theme]
+    bot._main_menu_cache.clear()
+    await update.callback_query.answer()
+    await update.callback_query.edit_message_text(theme["welcome_message"], reply_markup=bot.main_menu_keyboard())
+
+
+async def measure(label, handler, iterations):
+    update = StubUpdate()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await handler(update)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(100):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        await handler(update)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    print(f"{label:8s} {iterations / elapsed:10.0f} presses/s   {sum(peaks) / len(peaks) / 1024:8.2f} KiB allocated/press")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    asyncio.run(measure("legacy", legacy_back, args.iterations))
+    asyncio.run(measure("cached", cached_back, args.iterations))
+
+
+if __name__ == "__main__":
+    main()
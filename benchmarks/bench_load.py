@@ -0,0 +1,304 @@
+"""
+اختبار حمل بدون إنترنت: يشغل Application الحقيقي بنفس معالجات bot.py
+(build_application + register_handlers) مقابل خادم محلي يحاكي Telegram Bot API،
+ويغذيه بتحديثات مكتوبة مسبقاً بمعدل محدد:
+
+    - حجز كامل: book → الاسم → الجوال → الخدمة → اليوم → الوقت → النوع
+    - تأكيد المشرف: admin_edit ثم admin_confirm لكل حجز جديد
+    - تقييم: rate_5 ثم رسالة الملاحظات
+    - تصفح الأسئلة الشائعة
+
+ويطبع زمن الاستجابة الكامل (p50/p95/p99) من إدخال التحديث حتى انتهاء معالجته،
+وعدد التحديثات في الثانية، وزمن استدعاءات قاعدة البيانات (بما فيه الانتظار على خيوطها).
+
+الاستخدام:
+    python benchmarks/bench_load.py [--users 200] [--rate 500] [--api-delay 0.02] [--concurrency 8]
+
+--concurrency 1 يعالج التحديثات واحداً تلو الآخر (السلوك السابق) للمقارنة.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="amal-bench-"), "bench.db")
+# الحد العام للإغراق (flood_control) أقل من معدل هذا الاختبار؛ bench_flood.py يقيسه
+os.environ.setdefault("FLOOD_GLOBAL_RATE", "0")
+
+from telegram import Update  # noqa: E402
+from telegram.ext import TypeHandler  # noqa: E402
+
+import async_database as adb  # noqa: E402
+import bot  # noqa: E402
+import database as db  # noqa: E402
+import metrics  # noqa: E402
+import update_processor  # noqa: E402
+
+TOKEN = "123456:LOADTEST"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Amal", "username": "amal_load_bot"}
+ADMIN_ID = next(iter(bot.ADMIN_IDS))
+FIRST_USER_ID = 10_000
+
+
+# === خادم Bot API وهمي ===
+def make_api_handler(delay, sent):
+    message_ids = iter(range(1, 1 << 62))
+    lock = threading.Lock()
+
+    class BotAPIHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # اتصالات keep-alive كما في api.telegram.org
+        disable_nagle_algorithm = True  # وإلا تتأخر كل استجابة ~40ms بسبب delayed ACK
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length).decode() if length else ""
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params = json.loads(raw or "{}")
+            else:
+                params = {key: values[0] for key, values in parse_qs(raw).items()}
+            method = self.path.rsplit("/", 1)[-1]
+            if delay:
+                time.sleep(delay)
+
+            with lock:
+                sent[method] += 1
+                message_id = next(message_ids)
+            if method == "getMe":
+                result = BOT_USER
+            elif method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+                chat_id = int(params.get("chat_id", 0))
+                result = {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": params.get("text", ""),
+                }
+            else:
+                result = True
+
+            body = json.dumps({"ok": True, "result": result}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return BotAPIHandler
+
+
+def start_fake_api(delay):
+    sent = Counter()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_api_handler(delay, sent))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, sent
+
+
+# === توليد التحديثات ===
+class UpdateFactory:
+    def __init__(self, application):
+        self.bot = application.bot
+        self._ids = iter(range(1, 1 << 62))
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def callback(self, user_id, data):
+        update_id = next(self._ids)
+        return Update.de_json({
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "menu",
+                },
+            },
+        }, self.bot)
+
+    def text(self, user_id, text):
+        update_id = next(self._ids)
+        return Update.de_json({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self._user(user_id),
+                "text": text,
+            },
+        }, self.bot)
+
+
+def booking_flow(rng, user_id):
+    day = datetime.now().date() + timedelta(days=rng.randrange(1, db.BOOKING_HORIZON_DAYS))
+    return [
+        ("callback", "book"),
+        ("text", f"مريض {user_id}"),
+        ("text", f"059{user_id:07d}"),
+        ("callback", bot.encode_service(rng.randrange(len(bot.SERVICES)))),
+        ("callback", bot.encode_day(day)),
+        ("callback", bot.encode_slot(rng.randrange(db.START_TICKS))),
+        ("callback", rng.choice(("type_normal", "type_emergency"))),
+    ]
+
+
+def rating_flow(rng, user_id):
+    return [("callback", f"rate_{rng.randint(1, 5)}"), ("text", "خدمة ممتازة")]
+
+
+def faq_flow(rng, user_id):
+    keys = rng.sample(list(bot.faq_manager.faq_data), 3)
+    return [("callback", "faq_menu"), *(("callback", f"faq_{key}") for key in keys)]
+
+
+FLOWS = (("booking", booking_flow, 0.6), ("rating", rating_flow, 0.2), ("faq", faq_flow, 0.2))
+
+
+# === التشغيل ===
+class LoadTest:
+    def __init__(self, application, rate):
+        self.application = application
+        self.factory = UpdateFactory(application)
+        self.pacer = bot.TokenBucket(rate, capacity=max(1, rate // 10))
+        self.pending = {}
+        self.latencies = []
+
+    async def on_processed(self, update, context):
+        # مجموعة منفصلة بعد كل المعالجات: تعني أن التحديث انتهت معالجته
+        future = self.pending.pop(update.update_id, None)
+        if future and not future.done():
+            future.set_result(time.perf_counter())
+
+    async def send(self, user_id, kind, payload):
+        await self.pacer.acquire()
+        update = self.factory.callback(user_id, payload) if kind == "callback" else self.factory.text(user_id, payload)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[update.update_id] = future
+        start = time.perf_counter()
+        await self.application.update_queue.put(update)
+        self.latencies.append(await future - start)
+
+    async def run_flow(self, user_id, steps):
+        for kind, payload in steps:
+            await self.send(user_id, kind, payload)
+
+    async def run_admin(self, booked_users):
+        """المشرف يراجع ويؤكد الحجوزات بالترتيب الذي تصل به."""
+        while True:
+            user_id = await booked_users.get()
+            if user_id is None:
+                return
+            await self.run_flow(ADMIN_ID, [("callback", f"admin_edit_{user_id}"), ("callback", f"admin_confirm_{user_id}")])
+
+
+async def run(args):
+    server, sent = start_fake_api(args.api_delay)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/bot"
+
+    db.init_database()
+    application = bot.build_application(token=TOKEN, base_url=base_url, concurrent_updates=args.concurrency)
+    bot.register_handlers(application)
+    test = LoadTest(application, args.rate)
+    application.add_handler(TypeHandler(Update, test.on_processed), group=100)
+
+    await application.initialize()
+    await application.start()
+
+    rng = random.Random(args.seed)
+    names, flows, weights = zip(*FLOWS)
+    booked_users = asyncio.Queue()
+    mix = Counter()
+
+    async def user(user_id):
+        index = rng.choices(range(len(flows)), weights)[0]
+        mix[names[index]] += 1
+        await test.run_flow(user_id, flows[index](rng, user_id))
+        if names[index] == "booking":
+            await booked_users.put(user_id)
+
+    start = time.perf_counter()
+    admin = asyncio.create_task(test.run_admin(booked_users))
+    await asyncio.gather(*(user(FIRST_USER_ID + i) for i in range(args.users)))
+    await booked_users.put(None)
+    await admin
+    elapsed = time.perf_counter() - start
+
+    await application.stop()
+    await application.shutdown()
+    bookings = len(await adb.get_all_bookings())
+    adb.shutdown()
+    server.shutdown()
+
+    report(test.latencies, elapsed, mix, sent, bookings, args.concurrency)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def histogram_totals(histogram):
+    count = sum(child.count for child in histogram._children.values())
+    total = sum(child.sum for child in histogram._children.values())
+    return count, total
+
+
+def report(latencies, elapsed, mix, sent, bookings, concurrency):
+    print(f"concurrency: {concurrency}")
+    print(f"flows: {dict(mix)}   bookings stored: {bookings}")
+    print(f"updates: {len(latencies)} in {elapsed:.2f}s   {len(latencies) / elapsed:.1f} updates/s")
+    print(
+        "latency: "
+        f"p50 {percentile(latencies, 0.50) * 1000:.1f} ms   "
+        f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms   "
+        f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms"
+    )
+    db_calls, db_time = histogram_totals(metrics.DB_LATENCY)
+    print(
+        f"db: {db_calls} calls   {db_calls / max(len(latencies), 1):.2f} calls/update   "
+        f"mean {db_time / max(db_calls, 1) * 1000:.2f} ms/call (incl. executor wait, {adb.DB_WORKERS} workers)"
+    )
+    print(f"bot api calls: {dict(sent)}")
+    waits, wait_time = histogram_totals(update_processor.CHAT_WAIT)
+    if waits:
+        print(f"chat queue wait: mean {wait_time / waits * 1000:.2f} ms   "
+              f"dropped updates: {sum(update_processor.UPDATES_DROPPED._values.values())}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rate", type=int, default=500, help="updates per second fed to the bot")
+    parser.add_argument("--api-delay", type=float, default=0.0, help="simulated Bot API latency in seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=bot.CONCURRENT_UPDATES,
+                        help="concurrent updates (1 = sequential)")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+زمن البحث في الحجوزات (/find): فهرس FTS5 (search_bookings) مقابل بحث LIKE على
+الاسم والجوال والملاحظات بعد تطبيع النص في SQL (مسح كامل لكل الحجوزات).
+
+يقيس أيضاً كلفة فهرسة كل حجز عند كتابته (_index_booking)، وزمن إعادة بناء الفهرس بالكامل،
+ويتحقق من أن نتائج الطريقتين متطابقة لكل استعلام.
+
+الاستخدام:
+    python benchmarks/bench_search.py [--bookings 100000] [--repeat 200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="amal-bench-"), "bench.db")
+
+import database as db  # noqa: E402
+
+FIRST_NAMES = ["مُحَمَّد", "محمد", "أحمد", "احمد", "فاطمة", "فاطمه", "عائشة", "إبراهيم", "يوسف", "مريم",
+               "خديجة", "عبدالله", "سارة", "ليلى", "عمر", "علي", "هدى", "نور", "مصطفى", "رقية"]
+LAST_NAMES = ["الشمري", "العتيبي", "القحطاني", "الزهراني", "الغامدي", "الحربي", "المطيري", "الدوسري",
+              "السبيعي", "الشهري", "البلوي", "العنزي", "الرشيدي", "الجهني", "الأنصاري", "الهاجري"]
+FEEDBACK = ["الموظفة كانت لطيفة جداً", "الانتظار طويل", "خدمة ممتازة وسريعة", "المكان نظيف",
+            "التصوير كان دقيقاً", "المواقف مزدحمة", None, None, None]
+QUERIES = ["محمد", "فاطمه", "ابراهيم الشمري", "الشم", "رقيه الهاجري", "0591", "59123", "+97059123",
+           "لطيفه", "موظف", "عبدالل العنزي", "zzz"]
+
+
+def populate(count):
+    rng = random.Random(42)
+    rows = []
+    for booking_id in range(1, count + 1):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        phone = rng.choice(("0", "+970", "00970", "+972")) + rng.choice(("59", "56")) + f"{rng.randrange(10 ** 7):07d}"
+        rows.append((booking_id, booking_id, name, phone, "تصوير بانورامي", "الاثنين", db.TIME_SLOTS[0],
+                     "01/01/2026", "عادي", "تم التصوير", 0))
+    ratings = [(booking_id, booking_id, rng.randint(1, 5), feedback)
+               for booking_id in range(1, count + 1, 3)
+               for feedback in [rng.choice(FEEDBACK)] if feedback]
+    start = time.perf_counter()
+    with db.get_db_connection() as conn:
+        conn.executemany("""
+            INSERT INTO bookings (id, user_id, name, phone, service, day, time, date, type, status, is_current)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.executemany("INSERT INTO ratings (user_id, booking_id, stars, feedback) VALUES (?, ?, ?, ?)", ratings)
+    return time.perf_counter() - start
+
+
+def legacy_search(text, limit=db.SEARCH_RESULTS_LIMIT):
+    """بحث بدون فهرس: تطبيع كل صف في SQL ثم LIKE لبداية كل كلمة (مسح كامل للجدول)."""
+    tokens = [db._strip_article(token) for token in db._SEARCH_TOKEN.findall(db.normalize_search_text(text))]
+    compact = db._PHONE_CHARS.sub("", db.normalize_search_text(text))
+    with db.get_db_connection() as conn:
+        if compact.isdigit():
+            local = db._PHONE_PREFIX.sub("", compact)
+            where = "' ' || phone_search_text(b.phone) LIKE ? OR ' ' || phone_search_text(b.phone) LIKE ?"
+            params = [f"% {compact}%", f"% {local}%"]
+        else:
+            document = ("' ' || search_text(b.name) || ' ' || "
+                        "COALESCE((SELECT group_concat(search_text(feedback), ' ') FROM ratings "
+                        "WHERE booking_id = b.id AND feedback IS NOT NULL), '')")
+            where = " AND ".join(f"({document}) LIKE ?" for _ in tokens) or "0"
+            params = [f"% {token}%" for token in tokens]
+        rows = conn.execute(f"SELECT b.id FROM bookings b WHERE {where} ORDER BY b.id DESC LIMIT ?",
+                            (*params, limit)).fetchall()
+    return [row[0] for row in rows]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--legacy-repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db.init_database()
+    elapsed = populate(args.bookings)
+    print(f"{args.bookings} bookings inserted: {elapsed / args.bookings * 1e6:.1f} us/booking")
+
+    with db.get_db_connection() as conn:
+        rows = conn.execute("SELECT id, name, phone FROM bookings").fetchall()
+        start = time.perf_counter()
+        cursor = conn.cursor()
+        for row in rows:
+            db._index_booking(cursor, *row)
+        elapsed = time.perf_counter() - start
+    print(f"_index_booking (done by create_booking): {elapsed / len(rows) * 1e6:.1f} us/booking")
+    start = time.perf_counter()
+    indexed = db.rebuild_search_index()
+    print(f"rebuild_search_index: {indexed} bookings in {time.perf_counter() - start:.2f}s")
+
+    print(f"{'query':18s} {'hits':>5s} {'fts p50':>10s} {'fts p99':>10s} {'like p50':>10s}")
+    for text in QUERIES:
+        results, fts_times = measure(lambda: db.search_bookings(text), args.repeat)
+        legacy, like_times = measure(lambda: legacy_search(text), args.legacy_repeat)
+        if [booking['id'] for booking in results] != legacy:
+            sys.exit(f"FTS results differ from LIKE for {text!r}")
+        print(f"{text:18s} {len(results):5d} {percentile(fts_times, 0.5) * 1e3:8.3f}ms "
+              f"{percentile(fts_times, 0.99) * 1e3:8.3f}ms {percentile(like_times, 0.5) * 1e3:8.1f}ms")
+    db.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+زمن فتح لوحة الإحصائيات: التجميع الكامل القديم على bookings و ratings
+مقابل get_statistics التي تقرأ العدادات المحفوظة في stats_counters.
+
+يقيس أيضاً كلفة المشغلات على الكتابة (create_booking و update_booking_status و save_rating)،
+ويتحقق من تطابق نتيجة العدادات مع التجميع الكامل.
+
+الاستخدام:
+    python benchmarks/bench_statistics.py [--bookings 50000] [--repeat 50]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="amal-bench-"), "bench.db")
+
+import database as db  # noqa: E402
+
+SERVICES = ["تصوير بانورامي", "تصوير سيفالومتري", "تصوير مقطعي CBCT", "تصوير ذرّي"]
+FINAL_STATUSES = ["مؤكد", "تم التصوير", "تم التصوير", "لم يحضر"]
+
+
+def legacy_statistics():
+    """نسخة من get_statistics السابقة: ثلاثة تجميعات كاملة في كل فتح للوحة."""
+    with db.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT
+                COUNT(*) as total_bookings,
+                COUNT(CASE WHEN status = 'قيد الانتظار' THEN 1 END) as pending,
+                COUNT(CASE WHEN status = 'مؤكد' THEN 1 END) as confirmed,
+                COUNT(CASE WHEN status = 'تم التصوير' THEN 1 END) as completed,
+                COUNT(CASE WHEN status = 'لم يحضر' THEN 1 END) as no_show,
+                COUNT(CASE WHEN status = 'ملغي' THEN 1 END) as cancelled
+            FROM bookings
+        """)
+        stats = dict(cursor.fetchone())
+        cursor.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT user_id FROM bookings
+                WHERE status = 'تم التصوير'
+                GROUP BY user_id
+                HAVING COUNT(*) > 1
+            )
+        """)
+        stats['repeat_patients'] = cursor.fetchone()[0]
+        cursor.execute("SELECT service, COUNT(*) as count FROM bookings GROUP BY service ORDER BY count DESC")
+        services = cursor.fetchall()
+        cursor.execute("SELECT AVG(stars) as avg_rating, COUNT(*) as total_ratings FROM ratings")
+        rating_stats = cursor.fetchone()
+        return {
+            'bookings': stats,
+            'services': [dict(s) for s in services],
+            'ratings': dict(rating_stats),
+        }
+
+
+def populate(count):
+    """حجوزات على مدى سنتين لـ count/3 مريض (عدة زيارات لكل مريض)، مع تقييم لكل زيارة مكتملة."""
+    rng = random.Random(42)
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=730)
+    patients = max(1, count // 3)
+    writes = 0
+    elapsed = 0.0
+    for _ in range(count):
+        user_id = rng.randint(1, patients)
+        appointment = start + timedelta(days=rng.randrange(737), hours=rng.choice(db.SLOT_HOURS))
+        slot = db.TIME_SLOTS[db.SLOT_HOURS.index(appointment.hour)]
+        began = time.perf_counter()
+        try:
+            db.create_booking(user_id, f"user {user_id}", "0590000000", rng.choice(SERVICES),
+                              db.WEEKDAY_NAMES[appointment.weekday()], slot,
+                              appointment.strftime("%d/%m/%Y"), "عادي", appointment)
+        except db.SlotTakenError:
+            continue
+        status = rng.choice(FINAL_STATUSES)
+        db.update_booking_status(user_id, status)
+        writes += 2
+        if status == "تم التصوير":
+            db.save_rating(user_id, rng.randint(1, 5))
+            writes += 1
+        elapsed += time.perf_counter() - began
+    return writes, elapsed
+
+
+def measure(label, func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:9s} {elapsed * 1000:9.3f} ms/dashboard")
+    return result
+
+
+def comparable(stats):
+    bookings = {key: value for key, value in stats['bookings'].items() if key != 'today'}
+    services = sorted((s['service'], s['count']) for s in stats['services'])
+    ratings = (stats['ratings']['total_ratings'], round(stats['ratings']['avg_rating'] or 0, 9))
+    return bookings, services, ratings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    db.init_database()
+    writes, elapsed = populate(args.bookings)
+    print(f"{writes} writes (with counter triggers): {elapsed / writes * 1e6:.1f} us/write")
+
+    legacy = measure("aggregate", legacy_statistics, args.repeat)
+    counters = measure("counters", db.get_statistics, args.repeat)
+    if comparable(legacy) != comparable(counters):
+        sys.exit(f"Counters differ from the full aggregation:\n{comparable(legacy)}\n{comparable(counters)}")
+
+    start = time.perf_counter()
+    db.rebuild_statistics()
+    print(f"rebuild   {(time.perf_counter() - start) * 1000:9.3f} ms")
+    if comparable(db.get_statistics()) != comparable(legacy):
+        sys.exit("Rebuilt counters differ from the full aggregation")
+    db.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
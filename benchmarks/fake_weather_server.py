@@ -0,0 +1,64 @@
+"""
+خادم محلي يحاكي OpenWeatherMap لاختبار WeatherManager بدون اتصال بالإنترنت.
+
+الاستخدام:
+    python benchmarks/fake_weather_server.py --port 8081 --mode rain
+    WEATHER_API_KEY=test WEATHER_API_URL=http://127.0.0.1:8081/data/2.5/weather python bot.py
+
+الأوضاع: clear, rain, hot, cold, error (HTTP 500), slow (يتأخر --delay ثانية).
+"""
+
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPONSES = {
+    "clear": ("clear sky", 22.0),
+    "rain": ("light rain", 14.0),
+    "hot": ("clear sky", 38.5),
+    "cold": ("few clouds", 2.0),
+}
+
+
+def make_handler(mode, delay):
+    class WeatherHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if mode == "slow":
+                time.sleep(delay)
+            if mode == "error":
+                self.send_response(500)
+                self.end_headers()
+                return
+
+            description, temp = RESPONSES.get(mode, RESPONSES["clear"])
+            body = json.dumps({
+                "weather": [{"description": description}],
+                "main": {"temp": temp},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return WeatherHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--mode", choices=[*RESPONSES, "error", "slow"], default="rain")
+    parser.add_argument("--delay", type=float, default=10.0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.mode, args.delay))
+    print(f"Fake weather API on http://127.0.0.1:{args.port}/data/2.5/weather (mode={args.mode})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
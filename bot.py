@@ -7,17 +7,24 @@ Bot.py — بوت مركز أمل للتصوير الشعاعي
 """
 
 import os
+import asyncio
+import functools
 import logging
-from datetime import datetime, timedelta
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime, timedelta, timezone
 from enum import IntEnum
 import json
-import requests
+import httpx
 
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InputFile,
 )
+from telegram.constants import ChatAction
+from telegram.error import RetryAfter
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -25,16 +32,31 @@ from telegram.ext import (
     MessageHandler,
     ContextTypes,
     ConversationHandler,
+    TypeHandler,
     filters,
 )
 
 import database as db
+import async_database as adb
+import backup
+import export
+import metrics
+from flood_control import FloodControl
+from persistence import SQLitePersistence
+from router import CallbackRouter
+from update_processor import OrderedUpdateProcessor
 
 # -----------------------
 # إعدادات عامة
 # -----------------------
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_IDS = {7855827103}
+# عدد التحديثات التي تُعالج بالتوازي (محادثات مختلفة)؛ 1 = واحداً تلو الآخر
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 8))
+
+# حالات الحجز ورموزها المختصرة (تُستخدم في callback_data لتصفية الحجوزات)
+STATUS_EMOJI = {"قيد الانتظار": "⏳", "مؤكد": "✅", "تم التصوير": "✔️", "لم يحضر": "❌"}
+STATUS_CODES = {"p": "قيد الانتظار", "c": "مؤكد", "d": "تم التصوير", "a": "لم يحضر"}
 
 # حالات ConversationHandler
 class State(IntEnum):
@@ -54,14 +76,58 @@ class State(IntEnum):
 # -----------------------
 # نظام الموضوعات الموسمية
 # -----------------------
+THEMES = {
+    "default": {
+        "colors": {"primary": "🦷", "secondary": "✨"},
+        "welcome_message": "🦷✨ **مرحبًا بك في عائلة مركز أمل!**\n\nدقة عالمية في كل لقطة، لأن ابتسامتك تستحق الأفضل! 🌟",
+        "icons": {
+            "booking": "📅", "info": "ℹ️", "video": "🎥", 
+            "instructions": "📋", "location": "📍", "bookings": "🦷"
+        }
+    },
+    "ramadan": {
+        "colors": {"primary": "🌙", "secondary": "✨"},
+        "welcome_message": "🌙✨ **رمضان كريم من عائلة مركز أمل!**\n\nفي هذا الشهر الفضيل، نتمنى لكم صحة وابتسامة مشرقة! 🕌",
+        "icons": {
+            "booking": "🌙", "info": "📖", "video": "🎬", 
+            "instructions": "📋", "location": "🕌", "bookings": "🦷"
+        }
+    },
+    "winter": {
+        "colors": {"primary": "❄️", "secondary": "🦷"},
+        "welcome_message": "❄️🦷 **مرحبًا بكم في مركز أمل!**\n\nمع برودة الطقس، اهتموا بصحتكم وابتسامتكم! 🌨️",
+        "icons": {
+            "booking": "❄️", "info": "ℹ️", "video": "🎥", 
+            "instructions": "🧤", "location": "🏔️", "bookings": "🦷"
+        }
+    },
+    "summer": {
+        "colors": {"primary": "☀️", "secondary": "🦷"},
+        "welcome_message": "☀️🦷 **مرحبًا بكم في مركز أمل!**\n\nمع ارتفاع الحرارة، حافظوا على رطوبة أجسامكم! 🌊",
+        "icons": {
+            "booking": "☀️", "info": "ℹ️", "video": "🎥", 
+            "instructions": "😎", "location": "🏖️", "bookings": "🦷"
+        }
+    }
+}
+
 class ThemeManager:
+    """الموضوع الحالي يُعاد تحديده عند تغيّر الشهر بدلاً من تثبيته عند التشغيل."""
+
     def __init__(self):
-        self.current_theme = self._detect_theme()
-    
-    def _detect_theme(self):
-        now = datetime.now()
-        month = now.month
-        
+        self._month = None
+        self._theme = None
+
+    @property
+    def current_theme(self):
+        month = datetime.now().month
+        if month != self._month:
+            self._month = month
+            self._theme = self._detect_theme(month)
+        return self._theme
+
+    @staticmethod
+    def _detect_theme(month):
         if month == 3:
             return "ramadan"
         elif month == 4:
@@ -72,43 +138,9 @@ class ThemeManager:
             return "summer"
         else:
             return "default"
-    
+
     def get_theme_config(self):
-        themes = {
-            "default": {
-                "colors": {"primary": "🦷", "secondary": "✨"},
-                "welcome_message": "🦷✨ **مرحبًا بك في عائلة مركز أمل!**\n\nدقة عالمية في كل لقطة، لأن ابتسامتك تستحق الأفضل! 🌟",
-                "icons": {
-                    "booking": "📅", "info": "ℹ️", "video": "🎥", 
-                    "instructions": "📋", "location": "📍", "bookings": "🦷"
-                }
-            },
-            "ramadan": {
-                "colors": {"primary": "🌙", "secondary": "✨"},
-                "welcome_message": "🌙✨ **رمضان كريم من عائلة مركز أمل!**\n\nفي هذا الشهر الفضيل، نتمنى لكم صحة وابتسامة مشرقة! 🕌",
-                "icons": {
-                    "booking": "🌙", "info": "📖", "video": "🎬", 
-                    "instructions": "📋", "location": "🕌", "bookings": "🦷"
-                }
-            },
-            "winter": {
-                "colors": {"primary": "❄️", "secondary": "🦷"},
-                "welcome_message": "❄️🦷 **مرحبًا بكم في مركز أمل!**\n\nمع برودة الطقس، اهتموا بصحتكم وابتسامتكم! 🌨️",
-                "icons": {
-                    "booking": "❄️", "info": "ℹ️", "video": "🎥", 
-                    "instructions": "🧤", "location": "🏔️", "bookings": "🦷"
-                }
-            },
-            "summer": {
-                "colors": {"primary": "☀️", "secondary": "🦷"},
-                "welcome_message": "☀️🦷 **مرحبًا بكم في مركز أمل!**\n\nمع ارتفاع الحرارة، حافظوا على رطوبة أجسامكم! 🌊",
-                "icons": {
-                    "booking": "☀️", "info": "ℹ️", "video": "🎥", 
-                    "instructions": "😎", "location": "🏖️", "bookings": "🦷"
-                }
-            }
-        }
-        return themes.get(self.current_theme, themes["default"])
+        return THEMES.get(self.current_theme, THEMES["default"])
 
 # -----------------------
 # نظام الأسئلة الشائعة
@@ -142,12 +174,16 @@ class FAQManager:
             }
         }
     
+        self._keyboard = None
+
     def get_faq_keyboard(self):
-        keyboard = []
-        for key, faq in self.faq_data.items():
-            keyboard.append([InlineKeyboardButton(faq["question"], callback_data=f"faq_{key}")])
-        keyboard.append([InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')])
-        return InlineKeyboardMarkup(keyboard)
+        if self._keyboard is None:
+            keyboard = []
+            for key, faq in self.faq_data.items():
+                keyboard.append([InlineKeyboardButton(faq["question"], callback_data=f"faq_{key}")])
+            keyboard.append([InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')])
+            self._keyboard = InlineKeyboardMarkup(keyboard)
+        return self._keyboard
     
     def get_faq_answer(self, faq_key):
         faq = self.faq_data.get(faq_key)
@@ -159,124 +195,399 @@ class FAQManager:
 # نظام الانتظار الذكي
 # -----------------------
 class WaitingListManager:
-    def __init__(self):
-        self.waiting_list = {}
-    
-    def add_to_waiting_list(self, user_id, user_data):
-        self.waiting_list[user_id] = {
-            'name': user_data.get('name'),
-            'phone': user_data.get('phone'),
-            'service': user_data.get('service'),
-            'timestamp': datetime.now()
-        }
+    """قائمة انتظار دائمة في قاعدة البيانات، تُعرض فيها المواعيد المتاحة على المنتظرين بالترتيب."""
+
+    async def add_to_waiting_list(self, user_id, user_data):
+        today = datetime.now().date()
+        await adb.add_to_waiting_list(
+            user_id,
+            user_data.get('name'),
+            user_data.get('phone'),
+            user_data.get('service') or "غير متأكد",
+            today,
+            today + timedelta(days=db.WAITING_LIST_WINDOW_DAYS - 1),
+        )
     
-    def remove_from_waiting_list(self, user_id):
-        return self.waiting_list.pop(user_id, None)
+    async def remove_from_waiting_list(self, user_id):
+        return await adb.remove_from_waiting_list(user_id)
     
-    def get_waiting_list(self):
-        return self.waiting_list
+    async def get_waiting_list(self):
+        return await adb.get_waiting_list()
     
-    async def notify_waiting_users(self, context, day_name, available_slots):
-        users_to_remove = []
-        for user_id, user_data in self.waiting_list.items():
-            try:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=(
-                        "🎉 **أوقات جديدة متاحة!**\n\n"
-                        f"عزيزي/عزيزتي {user_data['name']}\n"
-                        "هناك أوقات متاحة الآن للحجز.\n\n"
-                        f"🦷 الخدمة المطلوبة: {user_data['service']}\n"
-                        f"📅 اليوم: {day_name}\n"
-                        "⏰ الأوقات المتاحة:\n" + 
-                        "\n".join([f"• {slot}" for slot in available_slots[:3]]) +
-                        "\n\nسارع بالحجز قبل أن تنتهي! 🚀\n"
-                        "استخدم /start للبدء"
-                    ),
-                    parse_mode="Markdown"
-                )
-                users_to_remove.append(user_id)
-                logger.info(f"Notified waiting user {user_id} about available slots")
-            except Exception as e:
-                logger.error(f"Failed to notify waiting user {user_id}: {e}")
-        
-        for user_id in users_to_remove:
-            self.remove_from_waiting_list(user_id)
+    async def notify_waiting_users(self, context):
+        """مطابقة المواعيد المتاحة مع المنتظرين وإرسال عرض موعد محدد لكل منتظر."""
+        today = datetime.now().date()
+        offers = await adb.match_waiting_list(today, today + timedelta(days=db.BOOKING_HORIZON_DAYS - 1))
+        messages = [
+            (
+                waiter['user_id'],
+                "🎉 **موعد جديد متاح!**\n\n"
+                f"عزيزي/عزيزتي {waiter['name']}\n"
+                "توفر موعد مناسب لك الآن.\n\n"
+                f"🦷 الخدمة المطلوبة: {waiter['service']}\n"
+                f"📅 اليوم: {db.WEEKDAY_NAMES[day.weekday()]} {day.strftime('%d/%m/%Y')}\n"
+                f"⏰ الوقت: {db.TICK_LABELS[tick]}\n\n"
+                "سارع بالحجز قبل أن ينتهي! 🚀\n"
+                "استخدم /start للبدء"
+            )
+            for waiter, day, tick in offers
+        ]
+        results = await dispatcher.send_many(context.bot, messages, parse_mode="Markdown")
+
+        for result in results:
+            if result.ok:
+                await self.remove_from_waiting_list(result.chat_id)
+                logger.info(f"Notified waiting user {result.chat_id} about an available slot")
+            else:
+                logger.error(f"Failed to notify waiting user {result.chat_id}: {result.error}")
 
 # -----------------------
 # نظام حفظ البيانات
 # -----------------------
+class WriteBehindCache:
+    """
+    ذاكرة LRU أمام جدول في قاعدة البيانات: القراءة من الذاكرة أولاً،
+    والكتابة في الذاكرة فوراً ثم تُحفظ التغييرات على دفعات (معاملة واحدة) عبر flush.
+    """
+
+    FLUSH_INTERVAL = 5  # ثوانٍ بين كل دفعة كتابة
+
+    def __init__(self, name, load, save, capacity=5000):
+        self.name = name
+        self._load = load
+        self._save = save
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._dirty = {}
+        self._flush_lock = asyncio.Lock()
+
+    async def get(self, key):
+        """القيمة المخزنة أو None إن لم تكن محفوظة."""
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key]
+        if key in self._dirty:
+            value = self._dirty[key]
+        else:
+            value = await self._load(key)
+            if key in self._items:  # كُتبت أثناء انتظار القراءة
+                return self._items[key]
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        """كتابة فورية في الذاكرة؛ الحفظ في قاعدة البيانات يتم مع الدفعة التالية."""
+        self._dirty[key] = value
+        self._remember(key, value)
+
+    def _remember(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.capacity:
+            # العناصر غير المحفوظة تبقى في _dirty حتى الدفعة التالية
+            self._items.popitem(last=False)
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            try:
+                await self._save(batch)
+            except Exception as e:
+                # إعادة التغييرات للمحاولة لاحقاً دون الكتابة فوق ما تغيّر بعدها
+                for key, value in batch.items():
+                    self._dirty.setdefault(key, value)
+                logger.error(f"Failed to flush {len(batch)} {self.name} entries: {e}")
+                return
+            logger.debug(f"Flushed {len(batch)} {self.name} entries")
+
+    async def flush_job(self, context: ContextTypes.DEFAULT_TYPE):
+        await self.flush()
+
 class UserDataManager:
     def __init__(self):
-        self.user_preferences = {}
+        self.cache = WriteBehindCache("user profile", adb.get_user_profile, adb.save_user_profiles)
     
-    def save_user_data(self, user_id, name, phone):
-        if user_id not in self.user_preferences:
-            self.user_preferences[user_id] = {}
-        
-        self.user_preferences[user_id].update({
+    async def save_user_data(self, user_id, name, phone):
+        previous = await self.cache.get(user_id) or {}
+        self.cache.put(user_id, {
             'name': name,
             'phone': phone,
-            'last_booking': datetime.now(),
-            'booking_count': self.user_preferences[user_id].get('booking_count', 0) + 1
+            'last_booking': datetime.now().isoformat(timespec='seconds'),
+            'booking_count': previous.get('booking_count', 0) + 1
         })
     
-    def get_user_data(self, user_id):
-        return self.user_preferences.get(user_id, {})
+    async def get_user_data(self, user_id):
+        return await self.cache.get(user_id) or {}
     
-    def has_previous_data(self, user_id):
-        return user_id in self.user_preferences and 'name' in self.user_preferences[user_id]
+    async def has_previous_data(self, user_id):
+        return bool((await self.get_user_data(user_id)).get('name'))
+
+    async def get_stats(self):
+        """(إجمالي المستخدمين، العملاء الدائمين) بعد حفظ التغييرات المعلقة."""
+        await self.cache.flush()
+        return await adb.get_user_profile_stats()
 
 # -----------------------
 # نظام الطقس
 # -----------------------
 class WeatherManager:
+    """
+    تنبيهات الطقس من ذاكرة مؤقتة (cache) يتم تحديثها في الخلفية،
+    حتى لا ينتظر /start أي طلب HTTP خارجي.
+    """
+
+    API_URL = os.getenv("WEATHER_API_URL", "https://api.openweathermap.org/data/2.5/weather")
+    CACHE_TTL = timedelta(minutes=30)
+    REQUEST_TIMEOUT = 5.0
+    # قاطع الدائرة: بعد عدد من الإخفاقات المتتالية نتوقف عن الطلب لفترة
+    FAILURE_THRESHOLD = 3
+    COOLDOWN = timedelta(minutes=5)
+
     def __init__(self):
         self.api_key = os.getenv("WEATHER_API_KEY")
-    
-    async def get_weather_alert(self):
-        if not self.api_key:
-            return None
-        
+        self._client = None
+        self._alert = None
+        self._fetched_at = None
+        self._refresh_task = None
+        self._failures = 0
+        self._open_until = None
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.REQUEST_TIMEOUT)
+        return self._client
+
+    def _is_stale(self):
+        return self._fetched_at is None or datetime.now() - self._fetched_at > self.CACHE_TTL
+
+    def _circuit_open(self):
+        return self._open_until is not None and datetime.now() < self._open_until
+
+    @staticmethod
+    def _build_alert(data):
+        weather = data['weather'][0]['description']
+        temp = data['main']['temp']
+
+        if 'rain' in weather.lower() or 'storm' in weather.lower():
+            return f"⚠️ **تنبيه الطقس**: {weather}\n🌡️ درجة الحرارة: {temp}°C\nننصح بتأجيل الموعد إذا كانت الظروف صعبة"
+        elif temp > 35:
+            return f"🌡️ **طقس حار**: {weather}\nدرجة الحرارة: {temp}°C\nننصح بشرب الماء والاحتماء من الشمس"
+        elif temp < 5:
+            return f"❄️ **طقس بارد**: {weather}\nدرجة الحرارة: {temp}°C\nننصح بارتداء ملابس دافئة"
+        return None
+
+    async def refresh(self):
+        """جلب الطقس وتحديث الذاكرة المؤقتة. عند الفشل يبقى آخر تنبيه معروف."""
+        if not self.api_key or self._circuit_open():
+            return
+
         try:
-            # مثال لاستدعاء API الطقس (يمكن استبداله بأي API)
-            response = requests.get(
-                f"http://api.openweathermap.org/data/2.5/weather?q=Nablus&appid={self.api_key}&units=metric&lang=ar"
+            response = await self._get_client().get(
+                self.API_URL,
+                params={"q": "Nablus", "appid": self.api_key, "units": "metric", "lang": "ar"},
             )
-            if response.status_code == 200:
-                data = response.json()
-                weather = data['weather'][0]['description']
-                temp = data['main']['temp']
-                
-                if 'rain' in weather.lower() or 'storm' in weather.lower():
-                    return f"⚠️ **تنبيه الطقس**: {weather}\n🌡️ درجة الحرارة: {temp}°C\nننصح بتأجيل الموعد إذا كانت الظروف صعبة"
-                elif temp > 35:
-                    return f"🌡️ **طقس حار**: {weather}\nدرجة الحرارة: {temp}°C\nننصح بشرب الماء والاحتماء من الشمس"
-                elif temp < 5:
-                    return f"❄️ **طقس بارد**: {weather}\nدرجة الحرارة: {temp}°C\nننصح بارتداء ملابس دافئة"
-            
+            response.raise_for_status()
+            self._alert = self._build_alert(response.json())
+            self._fetched_at = datetime.now()
+            self._failures = 0
+            self._open_until = None
         except Exception as e:
+            self._failures += 1
             logger.error(f"Weather API error: {e}")
-        
-        return None
+            if self._failures >= self.FAILURE_THRESHOLD:
+                self._open_until = datetime.now() + self.COOLDOWN
+                logger.warning(f"Weather circuit open for {self.COOLDOWN} after {self._failures} failures")
+
+    async def refresh_job(self, context: ContextTypes.DEFAULT_TYPE):
+        await self.refresh()
+
+    async def get_weather_alert(self):
+        """
+        يعيد التنبيه المخزن فوراً. إذا كانت البيانات قديمة يبدأ تحديثاً في الخلفية
+        (stale-while-revalidate) دون انتظاره.
+        """
+        if not self.api_key:
+            return None
+
+        if self._is_stale() and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self.refresh())
+        return self._alert
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
 # -----------------------
 # نظام الإشعارات المخصصة
 # -----------------------
 class NotificationManager:
+    DEFAULT_PREFERENCES = {
+        'morning_notifications': True,
+        'evening_notifications': True,
+        'weather_alerts': True,
+        'promotions': False
+    }
+
     def __init__(self):
-        self.user_preferences = {}
+        self.cache = WriteBehindCache(
+            "notification preferences", adb.get_notification_preferences, adb.save_notification_preferences
+        )
     
     def set_user_preferences(self, user_id, preferences):
-        self.user_preferences[user_id] = preferences
+        self.cache.put(user_id, preferences)
     
-    def get_user_preferences(self, user_id):
-        return self.user_preferences.get(user_id, {
-            'morning_notifications': True,
-            'evening_notifications': True,
-            'weather_alerts': True,
-            'promotions': False
-        })
+    async def get_user_preferences(self, user_id):
+        preferences = await self.cache.get(user_id)
+        return dict(preferences or self.DEFAULT_PREFERENCES)
+
+# -----------------------
+# نظام الإرسال الجماعي
+# -----------------------
+SendResult = namedtuple("SendResult", ["chat_id", "ok", "error"])
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class MessageDispatcher:
+    """
+    إرسال الرسائل بالتوازي مع احترام حدود Telegram:
+    ~30 رسالة/ثانية إجمالاً، ورسالة واحدة/ثانية لكل محادثة، مع انتظار RetryAfter.
+    """
+
+    GLOBAL_RATE = 30
+    PER_CHAT_RATE = 1
+    MAX_CONCURRENCY = 10
+    MAX_RETRIES = 3
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(self):
+        self._semaphore = None
+        self._global_bucket = TokenBucket(self.GLOBAL_RATE, self.GLOBAL_RATE)
+        self._chat_buckets = OrderedDict()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.pop(chat_id, None)
+        if bucket is None:
+            bucket = TokenBucket(self.PER_CHAT_RATE, 1)
+            if len(self._chat_buckets) >= self.MAX_CHAT_BUCKETS:
+                self._chat_buckets.popitem(last=False)
+        self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def send(self, bot, chat_id, text, **kwargs):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.MAX_CONCURRENCY)
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            # انتظار حد المحادثة قبل حجز مكان في السيمافور، حتى لا تشغل رسائل
+            # محادثة واحدة مزدحمة (مثل المشرف) كل الأماكن وتؤخر بقية المحادثات
+            await self._chat_bucket(chat_id).acquire()
+            async with self._semaphore:
+                await self._global_bucket.acquire()
+                try:
+                    await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                    return SendResult(chat_id, True, None)
+                except RetryAfter as e:
+                    retry_after = e.retry_after
+                    delay = retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after
+                    logger.warning(f"Flood limit for chat {chat_id}, retrying in {delay}s")
+                    if attempt == self.MAX_RETRIES:
+                        return SendResult(chat_id, False, e)
+                except Exception as e:
+                    return SendResult(chat_id, False, e)
+            await asyncio.sleep(delay)
+
+    async def send_many(self, bot, messages, **kwargs):
+        """إرسال رسائل مختلفة لعدة محادثات بالتوازي. messages: [(chat_id, text), ...]"""
+        return await asyncio.gather(*(self.send(bot, chat_id, text, **kwargs) for chat_id, text in messages))
+
+    async def broadcast(self, bot, chat_ids, text, **kwargs):
+        """إرسال نفس الرسالة لعدة محادثات بالتوازي."""
+        return await self.send_many(bot, [(chat_id, text) for chat_id in chat_ids], **kwargs)
+
+    def broadcast_in_background(self, application, chat_ids, text, description, **kwargs):
+        """
+        مثل broadcast لكن بدون انتظار: حد رسالة/ثانية لمحادثة المشرف لا يؤخر رد المريض
+        ولا يشغل أحد معالجات التحديثات المتوازية.
+        """
+        async def run():
+            self.log_results(await self.broadcast(application.bot, chat_ids, text, **kwargs), description)
+
+        return application.create_task(run())
+
+    @staticmethod
+    def log_results(results, description):
+        for result in results:
+            if result.ok:
+                logger.info(f"{description} sent to {result.chat_id}.")
+            else:
+                logger.error(f"Failed to send {description} to {result.chat_id}: {result.error}")
+
+# -----------------------
+# نظام جدولة التذكيرات
+# -----------------------
+class ReminderScheduler:
+    """مهمة run_once واحدة لكل حجز مؤكد، تُنفَّذ قبل الموعد بساعة."""
+
+    REMINDER_LEAD = timedelta(hours=1)
+
+    @staticmethod
+    def _job_name(user_id):
+        return f"reminder_{user_id}"
+
+    def schedule(self, job_queue, booking):
+        if job_queue is None or not booking or not booking.get('appointment_datetime'):
+            return
+        self.cancel(job_queue, booking['user_id'])
+
+        appointment = datetime.fromisoformat(str(booking['appointment_datetime']))
+        now = datetime.now()
+        if appointment <= now:
+            return
+        # إذا كان الموعد خلال أقل من ساعة، يُرسل التذكير فوراً
+        delay = max((appointment - self.REMINDER_LEAD - now).total_seconds(), 0)
+        job_queue.run_once(
+            send_reminder,
+            when=delay,
+            data=booking['id'],
+            chat_id=booking['user_id'],
+            name=self._job_name(booking['user_id']),
+        )
+        logger.info(f"Reminder for booking {booking['id']} scheduled in {int(delay)}s")
+
+    def cancel(self, job_queue, user_id):
+        if job_queue is None:
+            return
+        for job in job_queue.get_jobs_by_name(self._job_name(user_id)):
+            job.schedule_removal()
+
+    async def rebuild(self, job_queue):
+        """إعادة بناء جدول التذكيرات من قاعدة البيانات عند تشغيل البوت."""
+        if job_queue is None:
+            return
+        bookings = await adb.get_upcoming_confirmed_bookings()
+        for booking in bookings:
+            self.schedule(job_queue, booking)
+        logger.info(f"Rebuilt {len(bookings)} reminder jobs from the database")
 
 # -----------------------
 # إعدادات النظام
@@ -293,6 +604,10 @@ waiting_manager = WaitingListManager()
 user_data_manager = UserDataManager()
 weather_manager = WeatherManager()
 notification_manager = NotificationManager()
+reminder_scheduler = ReminderScheduler()
+dispatcher = MessageDispatcher()
+flood_control = FloodControl(exempt_ids=ADMIN_IDS)
+wal_shipper = backup.WalShipper() if backup.WAL_SHIPPING else None
 
 # تهيئة قاعدة البيانات
 db.init_database()
@@ -300,24 +615,105 @@ db.init_database()
 # -----------------------
 # وظائف المساعدة مع السمات
 # -----------------------
+# لوحات المفاتيح غير قابلة للتعديل في python-telegram-bot، لذا تُبنى مرة واحدة ويُعاد استخدامها
+_main_menu_cache = {}
+
 def main_menu_keyboard():
-    theme = theme_manager.get_theme_config()
-    icons = theme["icons"]
-    
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton(f"{icons['booking']} حجز موعد جديد", callback_data='book')],
-        [InlineKeyboardButton(f"{icons['info']} معلومات عن المركز", callback_data='about_center')],
-        [InlineKeyboardButton(f"{icons['video']} فيديو توضيحي", callback_data='video')],
-        [InlineKeyboardButton(f"{icons['instructions']} معلومات قبل التصوير", callback_data='before_imaging')],
-        [InlineKeyboardButton(f"{icons['location']} الموقع والتواصل", callback_data='location')],
-        [InlineKeyboardButton("📺 قناتنا على اليوتيوب", url='https://www.youtube.com/@amal-xray-center')],
-        [InlineKeyboardButton("قناتنا على الفيسبوك", url='https://www.facebook.com/amal.xray.center/')],
-        [InlineKeyboardButton(f"{icons['bookings']} حجوزاتي", callback_data='my_bookings')],
-        [InlineKeyboardButton("❓ الأسئلة الشائعة", callback_data='faq_menu')],
-        [InlineKeyboardButton("⚙️ تفضيلاتي", callback_data='user_preferences')],
-    ])
+    theme_name = theme_manager.current_theme
+    markup = _main_menu_cache.get(theme_name)
+    if markup is None:
+        icons = theme_manager.get_theme_config()["icons"]
+        markup = _main_menu_cache[theme_name] = InlineKeyboardMarkup([
+            [InlineKeyboardButton(f"{icons['booking']} حجز موعد جديد", callback_data='book')],
+            [InlineKeyboardButton(f"{icons['info']} معلومات عن المركز", callback_data='about_center')],
+            [InlineKeyboardButton(f"{icons['video']} فيديو توضيحي", callback_data='video')],
+            [InlineKeyboardButton(f"{icons['instructions']} معلومات قبل التصوير", callback_data='before_imaging')],
+            [InlineKeyboardButton(f"{icons['location']} الموقع والتواصل", callback_data='location')],
+            [InlineKeyboardButton("📺 قناتنا على اليوتيوب", url='https://www.youtube.com/@amal-xray-center')],
+            [InlineKeyboardButton("قناتنا على الفيسبوك", url='https://www.facebook.com/amal.xray.center/')],
+            [InlineKeyboardButton(f"{icons['bookings']} حجوزاتي", callback_data='my_bookings')],
+            [InlineKeyboardButton("❓ الأسئلة الشائعة", callback_data='faq_menu')],
+            [InlineKeyboardButton("⚙️ تفضيلاتي", callback_data='user_preferences')],
+        ])
+    return markup
+
+BACK_TO_MENU_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')]])
+BACK_TO_ADMIN_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data='admin_menu')]])
+
+ADMIN_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("👁️ عرض جميع الحجوزات", callback_data='admin_view')],
+    [InlineKeyboardButton("⏳ الحجوزات المعلقة", callback_data='admin_pending')],
+    [InlineKeyboardButton("📊 التقارير والإحصائيات", callback_data='admin_stats')],
+    [InlineKeyboardButton("⭐ التقييمات", callback_data='admin_ratings')],
+    [InlineKeyboardButton("📋 قائمة الانتظار", callback_data='admin_waiting_list')],
+    [InlineKeyboardButton("👥 بيانات المستخدمين", callback_data='admin_user_data')],
+    [InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')],
+])
+
+# الخدمات (اسم الخدمة كما يُحفظ في قاعدة البيانات، نص الزر)
+SERVICES = [
+    ("تصوير بانورامي", "📸 بانورامي"),
+    ("تصوير CBCT ثلاثي الأبعاد", "🦴 CBCT ثلاثي الأبعاد"),
+    ("تصوير الجيوب الأنفية", "👃 الجيوب الأنفية"),
+    ("تصوير مفصل الفك", "🦷 مفصل الفك"),
+    ("غير متأكد", "🩺 غير متأكد"),
+]
+
+# -----------------------
+# ترميز callback_data لمسار الحجز
+# -----------------------
+# رموز ASCII قصيرة بدل النصوص العربية (حد Telegram هو 64 بايت):
+# الخدمة برقمها في SERVICES، اليوم برقمه الترتيبي (date.toordinal)، والموعد برقم وحدة بدايته في TICK_LABELS.
+# مثال: s_1 ، d_739907 ، t_3
+SERVICE_TOKEN, DAY_TOKEN, SLOT_TOKEN = "s_", "d_", "t_"
+
+def _token_value(data, prefix):
+    value = data[len(prefix):]
+    if not data.startswith(prefix) or not value.isdigit():
+        raise ValueError(f"Invalid callback token: {data}")
+    return int(value)
+
+def encode_service(index):
+    return f"{SERVICE_TOKEN}{index}"
+
+def encode_day(day):
+    return f"{DAY_TOKEN}{day.toordinal()}"
+
+def encode_slot(tick):
+    return f"{SLOT_TOKEN}{tick}"
+
+def decode_service(data):
+    """s_{index} → اسم الخدمة كما يُحفظ في قاعدة البيانات"""
+    return SERVICES[_token_value(data, SERVICE_TOKEN)][0]
+
+def decode_day(data):
+    """d_{ordinal} → date"""
+    return date.fromordinal(_token_value(data, DAY_TOKEN))
+
+def decode_slot(data):
+    """t_{tick} → رقم وحدة بداية الموعد في TICK_LABELS"""
+    tick = _token_value(data, SLOT_TOKEN)
+    if tick >= db.START_TICKS:
+        raise ValueError(f"Invalid slot tick: {tick}")
+    return tick
+
+SERVICE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton(label, callback_data=encode_service(index))] for index, (_, label) in enumerate(SERVICES)
+])
+
+BOOKING_TYPE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⏰ عادي", callback_data='type_normal')],
+    [InlineKeyboardButton("⚠️ طارئ", callback_data='type_emergency')],
+])
+
+BACK_TO_FAQ_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع للأسئلة", callback_data='faq_menu')]])
+
+RATING_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⭐" * stars, callback_data=f"rate_{stars}")] for stars in range(1, 6)
+])
 
 def admin_only(func):
+    @functools.wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user_id = update.effective_user.id
         if user_id not in ADMIN_IDS:
@@ -357,27 +753,41 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # -----------------------
 async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = "🔐 **لوحة تحكم المشرف**\nاختر إجراءً:"
-    keyboard = [
-        [InlineKeyboardButton("👁️ عرض جميع الحجوزات", callback_data='admin_view')],
-        [InlineKeyboardButton("⏳ الحجوزات المعلقة", callback_data='admin_pending')],
-        [InlineKeyboardButton("📊 التقارير والإحصائيات", callback_data='admin_stats')],
-        [InlineKeyboardButton("⭐ التقييمات", callback_data='admin_ratings')],
-        [InlineKeyboardButton("📋 قائمة الانتظار", callback_data='admin_waiting_list')],
-        [InlineKeyboardButton("👥 بيانات المستخدمين", callback_data='admin_user_data')],
-        [InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')],
-    ]
     if update.callback_query:
-        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+        await update.callback_query.answer()
+        await update.callback_query.edit_message_text(text, reply_markup=ADMIN_MENU_KEYBOARD, parse_mode="Markdown")
     else:
-        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
-
-async def admin_view_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await update.message.reply_text(text, reply_markup=ADMIN_MENU_KEYBOARD, parse_mode="Markdown")
+
+ADMIN_PAGE_SIZE = 10
+
+def _encode_page_key(booking):
+    """(created_at, id) → نص قصير لـ callback_data مثل 20261018085309_42"""
+    digits = "".join(ch for ch in str(booking['created_at']) if ch.isdigit())
+    return f"{digits}_{booking['id']}"
+
+def _decode_page_key(token):
+    digits, booking_id = token.split("_")
+    if len(digits) != 14 or not digits.isdigit():
+        raise ValueError(f"Invalid page key: {token}")
+    d = digits
+    return f"{d[:4]}-{d[4:6]}-{d[6:8]} {d[8:10]}:{d[10:12]}:{d[12:]}", int(booking_id)
+
+def _describe_filters(filters):
+    parts = []
+    if filters.get('status'):
+        parts.append(f"الحالة: {filters['status']}")
+    if filters.get('date'):
+        parts.append(f"التاريخ: {filters['date']}")
+    if filters.get('service'):
+        parts.append(f"الخدمة: {filters['service']}")
+    return " | ".join(parts) if parts else "الكل"
+
+async def show_bookings_page(update: Update, context: ContextTypes.DEFAULT_TYPE, page_key=None, direction="next"):
+    """عرض صفحة واحدة من الحجوزات حسب المرشحات المحفوظة في user_data."""
     query = update.callback_query
-    await query.answer()
-    bookings = db.get_all_bookings()
-    if not bookings:
-        await query.edit_message_text("لا توجد حجوزات.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data='admin_menu')]]))
-        return
+    filters = context.user_data.get('admin_filters', {})
+    bookings, has_more = await adb.get_bookings_page(ADMIN_PAGE_SIZE, page_key, direction, **filters)
 
     keyboard = []
     for booking in bookings:
@@ -385,46 +795,120 @@ async def admin_view_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE
         name = booking.get('name', 'مجهول')
         time = booking.get('time', 'غير محدد')
         service = booking.get('service', 'غير محدد')
-        status = booking.get('status', 'غير محدد')
-        status_emoji = {"قيد الانتظار": "⏳", "مؤكد": "✅", "تم التصوير": "✔️", "لم يحضر": "❌"}.get(status, "📋")
+        status_emoji = STATUS_EMOJI.get(booking.get('status'), "📋")
         keyboard.append([InlineKeyboardButton(f"{status_emoji} {name} | {time} | {service}", callback_data=f"admin_edit_{uid}")])
+
+    if direction == "next":
+        has_prev, has_next = page_key is not None, has_more
+    else:
+        has_prev, has_next = has_more, True
+    navigation = []
+    if bookings and has_prev:
+        navigation.append(InlineKeyboardButton("⬅️ السابق", callback_data=f"admin_page_p_{_encode_page_key(bookings[0])}"))
+    if bookings and has_next:
+        navigation.append(InlineKeyboardButton("التالي ➡️", callback_data=f"admin_page_n_{_encode_page_key(bookings[-1])}"))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton("🔍 تصفية", callback_data='admin_filters')])
     keyboard.append([InlineKeyboardButton("🔙 رجوع", callback_data='admin_menu')])
-    await query.edit_message_text("اختر حجزًا للإدارة:", reply_markup=InlineKeyboardMarkup(keyboard))
+
+    text = "اختر حجزًا للإدارة:" if bookings else "لا توجد حجوزات."
+    await query.edit_message_text(
+        f"{text}\n🔍 {_describe_filters(filters)}",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def admin_view_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    context.user_data['admin_filters'] = {}
+    await show_bookings_page(update, context)
 
 async def admin_pending_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    bookings = db.get_pending_bookings()
-    if not bookings:
-        await query.edit_message_text("لا توجد حجوزات معلقة.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data='admin_menu')]]))
-        return
+    context.user_data['admin_filters'] = {'status': "قيد الانتظار"}
+    await show_bookings_page(update, context)
+
+def _page_args(payload):
+    """admin_page_{n|p}_{created_at}_{id} → (direction, page_key)"""
+    direction, token = payload.split("_", 1)
+    if direction not in ("n", "p"):
+        raise ValueError(direction)
+    return ("next" if direction == "n" else "prev"), _decode_page_key(token)
+
+async def admin_bookings_page(update: Update, context: ContextTypes.DEFAULT_TYPE, direction, page_key):
+    """أزرار التالي/السابق"""
+    query = update.callback_query
+    await query.answer()
+    await show_bookings_page(update, context, page_key, direction)
 
-    keyboard = []
-    for booking in bookings:
-        uid = booking.get('user_id')
-        name = booking.get('name', 'مجهول')
-        time = booking.get('time', 'غير محدد')
-        service = booking.get('service', 'غير محدد')
-        keyboard.append([InlineKeyboardButton(f"⏳ {name} | {time} | {service}", callback_data=f"admin_edit_{uid}")])
-    keyboard.append([InlineKeyboardButton("🔙 رجوع", callback_data='admin_menu')])
-    await query.edit_message_text("الحجوزات المعلقة (تحتاج تأكيد):", reply_markup=InlineKeyboardMarkup(keyboard))
+async def admin_filters_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    filters = context.user_data.get('admin_filters', {})
 
-async def admin_edit_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    def mark(selected):
+        return "✅ " if selected else ""
+
+    today = datetime.now().date()
+    dates = [("اليوم", today), ("غداً", today + timedelta(days=1))]
+    keyboard = [
+        [InlineKeyboardButton(f"{mark(filters.get('status') == status)}{STATUS_EMOJI[status]} {status}", callback_data=f"admin_filter_status_{code}")]
+        for code, status in STATUS_CODES.items()
+    ]
+    keyboard.append([
+        InlineKeyboardButton(f"{mark(filters.get('date') == day.strftime('%d/%m/%Y'))}📆 {label}", callback_data=f"admin_filter_date_{offset}")
+        for offset, (label, day) in enumerate(dates)
+    ])
+    keyboard.extend(
+        [InlineKeyboardButton(f"{mark(filters.get('service') == service)}{label}", callback_data=f"admin_filter_service_{index}")]
+        for index, (service, label) in enumerate(SERVICES)
+    )
+    keyboard.append([InlineKeyboardButton("♻️ إزالة المرشحات", callback_data='admin_view')])
+    keyboard.append([InlineKeyboardButton("🔙 رجوع للحجوزات", callback_data='admin_page_filtered')])
+    await query.edit_message_text("🔍 **تصفية الحجوزات**\nاختر مرشحاً (الضغط مرة أخرى يلغيه):", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+
+def _filter_args(payload):
+    """admin_filter_{status|date|service}_{code} → (kind, value)"""
+    kind, code = payload.split("_", 1)
+    if kind == "status":
+        return kind, STATUS_CODES[code]
+    if kind == "date":
+        # نفس صيغة strftime("%d/%m/%Y") بكلفة أقل (هذا أبطأ زر في التوجيه)
+        day = datetime.now().date() + timedelta(days=int(code))
+        return kind, f"{day.day:02d}/{day.month:02d}/{day.year}"
+    if kind == "service":
+        return kind, SERVICES[int(code)][0]
+    raise ValueError(kind)
+
+async def admin_set_filter(update: Update, context: ContextTypes.DEFAULT_TYPE, kind, value):
+    """تبديل المرشح ثم عرض الصفحة الأولى"""
     query = update.callback_query
     await query.answer()
-    try:
-        user_id = int(query.data.split("_")[-1])
-    except Exception:
-        await query.edit_message_text("خطأ: لم يتم تحديد الحجز.")
-        return
+    filters = context.user_data.setdefault('admin_filters', {})
+    if filters.get(kind) == value:
+        filters.pop(kind)
+    else:
+        filters[kind] = value
+    await show_bookings_page(update, context)
 
-    booking = db.get_booking(user_id)
+async def admin_filtered_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await show_bookings_page(update, context)
+
+async def admin_edit_booking(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id):
+    query = update.callback_query
+    await query.answer()
+
+    booking = await adb.get_booking(user_id)
     if not booking:
         await query.edit_message_text("الحجز غير موجود.")
         return
 
     status = booking.get('status', 'غير محدد')
-    status_emoji = {"قيد الانتظار": "⏳", "مؤكد": "✅", "تم التصوير": "✔️", "لم يحضر": "❌"}.get(status, "📋")
+    status_emoji = STATUS_EMOJI.get(status, "📋")
 
     text = (
         f"{status_emoji} **تفاصيل الحجز**\n\n"
@@ -449,92 +933,63 @@ async def admin_edit_booking(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
 
-async def admin_confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id):
     query = update.callback_query
     await query.answer()
-    try:
-        user_id = int(query.data.split("_")[-1])
-    except Exception:
-        await query.edit_message_text("حدث خطأ أثناء تأكيد الحجز.")
-        return
 
-    db.update_booking_status(user_id, "مؤكد")
+    await adb.update_booking_status(user_id, "مؤكد")
+    reminder_scheduler.schedule(context.job_queue, await adb.get_booking(user_id))
 
-    try:
-        await context.bot.send_message(
-            chat_id=user_id,
-            text=(
-                "✅ **تم تأكيد حجزك!**\n\n"
-                "تم تأكيد موعدك في مركز أمل. ننتظرك! 🌟\n\n"
-                "📝 سيتم تذكيرك قبل موعدك بساعة واحدة.\n\n"
-                "للاستفسار: 0569509093"
-            ),
-            parse_mode="Markdown"
-        )
-        logger.info(f"Confirmation message sent to user {user_id} for booking confirmation.")
-    except Exception as e:
-        logger.error(f"Failed to send confirmation to user {user_id}: {e}")
+    result = await dispatcher.send(
+        context.bot,
+        user_id,
+        "✅ **تم تأكيد حجزك!**\n\n"
+        "تم تأكيد موعدك في مركز أمل. ننتظرك! 🌟\n\n"
+        "📝 سيتم تذكيرك قبل موعدك بساعة واحدة.\n\n"
+        "للاستفسار: 0569509093",
+        parse_mode="Markdown"
+    )
+    dispatcher.log_results([result], "Booking confirmation")
 
     await query.edit_message_text("✅ تم تأكيد الحجز وإرسال إشعار للمريض.", parse_mode="Markdown")
 
-async def admin_set_status(update: Update, context: ContextTypes.DEFAULT_TYPE, new_status: str):
+async def admin_set_status(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id, new_status: str):
     query = update.callback_query
     await query.answer()
-    try:
-        user_id = int(query.data.split("_")[-1])
-    except Exception:
-        await query.edit_message_text("حدث خطأ أثناء تغيير الحالة.")
-        return
 
-    db.update_booking_status(user_id, new_status)
+    await adb.update_booking_status(user_id, new_status)
+    reminder_scheduler.cancel(context.job_queue, user_id)
 
     if new_status == "تم التصوير":
-        rating_buttons = [
-            [InlineKeyboardButton("⭐", callback_data=f"rate_1")],
-            [InlineKeyboardButton("⭐⭐", callback_data=f"rate_2")],
-            [InlineKeyboardButton("⭐⭐⭐", callback_data=f"rate_3")],
-            [InlineKeyboardButton("⭐⭐⭐⭐", callback_data=f"rate_4")],
-            [InlineKeyboardButton("⭐⭐⭐⭐⭐", callback_data=f"rate_5")]
-        ]
-        try:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=(
-                    "🌟 **شكراً لزيارتك مركز أمل!**\n\n"
-                    "نأمل أن تكون خدمتنا قد نالت رضاك.\n"
-                    "من فضلك، خذ لحظة لتقييمنا:"
-                ),
-                reply_markup=InlineKeyboardMarkup(rating_buttons),
-                parse_mode="Markdown"
-            )
-            logger.info(f"Rating request sent to user {user_id}.")
-        except Exception as e:
-            logger.error(f"Failed to send rating request to user {user_id}: {e}")
+        result = await dispatcher.send(
+            context.bot,
+            user_id,
+            "🌟 **شكراً لزيارتك مركز أمل!**\n\n"
+            "نأمل أن تكون خدمتنا قد نالت رضاك.\n"
+            "من فضلك، خذ لحظة لتقييمنا:",
+            reply_markup=RATING_KEYBOARD,
+            parse_mode="Markdown"
+        )
+        dispatcher.log_results([result], "Rating request")
 
     await query.edit_message_text(f"✅ تم التحديث إلى: **{new_status}**", parse_mode="Markdown")
 
-async def admin_confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id):
     query = update.callback_query
     await query.answer()
-    user_id = query.data.split("_")[-1]
     keyboard = [
         [InlineKeyboardButton("نعم، احذف", callback_data=f"admin_delete_{user_id}")],
         [InlineKeyboardButton("إلغاء", callback_data=f"admin_edit_{user_id}")]
     ]
     await query.edit_message_text("هل أنت متأكد من الحذف؟", reply_markup=InlineKeyboardMarkup(keyboard))
 
-async def admin_delete_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_delete_booking(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id):
     query = update.callback_query
     await query.answer()
-    try:
-        user_id = int(query.data.split("_")[-1])
-    except Exception:
-        await query.edit_message_text("حدث خطأ أثناء حذف الحجز.")
-        return
 
     logger.info(f"Admin is deleting booking for user {user_id}.")
-    booking = db.get_booking(user_id)
-    db.delete_booking(user_id)
+    await adb.delete_booking(user_id)
+    reminder_scheduler.cancel(context.job_queue, user_id)
 
     await query.edit_message_text("🗑️ تم الحذف بنجاح.", parse_mode="Markdown")
     logger.info(f"Booking for user {user_id} deleted successfully. Admin notified.")
@@ -543,15 +998,18 @@ async def admin_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    stats = db.get_statistics()
+    stats = await adb.get_statistics()
 
     text = (
         "📊 **إحصائيات المركز**\n\n"
         f"📋 إجمالي الحجوزات: {stats['bookings']['total_bookings']}\n"
+        f"📅 مواعيد اليوم: {stats['bookings']['today']}\n"
         f"⏳ قيد الانتظار: {stats['bookings']['pending']}\n"
         f"✅ مؤكدة: {stats['bookings']['confirmed']}\n"
         f"✔️ مكتملة: {stats['bookings']['completed']}\n"
-        f"❌ لم يحضر: {stats['bookings']['no_show']}\n\n"
+        f"❌ لم يحضر: {stats['bookings']['no_show']}\n"
+        f"🚫 ملغاة: {stats['bookings']['cancelled']}\n"
+        f"🔁 مرضى متكررون: {stats['bookings']['repeat_patients']}\n\n"
         "**الخدمات الأكثر طلباً:**\n"
     )
     for service in stats['services']:
@@ -563,19 +1021,18 @@ async def admin_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text += f"\n⭐ **متوسط التقييم:** {avg_rating:.2f}/5.0\n"
         text += f"📝 **عدد التقييمات:** {total_ratings}"
 
-    keyboard = [[InlineKeyboardButton("🔙 رجوع", callback_data='admin_menu')]]
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+    await query.edit_message_text(text, reply_markup=BACK_TO_ADMIN_KEYBOARD, parse_mode="Markdown")
 
 async def admin_view_ratings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    ratings = db.get_ratings()
+    ratings = await adb.get_ratings(limit=50)
     if not ratings:
         text = "لا توجد تقييمات بعد."
     else:
         text = "⭐ **التقييمات:**\n\n"
-        for rating in ratings[:50]:
+        for rating in ratings:
             stars = "⭐" * rating.get('stars', 0)
             name = rating.get('name', 'مجهول')
             fb = rating.get('feedback')
@@ -583,33 +1040,32 @@ async def admin_view_ratings(update: Update, context: ContextTypes.DEFAULT_TYPE)
             if fb:
                 text += f"💬 {fb}\n"
             text += "\n"
+        text += "📤 لتصدير كل التقييمات: /export ratings"
 
-    keyboard = [[InlineKeyboardButton("🔙 رجوع", callback_data='admin_menu')]]
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+    await query.edit_message_text(text, reply_markup=BACK_TO_ADMIN_KEYBOARD, parse_mode="Markdown")
 
 async def admin_waiting_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    waiting_list = waiting_manager.get_waiting_list()
+    waiting_list = await waiting_manager.get_waiting_list()
     if not waiting_list:
         text = "📋 **قائمة الانتظار فارغة**"
     else:
         text = "📋 **قائمة الانتظار الحالية:**\n\n"
-        for user_id, user_data in waiting_list.items():
-            wait_time = datetime.now() - user_data['timestamp']
-            text += f"👤 {user_data['name']}\n📞 {user_data['phone']}\n🦷 {user_data['service']}\n⏰ منذ {int(wait_time.total_seconds() / 60)} دقيقة\n\n"
+        now_utc = datetime.now(timezone.utc).replace(tzinfo=None)  # created_at مخزن بتوقيت UTC
+        for waiter in waiting_list:
+            wait_time = now_utc - datetime.fromisoformat(waiter['created_at'])
+            text += f"👤 {waiter['name']}\n📞 {waiter['phone']}\n🦷 {waiter['service']}\n⏰ منذ {int(wait_time.total_seconds() / 60)} دقيقة\n\n"
     
-    keyboard = [[InlineKeyboardButton("🔙 رجوع", callback_data='admin_menu')]]
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await query.edit_message_text(text, reply_markup=BACK_TO_ADMIN_KEYBOARD)
 
 async def admin_user_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
     # إحصائيات بيانات المستخدمين
-    total_users = len(user_data_manager.user_preferences)
-    frequent_users = sum(1 for data in user_data_manager.user_preferences.values() if data.get('booking_count', 0) > 1)
+    total_users, frequent_users = await user_data_manager.get_stats()
     
     text = (
         "👥 **إحصائيات المستخدمين**\n\n"
@@ -619,8 +1075,7 @@ async def admin_user_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "💡 **ملاحظة:** نظام حفظ البيانات يحسن تجربة المستخدم ويزيد من نسبة العودة"
     )
     
-    keyboard = [[InlineKeyboardButton("🔙 رجوع", callback_data='admin_menu')]]
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await query.edit_message_text(text, reply_markup=BACK_TO_ADMIN_KEYBOARD)
 
 # -----------------------
 # ADMIN ACCESS COMMAND
@@ -632,16 +1087,74 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     text = "🔐 **لوحة تحكم المشرف**\nاختر إجراءً:"
-    keyboard = [
-        [InlineKeyboardButton("👁️ عرض جميع الحجوزات", callback_data='admin_view')],
-        [InlineKeyboardButton("⏳ الحجوزات المعلقة", callback_data='admin_pending')],
-        [InlineKeyboardButton("📊 التقارير والإحصائيات", callback_data='admin_stats')],
-        [InlineKeyboardButton("⭐ التقييمات", callback_data='admin_ratings')],
-        [InlineKeyboardButton("📋 قائمة الانتظار", callback_data='admin_waiting_list')],
-        [InlineKeyboardButton("👥 بيانات المستخدمين", callback_data='admin_user_data')],
-        [InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')],
-    ]
-    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+    await update.message.reply_text(text, reply_markup=ADMIN_MENU_KEYBOARD, parse_mode="Markdown")
+
+@admin_only
+async def rebuild_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """إعادة حساب عدادات الإحصائيات وفهرس البحث من سجل الحجوزات والتقييمات."""
+    counters = await adb.rebuild_statistics()
+    indexed = await adb.rebuild_search_index()
+    logger.info(f"Statistics counters rebuilt by {update.effective_user.id}: {counters} counters, {indexed} bookings indexed")
+    await update.message.reply_text(f"✅ تمت إعادة حساب الإحصائيات ({counters} عداد) وفهرس البحث ({indexed} حجز).")
+
+@admin_only
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """البحث في الحجوزات بالاسم أو رقم الجوال أو ملاحظات التقييم: /find نص البحث"""
+    text = " ".join(context.args)
+    if not text.strip():
+        await update.message.reply_text(
+            "🔎 **البحث في الحجوزات**\n\n"
+            "`/find الاسم أو رقم الجوال أو كلمة من ملاحظات التقييم`\n"
+            "يكفي جزء من بداية الكلمة، مثال: `/find محم` أو `/find 0591`",
+            parse_mode="Markdown"
+        )
+        return
+
+    results = await adb.search_bookings(text)
+    if not results:
+        await update.message.reply_text(f"لا توجد حجوزات مطابقة لـ: {text}")
+        return
+
+    lines = [f"🔎 نتائج البحث عن: {text} ({len(results)})\n"]
+    keyboard = []
+    for booking in results:
+        status_emoji = STATUS_EMOJI.get(booking['status'], "📋")
+        current = "" if booking['is_current'] else " (حجز سابق)"
+        lines.append(f"{status_emoji} {booking['name']} | {booking['phone']} | {booking['date']} {booking['time']}{current}")
+        if booking['feedback']:
+            lines.append(f"   💬 {booking['feedback'][:100]}")
+        # الإدارة تعمل على الحجز الحالي للمستخدم فقط
+        if booking['is_current']:
+            keyboard.append([InlineKeyboardButton(
+                f"{status_emoji} {booking['name']} | {booking['time']}", callback_data=f"admin_edit_{booking['user_id']}"
+            )])
+    await update.message.reply_text(
+        "\n".join(lines),
+        reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None
+    )
+
+@admin_only
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تصدير الحجوزات أو التقييمات أو قائمة الانتظار كملف CSV/XLSX."""
+    try:
+        options = export.parse_export_args(context.args)
+    except ValueError as e:
+        # الرسالة تحتوي معامل المشرف كما كتبه؛ _ أو * فيه تكسر تحليل Markdown
+        await update.message.reply_text(f"❌ {escape_markdown(str(e))}\n\n{export.USAGE}", parse_mode="Markdown")
+        return
+
+    await update.message.reply_chat_action(ChatAction.UPLOAD_DOCUMENT)
+    spool, count, filename = await adb.run(export.write_export, **options)
+    with spool:
+        if count == 0:
+            await update.message.reply_text("لا توجد بيانات مطابقة للتصدير.")
+            return
+        # read_file_handle=False: httpx يرفع الملف من المقبض على أجزاء بدل قراءته كاملاً في الذاكرة
+        await update.message.reply_document(
+            document=InputFile(spool, filename=filename, read_file_handle=False),
+            caption=f"📤 {filename} — {count} سجل",
+        )
+    logger.info(f"Export {filename} ({count} rows) sent to {update.effective_user.id}")
 
 # -----------------------
 # نظام الحجز المحسن مع حفظ البيانات
@@ -651,9 +1164,9 @@ async def book_appointment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = update.effective_user.id
-    user_data = user_data_manager.get_user_data(user_id)
+    user_data = await user_data_manager.get_user_data(user_id)
     
-    if user_data_manager.has_previous_data(user_id):
+    if await user_data_manager.has_previous_data(user_id):
         # استخدام البيانات المحفوظة
         context.user_data['name'] = user_data['name']
         context.user_data['phone'] = user_data['phone']
@@ -677,22 +1190,16 @@ async def use_saved_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = update.effective_user.id
-    user_data = user_data_manager.get_user_data(user_id)
+    user_data = await user_data_manager.get_user_data(user_id)
     
     # تخطي إدخال الاسم والهاتف
-    keyboard = [
-        [InlineKeyboardButton("📸 بانورامي", callback_data='service_تصوير بانورامي')],
-        [InlineKeyboardButton("🦴 CBCT ثلاثي الأبعاد", callback_data='service_تصوير CBCT ثلاثي الأبعاد')],
-        [InlineKeyboardButton("👃 الجيوب الأنفية", callback_data='service_تصوير الجيوب الأنفية')],
-        [InlineKeyboardButton("🦷 مفصل الفك", callback_data='service_تصوير مفصل الفك')],
-        [InlineKeyboardButton("🩺 غير متأكد", callback_data='service_غير متأكد')],
-    ]
-    await query.edit_message_text("🔍 ما نوع التصوير المطلوب؟", reply_markup=InlineKeyboardMarkup(keyboard))
+    await query.edit_message_text("🔍 ما نوع التصوير المطلوب؟", reply_markup=SERVICE_KEYBOARD)
     return State.SERVICE
 
 async def get_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.callback_query:
         # إذا جاء من زر "تحديث البيانات"
+        await update.callback_query.answer()
         await update.callback_query.message.reply_text("🖊️ من فضلك، أدخل **اسمك الكامل**: 👤", parse_mode="Markdown")
     else:
         context.user_data['name'] = update.message.text.strip()
@@ -703,29 +1210,29 @@ async def get_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['phone'] = update.message.text.strip()
     
     # حفظ البيانات للمرة القادمة
-    user_data_manager.save_user_data(
+    await user_data_manager.save_user_data(
         update.effective_user.id,
         context.user_data['name'],
         context.user_data['phone']
     )
     
-    keyboard = [
-        [InlineKeyboardButton("📸 بانورامي", callback_data='service_تصوير بانورامي')],
-        [InlineKeyboardButton("🦴 CBCT ثلاثي الأبعاد", callback_data='service_تصوير CBCT ثلاثي الأبعاد')],
-        [InlineKeyboardButton("👃 الجيوب الأنفية", callback_data='service_تصوير الجيوب الأنفية')],
-        [InlineKeyboardButton("🦷 مفصل الفك", callback_data='service_تصوير مفصل الفك')],
-        [InlineKeyboardButton("🩺 غير متأكد", callback_data='service_غير متأكد')],
-    ]
-    await update.message.reply_text("🔍 ما نوع التصوير المطلوب؟", reply_markup=InlineKeyboardMarkup(keyboard))
+    await update.message.reply_text("🔍 ما نوع التصوير المطلوب؟", reply_markup=SERVICE_KEYBOARD)
     return State.SERVICE
 
 async def get_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    selected = query.data.replace('service_', '')
-    context.user_data['service'] = selected
+    try:
+        context.user_data['service'] = decode_service(query.data)
+    except (ValueError, IndexError):
+        logger.error(f"Unexpected callback data format: {query.data}")
+        await query.edit_message_text("❌ **حدث خطأ أثناء اختيار الخدمة. يرجى المحاولة مرة أخرى.**")
+        return ConversationHandler.END
+    return await show_available_days(update, context)
 
-    available_days = db.get_available_days_for_booking()
+async def show_available_days(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    available_days = await adb.get_available_days_for_booking(context.user_data.get('service'))
     if not available_days:
         # إذا لا توجد أيام متاحة، عرض خيار قائمة الانتظار
         keyboard = [
@@ -739,110 +1246,156 @@ async def get_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return State.WAITING_LIST
 
-    now = datetime.now()
-    current_weekday = now.weekday()
-    weekday_names = ["الاثنين", "الثلاثاء", "الأربعاء", "الخميس", "الجمعة", "السبت", "الأحد"]
-
     keyboard = []
-    for day_name in available_days:
-        if day_name not in weekday_names:
-            continue
-        target_weekday_num = weekday_names.index(day_name)
-        days_ahead = target_weekday_num - current_weekday
-        if days_ahead < 0:
-            days_ahead += 7
-        target_date = (now + timedelta(days=days_ahead)).date()
-        formatted_date = target_date.strftime("%d/%m/%Y")
-        button_text = f"{formatted_date} يوم {day_name}"
-        callback_data = f"day_{formatted_date}_{day_name}"
-        keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
+    for day_date in available_days:
+        button_text = f"{day_date.strftime('%d/%m/%Y')} يوم {db.WEEKDAY_NAMES[day_date.weekday()]}"
+        keyboard.append([InlineKeyboardButton(button_text, callback_data=encode_day(day_date))])
 
     await query.edit_message_text("📅 **اختر اليوم والتاريخ المناسب لك:**", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
     return State.DAY
 
 async def get_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
-    parts = query.data.split("_", 2)
-    if len(parts) < 3 or parts[0] != "day":
+    try:
+        selected_date = decode_day(query.data)
+    except (ValueError, OverflowError):  # fromordinal يرفع OverflowError لرقم كبير جداً
+        await query.answer()
         logger.error(f"Unexpected callback data format: {query.data}")
         await query.edit_message_text("❌ **حدث خطأ أثناء اختيار اليوم. يرجى المحاولة مرة أخرى.**")
         return ConversationHandler.END
-    selected_date_str = parts[1]
-    selected_day_name = parts[2]
 
-    context.user_data['day'] = selected_day_name
-    context.user_data['selected_date_str'] = selected_date_str
+    # زر قديم (يوم مضى) أو callback_data مصنوع ليوم خارج أيام الحجز
+    if not db.is_bookable(selected_date):
+        await query.answer("❌ هذا اليوم لم يعد متاحاً للحجز، يرجى اختيار يوم آخر.", show_alert=True)
+        return await show_available_days(update, context)
 
-    available_time_slots = db.get_available_time_slots_for_day(context.user_data['day'])
+    context.user_data['day_ordinal'] = selected_date.toordinal()
+    return await show_time_slots(update, context, selected_date)
+
+async def show_time_slots(update: Update, context: ContextTypes.DEFAULT_TYPE, selected_date, notice=None):
+    """
+    عرض أوقات اليوم؛ تجيب هي على الزر (query.answer)، لذا لا يجيب عليه المستدعي.
+    notice تنبيه يظهر للمريض مع القائمة (مثل سبب رفض اختياره السابق).
+    """
+    query = update.callback_query
+    day_name = db.WEEKDAY_NAMES[selected_date.weekday()]
+
+    service = context.user_data.get('service')
+    available_time_slots = await adb.get_available_time_slots_for_day(selected_date, update.effective_user.id, service)
     if not available_time_slots:
-        await query.edit_message_text(f"❌ **عذرًا، لا توجد أوقات متاحة لليوم {context.user_data['day']}**.\nيرجى اختيار يوم آخر.")
-        return await get_service(update, context)
+        # تنبيه بدل تعديل الرسالة، لأن قائمة الأيام تحل محلها فوراً
+        await query.answer(f"❌ عذرًا، لا توجد أوقات متاحة ليوم {day_name}. يرجى اختيار يوم آخر.", show_alert=True)
+        return await show_available_days(update, context)
+    await query.answer(notice, show_alert=notice is not None)
 
-    keyboard = []
+    # صف لكل ساعة فيه أوقات البداية المتاحة خلالها
+    rows = {}
     for slot in available_time_slots:
-        keyboard.append([InlineKeyboardButton(f"✅ {slot}", callback_data=f"time_{slot}")])
+        tick = db.TICK_INDEX[slot]
+        rows.setdefault(tick // db.TICKS_PER_HOUR, []).append(InlineKeyboardButton(slot, callback_data=encode_slot(tick)))
+    keyboard = list(rows.values())
 
+    duration, _ = db.service_profile(service)
     await query.edit_message_text(
-        f"⏰ **اختر الوقت المتاح في يوم {context.user_data['day']} ({selected_date_str}):**\n\n"
-        "✅ = متاح",
+        f"⏰ **اختر الوقت المتاح في يوم {day_name} ({selected_date.strftime('%d/%m/%Y')}):**\n\n"
+        f"⏱️ مدة الموعد: {duration * db.TICK_MINUTES} دقيقة",
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode="Markdown"
     )
     return State.TIME_SLOT
 
+async def end_expired_booking(query):
+    """إنهاء محادثة حجز لم تعد بياناتها صالحة (زر قديم، أو حالة محفوظة قبل التحديث)."""
+    await query.edit_message_text(
+        "❌ انتهت صلاحية هذا الحجز. يرجى البدء من جديد.",
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("📅 حجز موعد جديد", callback_data='book')]])
+    )
+    return ConversationHandler.END
+
 async def get_time_slot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
+    try:
+        tick = decode_slot(query.data)
+    except ValueError:
+        await query.answer()
+        logger.error(f"Unexpected callback data format: {query.data}")
+        await query.edit_message_text("❌ **حدث خطأ أثناء اختيار الوقت. يرجى المحاولة مرة أخرى.**")
+        return ConversationHandler.END
+
+    # زر وقت قديم، أو محادثة محفوظة بلا يوم مختار
+    if 'day_ordinal' not in context.user_data:
+        await query.answer()
+        return await end_expired_booking(query)
+
+    selected_date = date.fromordinal(context.user_data['day_ordinal'])
+    if not db.is_bookable(selected_date, tick):
+        if not db.is_bookable(selected_date):
+            await query.answer("⏰ هذا اليوم لم يعد متاحاً، يرجى اختيار يوم آخر.", show_alert=True)
+            return await show_available_days(update, context)
+        return await show_time_slots(update, context, selected_date, notice="⏰ هذا الوقت لم يعد متاحاً، يرجى اختيار وقت آخر.")
+
+    # حجز مؤقت للموعد حتى يؤكد المريض (ينتهي تلقائياً بعد SLOT_HOLD_SECONDS)
+    try:
+        await adb.hold_slot(selected_date, tick, update.effective_user.id, context.user_data.get('service'))
+    except db.SlotTakenError:
+        return await show_time_slots(update, context, selected_date,
+                                     notice="⏳ تم حجز هذا الوقت للتو من قبل مريض آخر، يرجى اختيار وقت آخر.")
+
     await query.answer()
-    time_slot = query.data.replace("time_", "")
-    context.user_data['time'] = time_slot
-    keyboard = [
-        [InlineKeyboardButton("⏰ عادي", callback_data='type_normal')],
-        [InlineKeyboardButton("⚠️ طارئ", callback_data='type_emergency')],
-    ]
-    await query.edit_message_text("🚨 هل هذا موعد **عادي** أم **طارئ**؟", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+    context.user_data['slot_tick'] = tick
+    await query.edit_message_text("🚨 هل هذا موعد **عادي** أم **طارئ**؟", reply_markup=BOOKING_TYPE_KEYBOARD, parse_mode="Markdown")
     return State.EMERGENCY
 
 async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     emergency_status = "طارئ" if query.data == 'type_emergency' else "عادي"
-    current_date = context.user_data.get('selected_date_str', datetime.now().strftime("%d/%m/%Y"))
     user_id = update.effective_user.id
 
-    appointment_datetime = None
+    # بيانات ناقصة، أو محادثة قديمة محفوظة لموعد مضى وقته
+    if ('day_ordinal' not in context.user_data or 'slot_tick' not in context.user_data
+            or not db.is_bookable(date.fromordinal(context.user_data['day_ordinal']), context.user_data['slot_tick'])):
+        return await end_expired_booking(query)
+
+    # قيم مكتوبة محفوظة من الخطوات السابقة، بدون أي تحليل للنصوص
+    selected_date = date.fromordinal(context.user_data['day_ordinal'])
+    tick = context.user_data['slot_tick']
+    day_name = db.WEEKDAY_NAMES[selected_date.weekday()]
+    time_label = db.TICK_LABELS[tick]
+    current_date = selected_date.strftime("%d/%m/%Y")
+    appointment_datetime = db.tick_datetime(selected_date, tick)
+
     try:
-        if context.user_data.get('selected_date_str') and context.user_data.get('time'):
-            selected_date_obj = datetime.strptime(context.user_data['selected_date_str'], "%d/%m/%Y")
-            time_str = context.user_data['time']
-            hour = int(time_str.split(":")[0])
-            if "مساءً" in time_str and hour != 12:
-                hour += 12
-            elif "صباحاً" in time_str and hour == 12:
-                hour = 0
-            appointment_datetime = selected_date_obj.replace(hour=hour, minute=0, second=0, microsecond=0)
-    except Exception as e:
-        logger.error(f"Error parsing appointment datetime: {e}")
-
-    db.create_booking(
-        user_id=user_id,
-        name=context.user_data.get('name', 'مجهول'),
-        phone=context.user_data.get('phone', '-'),
-        service=context.user_data.get('service', '-'),
-        day=context.user_data.get('day', '-'),
-        time=context.user_data.get('time', '-'),
-        date=current_date,
-        booking_type=emergency_status,
-        appointment_datetime=appointment_datetime
-    )
+        await adb.create_booking(
+            user_id=user_id,
+            name=context.user_data.get('name', 'مجهول'),
+            phone=context.user_data.get('phone', '-'),
+            service=context.user_data.get('service', '-'),
+            day=day_name,
+            time=time_label,
+            date=current_date,
+            booking_type=emergency_status,
+            appointment_datetime=appointment_datetime
+        )
+    except db.SlotTakenError:
+        logger.info(f"Slot {time_label} on {current_date} was taken before user {user_id} confirmed.")
+        await query.edit_message_text(
+            "❌ **عذرًا، تم حجز هذا الموعد للتو من قبل مريض آخر.**\n\n"
+            "يرجى البدء من جديد واختيار وقت آخر.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("📅 حجز موعد جديد", callback_data='book')]]),
+            parse_mode="Markdown"
+        )
+        return ConversationHandler.END
+    # الحجز الجديد يحل محل السابق، لذا يُلغى تذكير الحجز القديم
+    reminder_scheduler.cancel(context.job_queue, user_id)
 
     summary = (
         "🎊 **تم استلام طلب حجزك بنجاح!**\n\n"
         f"👤 الاسم: {context.user_data.get('name','-')}\n"
         f"📞 الجوال: {context.user_data.get('phone','-')}\n"
         f"🦷 الخدمة: {context.user_data.get('service','-')}\n"
-        f"📅 اليوم: {context.user_data.get('day','-')}\n"
-        f"⏰ الوقت: {context.user_data.get('time','-')}\n"
+        f"📅 اليوم: {day_name}\n"
+        f"⏰ الوقت: {time_label}\n"
         f"📆 التاريخ: {current_date}\n"
         f"🚨 النوع: {emergency_status}\n\n"
         "⏳ حجزك الآن **قيد المراجعة**\n"
@@ -851,26 +1404,22 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await query.message.reply_text(summary, parse_mode="Markdown")
 
-    for admin_id in ADMIN_IDS:
-        try:
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=(
-                    f"🔔 **حجز جديد {emergency_status}!**\n\n"
-                    f"👤 {context.user_data.get('name','-')}\n"
-                    f"📞 {context.user_data.get('phone','-')}\n"
-                    f"🦷 {context.user_data.get('service','-')}\n"
-                    f"📅 {context.user_data.get('day','-')} - {context.user_data.get('time','-')}\n"
-                    f"📆 {current_date}\n"
-                    f"🚨 {emergency_status}"
-                ),
-                parse_mode="Markdown"
-            )
-            logger.info(f"New booking notification sent to admin {admin_id}.")
-        except Exception as e:
-            logger.error(f"Failed to notify admin {admin_id}: {e}")
+    dispatcher.broadcast_in_background(
+        context.application,
+        ADMIN_IDS,
+        f"🔔 **حجز جديد {emergency_status}!**\n\n"
+        f"👤 {context.user_data.get('name','-')}\n"
+        f"📞 {context.user_data.get('phone','-')}\n"
+        f"🦷 {context.user_data.get('service','-')}\n"
+        f"📅 {day_name} - {time_label}\n"
+        f"📆 {current_date}\n"
+        f"🚨 {emergency_status}",
+        "New booking notification",
+        parse_mode="Markdown"
+    )
 
-    for k in ['name','phone','service','day','time','selected_date_str']:
+    # slot_index: رقم الموعد بالساعة من محادثات بدأت قبل نموذج الوحدات
+    for k in ['name','phone','service','day_ordinal','slot_tick','slot_index']:
         context.user_data.pop(k, None)
 
     return ConversationHandler.END
@@ -880,7 +1429,7 @@ async def join_waiting_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = update.effective_user.id
-    waiting_manager.add_to_waiting_list(user_id, context.user_data)
+    await waiting_manager.add_to_waiting_list(user_id, context.user_data)
     
     await query.edit_message_text(
         "✅ **تم إضافتك إلى قائمة الانتظار!**\n\n"
@@ -922,7 +1471,7 @@ async def handle_rating(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return State.RATING_FEEDBACK
 
-    db.save_rating(user_id, stars, None)
+    await adb.save_rating(user_id, stars, None)
     if stars == 5:
         await query.edit_message_text(
             "🌟 **5 نجوم! شكرًا جزيلاً!**\n\n"
@@ -937,18 +1486,15 @@ async def handle_rating(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode="Markdown"
         )
 
-    for admin_id in ADMIN_IDS:
-        try:
-            booking = db.get_booking(user_id)
-            name = booking['name'] if booking else update.effective_user.full_name or "مجهول"
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=f"⭐ **تقييم جديد!**\n\n👤 {name}\n⭐ {stars}/5",
-                parse_mode="Markdown"
-            )
-            logger.info(f"Rating notification sent to admin {admin_id} for user {user_id}, {stars} stars.")
-        except Exception as e:
-            logger.error(f"Failed to notify admin {admin_id} about rating: {e}")
+    booking = await adb.get_booking(user_id)
+    name = booking['name'] if booking else update.effective_user.full_name or "مجهول"
+    dispatcher.broadcast_in_background(
+        context.application,
+        ADMIN_IDS,
+        f"⭐ **تقييم جديد!**\n\n👤 {name}\n⭐ {stars}/5",
+        f"Rating notification for user {user_id} ({stars} stars)",
+        parse_mode="Markdown"
+    )
 
     context.user_data.pop('rating_stars', None)
     return ConversationHandler.END
@@ -958,7 +1504,7 @@ async def get_rating_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE
     stars = context.user_data.get('rating_stars', 3)
     user_id = update.effective_user.id
 
-    db.save_rating(user_id, stars, feedback)
+    await adb.save_rating(user_id, stars, feedback)
     logger.info(f"Rating with feedback saved for user {user_id}, {stars} stars: {feedback}")
 
     await update.message.reply_text(
@@ -969,23 +1515,18 @@ async def get_rating_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE
         parse_mode="Markdown"
     )
 
-    for admin_id in ADMIN_IDS:
-        try:
-            booking = db.get_booking(user_id)
-            name = booking['name'] if booking else update.effective_user.full_name or "مجهول"
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=(
-                    f"⚠️ **تقرير تقييم منخفض مع ملاحظات**\n\n"
-                    f"👤 {name}\n"
-                    f"⭐ {stars}/5\n\n"
-                    f"💬 **الملاحظات:**\n{feedback}"
-                ),
-                parse_mode="Markdown"
-            )
-            logger.info(f"Rating feedback sent to admin {admin_id} for user {user_id}, {stars} stars: {feedback}")
-        except Exception as e:
-            logger.error(f"Failed to notify admin {admin_id} about feedback: {e}")
+    booking = await adb.get_booking(user_id)
+    name = booking['name'] if booking else update.effective_user.full_name or "مجهول"
+    dispatcher.broadcast_in_background(
+        context.application,
+        ADMIN_IDS,
+        f"⚠️ **تقرير تقييم منخفض مع ملاحظات**\n\n"
+        f"👤 {name}\n"
+        f"⭐ {stars}/5\n\n"
+        f"💬 **الملاحظات:**\n{feedback}",
+        f"Rating feedback for user {user_id} ({stars} stars)",
+        parse_mode="Markdown"
+    )
 
     context.user_data.pop('rating_stars', None)
     return ConversationHandler.END
@@ -1008,8 +1549,7 @@ async def show_faq_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     faq_key = query.data.replace("faq_", "")
     answer = faq_manager.get_faq_answer(faq_key)
     
-    keyboard = [[InlineKeyboardButton("🔙 رجوع للأسئلة", callback_data='faq_menu')]]
-    await query.edit_message_text(answer, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+    await query.edit_message_text(answer, reply_markup=BACK_TO_FAQ_KEYBOARD, parse_mode="Markdown")
     return State.FAQ
 
 # -----------------------
@@ -1020,7 +1560,7 @@ async def user_preferences_menu(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     
     user_id = update.effective_user.id
-    preferences = notification_manager.get_user_preferences(user_id)
+    preferences = await notification_manager.get_user_preferences(user_id)
     
     keyboard = [
         [InlineKeyboardButton(
@@ -1055,7 +1595,7 @@ async def toggle_preference(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = update.effective_user.id
     preference_type = query.data.replace('toggle_', '')
-    preferences = notification_manager.get_user_preferences(user_id)
+    preferences = await notification_manager.get_user_preferences(user_id)
     
     preferences[preference_type] = not preferences[preference_type]
     notification_manager.set_user_preferences(user_id, preferences)
@@ -1065,238 +1605,296 @@ async def toggle_preference(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # -----------------------
 # نظام الإشعارات الذكية
 # -----------------------
+@metrics.track_job
 async def send_weather_alerts(context: ContextTypes.DEFAULT_TYPE):
     """إرسال تنبيهات الطقس للمستخدمين"""
     weather_alert = await weather_manager.get_weather_alert()
     if weather_alert:
         # الحصول على الحجوزات القادمة خلال 24 ساعة
-        upcoming_bookings = db.get_confirmed_bookings_for_reminders()
+        upcoming_bookings = await adb.get_confirmed_bookings_for_reminders()
         
-        for booking in upcoming_bookings:
-            user_prefs = notification_manager.get_user_preferences(booking['user_id'])
-            if user_prefs.get('weather_alerts', True):
-                try:
-                    await context.bot.send_message(
-                        chat_id=booking['user_id'],
-                        text=weather_alert,
-                        parse_mode="Markdown"
-                    )
-                    logger.info(f"Weather alert sent to user {booking['user_id']}")
-                except Exception as e:
-                    logger.error(f"Failed to send weather alert to user {booking['user_id']}: {e}")
+        recipients = [
+            booking['user_id'] for booking in upcoming_bookings
+            if (await notification_manager.get_user_preferences(booking['user_id'])).get('weather_alerts', True)
+        ]
+        results = await dispatcher.broadcast(context.bot, recipients, weather_alert, parse_mode="Markdown")
+        dispatcher.log_results(results, "Weather alert")
 
+@metrics.track_job
 async def notify_waiting_list_updates(context: ContextTypes.DEFAULT_TYPE):
     """التحقق من توفر أوقات جديدة وإشعار قائمة الانتظار"""
-    available_days = db.get_available_days_for_booking()
-    if available_days:
-        for day_name in available_days:
-            available_slots = db.get_available_time_slots_for_day(day_name)
-            if available_slots:
-                await waiting_manager.notify_waiting_users(context, day_name, available_slots)
-
-async def send_reminders(context: ContextTypes.DEFAULT_TYPE):
-    """إرسال تذكيرات المواعيد"""
-    bookings = db.get_confirmed_bookings_for_reminders()
-    for booking in bookings:
-        try:
-            await context.bot.send_message(
-                chat_id=booking['user_id'],
-                text=(
-                    f"🔔 **تذكير بموعدك!**\n\n"
-                    f"عزيزي/عزيزتي {booking['name']}\n\n"
-                    f"موعدك في مركز أمل خلال ساعة:\n"
-                    f"⏰ {booking['time']}\n"
-                    f"🦷 {booking['service']}\n\n"
-                    f"📍 نابلس - عسكر القديم - مقابل مخبز أبو عبده\n"
-                    f"📞 للاستفسار: 0569509093\n\n"
-                    f"ننتظرك! 🌟"
-                ),
-                parse_mode="Markdown"
-            )
-            logger.info(f"Reminder sent to user {booking['user_id']}")
-        except Exception as e:
-            logger.error(f"Failed to send reminder to user {booking['user_id']}: {e}")
+    await waiting_manager.notify_waiting_users(context)
+
+@metrics.track_job
+async def purge_expired_slot_holds(context: ContextTypes.DEFAULT_TYPE):
+    """تحرير المواعيد المحجوزة مؤقتاً التي لم يؤكدها أصحابها"""
+    purged = await adb.purge_expired_slot_holds()
+    if purged:
+        logger.info(f"Released {purged} expired slot holds.")
+
+@metrics.track_job
+async def backup_snapshot(context: ContextTypes.DEFAULT_TYPE):
+    """لقطة احتياطية مضغوطة للقاعدة (على خيط منفصل، بخطوات صغيرة لا تعطل الحجوزات)"""
+    generation = wal_shipper.generation if wal_shipper else None
+    result = await asyncio.to_thread(backup.create_snapshot, generation=generation)
+    logger.info(f"Backup snapshot {result.path}: {result.pages} pages, {result.size} bytes in {result.seconds:.2f}s")
+
+@metrics.track_job
+async def ship_wal(context: ContextTypes.DEFAULT_TYPE):
+    """شحن إطارات WAL الجديدة إلى مجلد النسخ الاحتياطي"""
+    await asyncio.to_thread(wal_shipper.ship)
+
+@metrics.track_job
+async def send_reminder(context: ContextTypes.DEFAULT_TYPE):
+    """إرسال تذكير موعد واحد (مهمة run_once من ReminderScheduler)"""
+    booking_id = context.job.data
+    user_id = context.job.chat_id
+    booking = await adb.get_booking(user_id)
+    if not booking or booking['id'] != booking_id:
+        return
+    if not await adb.mark_reminder_sent(booking_id):
+        return  # تم إرسال التذكير مسبقاً أو تغيرت حالة الحجز
+
+    result = await dispatcher.send(
+        context.bot,
+        user_id,
+        f"🔔 **تذكير بموعدك!**\n\n"
+        f"عزيزي/عزيزتي {booking['name']}\n\n"
+        f"موعدك في مركز أمل خلال ساعة:\n"
+        f"⏰ {booking['time']}\n"
+        f"🦷 {booking['service']}\n\n"
+        f"📍 نابلس - عسكر القديم - مقابل مخبز أبو عبده\n"
+        f"📞 للاستفسار: 0569509093\n\n"
+        f"ننتظرك! 🌟",
+        parse_mode="Markdown"
+    )
+    dispatcher.log_results([result], "Reminder")
 
 # -----------------------
 # General / UI / Misc handlers
 # -----------------------
-async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def about_center(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    data = query.data
-
-    if data == 'book':
-        return await book_appointment(update, context)
-    elif data == 'admin_menu':
-        return await admin_menu(update, context)
-    elif data == 'admin_view':
-        return await admin_view_bookings(update, context)
-    elif data == 'admin_pending':
-        return await admin_pending_bookings(update, context)
-    elif data == 'admin_stats':
-        return await admin_statistics(update, context)
-    elif data == 'admin_ratings':
-        return await admin_view_ratings(update, context)
-    elif data == 'admin_waiting_list':
-        return await admin_waiting_list(update, context)
-    elif data == 'admin_user_data':
-        return await admin_user_data(update, context)
-    elif data.startswith('admin_edit_'):
-        return await admin_edit_booking(update, context)
-    elif data.startswith('admin_confirm_delete_'):
-        return await admin_confirm_delete(update, context)
-    elif data.startswith('admin_delete_'):
-        return await admin_delete_booking(update, context)
-    elif data.startswith('admin_confirm_'):
-        return await admin_confirm_booking(update, context)
-    elif data.startswith('admin_set_done_'):
-        return await admin_set_status(update, context, "تم التصوير")
-    elif data.startswith('admin_set_absent_'):
-        return await admin_set_status(update, context, "لم يحضر")
-    elif data.startswith('service_'):
-        return await get_service(update, context)
-    elif data.startswith('type_'):
-        return await confirm_booking(update, context)
-    elif data.startswith('rate_'):
-        return await handle_rating(update, context)
-    elif data == 'faq_menu':
-        return await faq_menu(update, context)
-    elif data.startswith('faq_'):
-        return await show_faq_answer(update, context)
-    elif data == 'user_preferences':
-        return await user_preferences_menu(update, context)
-    elif data.startswith('toggle_'):
-        return await toggle_preference(update, context)
-    elif data == 'use_saved_data':
-        return await use_saved_data(update, context)
-    elif data == 'update_data':
-        return await get_name(update, context)
-    elif data == 'join_waiting_list':
-        return await join_waiting_list(update, context)
-    elif data == 'about_center':
-        text = (
-            "🏥 **مركز أمل للتصوير الشعاعي**\n\n"
-            "في مركز أمل نقدم لك أحدث تقنيات التصوير الشعاعي للأسنان والفكين، بدقة عالمية تضمن وضوح التفاصيل من أول مرة.\n\n"
-            "❌ **هل تعاني من تكرار التصوير بسبب ضعف الجودة؟**\n"
-            "✅ مع مركز أمل لن تحتاج لإعادة التصوير مرة أخرى!\n\n"
-            "**خدماتنا:**\n"
-            "• 🦴 تصوير CBCT ثلاثي الأبعاد بأحدث الأجهزة\n"
-            "• 📸 تصوير بانورامي دقيق يكشف كل التفاصيل\n"
-            "• 👃 تصوير الجيوب الأنفية\n"
-            "• 🦷 تصوير مفصل الفك\n\n"
-            "✨ نتائج موثوقة يعتمد عليها الأطباء عالمياً\n\n"
-            "📍 **الموقع:** نابلس - عسكر القديم - الشارع الرئيسي، مقابل مخبز أبو عبده\n"
-            "📞 **للحجز:** [0569509093](tel:+970569509093)"
-        )
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')]]), parse_mode="Markdown")
-        return ConversationHandler.END
-    elif data == 'video':
-        text = (
-            "🎥 **شاهد مركز أمل**\n\n"
-            "تفضل بمشاهدة قناتنا على اليوتيوب للتعرف على المركز وخدماتنا:\n\n"
-            "🔗 [قناة مركز أمل على اليوتيوب](https://youtube.com/@amal-xray-center)"
-        )
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')]]), parse_mode="Markdown", disable_web_page_preview=False)
-        return ConversationHandler.END
-    elif data == 'before_imaging':
-        text = (
-            "📋 **معلومات مهمة قبل التصوير**\n\n"
-            "للحصول على أفضل نتائج تصوير، يُرجى اتباع التعليمات التالية:\n\n"
-            "✅ **قبل الحضور:**\n"
-            "• لا حاجة للصيام قبل التصوير\n"
-            "• ارتدِ ملابس مريحة\n"
-            "• أحضر معك أي تصاوير سابقة (إن وجدت)\n\n"
-            "⚠️ **يُرجى إزالة:**\n"
-            "• المجوهرات والأقراط\n"
-            "• النظارات\n"
-            "• دبابيس الشعر المعدنية\n"
-            "• أطقم الأسنان المتحركة\n\n"
-            "👩‍⚕️ **للسيدات الحوامل:**\n"
-            "• يُرجى إخبار الفني قبل التصوير\n\n"
-            "📞 **لأي استفسار:** 0569509093"
-        )
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')]]), parse_mode="Markdown")
-        return ConversationHandler.END
-    elif data == 'location':
+    text = (
+        "🏥 **مركز أمل للتصوير الشعاعي**\n\n"
+        "في مركز أمل نقدم لك أحدث تقنيات التصوير الشعاعي للأسنان والفكين، بدقة عالمية تضمن وضوح التفاصيل من أول مرة.\n\n"
+        "❌ **هل تعاني من تكرار التصوير بسبب ضعف الجودة؟**\n"
+        "✅ مع مركز أمل لن تحتاج لإعادة التصوير مرة أخرى!\n\n"
+        "**خدماتنا:**\n"
+        "• 🦴 تصوير CBCT ثلاثي الأبعاد بأحدث الأجهزة\n"
+        "• 📸 تصوير بانورامي دقيق يكشف كل التفاصيل\n"
+        "• 👃 تصوير الجيوب الأنفية\n"
+        "• 🦷 تصوير مفصل الفك\n\n"
+        "✨ نتائج موثوقة يعتمد عليها الأطباء عالمياً\n\n"
+        "📍 **الموقع:** نابلس - عسكر القديم - الشارع الرئيسي، مقابل مخبز أبو عبده\n"
+        "📞 **للحجز:** [0569509093](tel:+970569509093)"
+    )
+    await query.edit_message_text(text, reply_markup=BACK_TO_MENU_KEYBOARD, parse_mode="Markdown")
+    return ConversationHandler.END
+
+async def show_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    text = (
+        "🎥 **شاهد مركز أمل**\n\n"
+        "تفضل بمشاهدة قناتنا على اليوتيوب للتعرف على المركز وخدماتنا:\n\n"
+        "🔗 [قناة مركز أمل على اليوتيوب](https://youtube.com/@amal-xray-center)"
+    )
+    await query.edit_message_text(text, reply_markup=BACK_TO_MENU_KEYBOARD, parse_mode="Markdown", disable_web_page_preview=False)
+    return ConversationHandler.END
+
+async def before_imaging_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    text = (
+        "📋 **معلومات مهمة قبل التصوير**\n\n"
+        "للحصول على أفضل نتائج تصوير، يُرجى اتباع التعليمات التالية:\n\n"
+        "✅ **قبل الحضور:**\n"
+        "• لا حاجة للصيام قبل التصوير\n"
+        "• ارتدِ ملابس مريحة\n"
+        "• أحضر معك أي تصاوير سابقة (إن وجدت)\n\n"
+        "⚠️ **يُرجى إزالة:**\n"
+        "• المجوهرات والأقراط\n"
+        "• النظارات\n"
+        "• دبابيس الشعر المعدنية\n"
+        "• أطقم الأسنان المتحركة\n\n"
+        "👩‍⚕️ **للسيدات الحوامل:**\n"
+        "• يُرجى إخبار الفني قبل التصوير\n\n"
+        "📞 **لأي استفسار:** 0569509093"
+    )
+    await query.edit_message_text(text, reply_markup=BACK_TO_MENU_KEYBOARD, parse_mode="Markdown")
+    return ConversationHandler.END
+
+async def show_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    text = (
+        "📍 **موقع مركز أمل**\n\n"
+        "**العنوان:**\n"
+        "نابلس - عسكر القديم - الشارع الرئيسي\n"
+        "مقابل مخبز أبو عبده\n\n"
+        "🕘 **ساعات العمل:**\n"
+        "من 9:00 صباحاً - 8:00 مساءً\n"
+        "جميع أيام الأسبوع\n\n"
+        "📞 **للحجز والاستفسار:**\n"
+        "[0569509093](tel:+970569509093)\n\n"
+        "🗺️ **خريطة الموقع:**\n"
+        "[افتح الموقع في خرائط Google](https://www.google.com/maps)"
+    )
+    await query.edit_message_text(text, reply_markup=BACK_TO_MENU_KEYBOARD, parse_mode="Markdown")
+    return ConversationHandler.END
+
+async def my_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    user_id = update.effective_user.id
+    booking = await adb.get_booking(user_id)
+
+    if not booking:
+        text = "**لا توجد حجوزات**\n\nليس لديك أي حجوزات حالياً.\nيمكنك حجز موعد جديد من القائمة الرئيسية."
+    else:
+        status = booking.get('status', 'غير محدد')
+        emoji = STATUS_EMOJI.get(status, "📋")
         text = (
-            "📍 **موقع مركز أمل**\n\n"
-            "**العنوان:**\n"
-            "نابلس - عسكر القديم - الشارع الرئيسي\n"
-            "مقابل مخبز أبو عبده\n\n"
-            "🕘 **ساعات العمل:**\n"
-            "من 9:00 صباحاً - 8:00 مساءً\n"
-            "جميع أيام الأسبوع\n\n"
-            "📞 **للحجز والاستفسار:**\n"
-            "[0569509093](tel:+970569509093)\n\n"
-            "🗺️ **خريطة الموقع:**\n"
-            "[افتح الموقع في خرائط Google](https://www.google.com/maps)"
+            f"{emoji} **حجزك الحالي**\n\n"
+            f"👤 الاسم: {booking.get('name','-')}\n"
+            f"📞 الجوال: {booking.get('phone','-')}\n"
+            f"🦷 نوع التصوير: {booking.get('service','-')}\n"
+            f"📅 اليوم: {booking.get('day','-')}\n"
+            f"⏰ الوقت: {booking.get('time','-')}\n"
+            f"📆 التاريخ: {booking.get('date','-')}\n"
+            f"🚨 النوع: {booking.get('type','-')}\n"
+            f"📊 الحالة: **{status}**\n\n"
         )
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')]]), parse_mode="Markdown")
-        return ConversationHandler.END
-    elif data == 'my_bookings':
-        user_id = update.effective_user.id
-        booking = db.get_booking(user_id)
+        if status == "قيد الانتظار":
+            text += "⏳ سيتم التواصل معك قريباً لتأكيد الموعد."
+        elif status == "مؤكد":
+            text += "✅ موعدك مؤكد! ننتظرك.\n📝 سيتم تذكيرك قبل موعدك بساعة."
+        elif status == "تم التصوير":
+            text += "✔️ تم إنجاز التصوير بنجاح. شكراً لزيارتك!"
 
-        if not booking:
-            text = "**لا توجد حجوزات**\n\nليس لديك أي حجوزات حالياً.\nيمكنك حجز موعد جديد من القائمة الرئيسية."
-        else:
-            status_emoji = {"قيد الانتظار": "⏳", "مؤكد": "✅", "تم التصوير": "✔️", "لم يحضر": "❌"}
-            status = booking.get('status', 'غير محدد')
-            emoji = status_emoji.get(status, "📋")
-            text = (
-                f"{emoji} **حجزك الحالي**\n\n"
-                f"👤 الاسم: {booking.get('name','-')}\n"
-                f"📞 الجوال: {booking.get('phone','-')}\n"
-                f"🦷 نوع التصوير: {booking.get('service','-')}\n"
-                f"📅 اليوم: {booking.get('day','-')}\n"
-                f"⏰ الوقت: {booking.get('time','-')}\n"
-                f"📆 التاريخ: {booking.get('date','-')}\n"
-                f"🚨 النوع: {booking.get('type','-')}\n"
-                f"📊 الحالة: **{status}**\n\n"
-            )
-            if status == "قيد الانتظار":
-                text += "⏳ سيتم التواصل معك قريباً لتأكيد الموعد."
-            elif status == "مؤكد":
-                text += "✅ موعدك مؤكد! ننتظرك.\n📝 سيتم تذكيرك قبل موعدك بساعة."
-            elif status == "تم التصوير":
-                text += "✔️ تم إنجاز التصوير بنجاح. شكراً لزيارتك!"
-
-        keyboard = []
-        if booking and booking.get('status') in ['قيد الانتظار', 'مؤكد']:
-            keyboard.append([InlineKeyboardButton("🗑️ إلغاء الحجز", callback_data='cancel_my_booking')])
-        keyboard.append([InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')])
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
-        return ConversationHandler.END
-    elif data == 'cancel_my_booking':
-        keyboard = [
-            [InlineKeyboardButton("نعم، إلغاء الحجز", callback_data='confirm_cancel_my_booking')],
-            [InlineKeyboardButton("لا، العودة", callback_data='my_bookings')]
-        ]
-        await query.edit_message_text(
-            "⚠️ **هل أنت متأكد من إلغاء حجزك؟**\n\nلن يمكنك التراجع عن هذا الإجراء.",
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode="Markdown"
-        )
-        return ConversationHandler.END
-    elif data == 'confirm_cancel_my_booking':
-        user_id = update.effective_user.id
-        db.delete_booking(user_id)
-        text = "✅ **تم إلغاء حجزك بنجاح**\n\nيمكنك حجز موعد جديد في أي وقت."
-        keyboard = [[InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')]]
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
-        return ConversationHandler.END
-    elif data == 'back':
-        theme = theme_manager.get_theme_config()
-        await query.edit_message_text(theme["welcome_message"], reply_markup=main_menu_keyboard(), parse_mode="Markdown")
-        return ConversationHandler.END
-    else:
-        await query.edit_message_text("جارٍ التحميل...", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')]]), parse_mode="Markdown")
-        return ConversationHandler.END
+    keyboard = []
+    if booking and booking.get('status') in ['قيد الانتظار', 'مؤكد']:
+        keyboard.append([InlineKeyboardButton("🗑️ إلغاء الحجز", callback_data='cancel_my_booking')])
+    keyboard.append([InlineKeyboardButton("🏠 العودة للقائمة", callback_data='back')])
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+    return ConversationHandler.END
+
+async def cancel_my_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    keyboard = [
+        [InlineKeyboardButton("نعم، إلغاء الحجز", callback_data='confirm_cancel_my_booking')],
+        [InlineKeyboardButton("لا، العودة", callback_data='my_bookings')]
+    ]
+    await query.edit_message_text(
+        "⚠️ **هل أنت متأكد من إلغاء حجزك؟**\n\nلن يمكنك التراجع عن هذا الإجراء.",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode="Markdown"
+    )
+    return ConversationHandler.END
+
+async def confirm_cancel_my_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    user_id = update.effective_user.id
+    await adb.delete_booking(user_id)
+    reminder_scheduler.cancel(context.job_queue, user_id)
+    text = "✅ **تم إلغاء حجزك بنجاح**\n\nيمكنك حجز موعد جديد في أي وقت."
+    await query.edit_message_text(text, reply_markup=BACK_TO_MENU_KEYBOARD, parse_mode="Markdown")
+    return ConversationHandler.END
+
+async def back_to_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    theme = theme_manager.get_theme_config()
+    await query.edit_message_text(theme["welcome_message"], reply_markup=main_menu_keyboard(), parse_mode="Markdown")
+    return ConversationHandler.END
+
+async def unknown_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text("جارٍ التحميل...", reply_markup=BACK_TO_MENU_KEYBOARD, parse_mode="Markdown")
+    return ConversationHandler.END
+
+
+async def invalid_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text("حدث خطأ في معالجة الطلب.", reply_markup=BACK_TO_MENU_KEYBOARD)
+    return ConversationHandler.END
+
+# -----------------------
+# موجه الأزرار (callback_data → معالج)
+# -----------------------
+def _user_id_arg(payload):
+    return (int(payload),)
+
+callback_router = CallbackRouter(ADMIN_IDS, fallback=unknown_callback, on_invalid=invalid_callback)
+
+# أزرار المرضى
+for key, handler in (
+    ('book', book_appointment),
+    ('faq_menu', faq_menu),
+    ('user_preferences', user_preferences_menu),
+    ('use_saved_data', use_saved_data),
+    ('update_data', get_name),
+    ('join_waiting_list', join_waiting_list),
+    ('about_center', about_center),
+    ('video', show_video),
+    ('before_imaging', before_imaging_info),
+    ('location', show_location),
+    ('my_bookings', my_bookings),
+    ('cancel_my_booking', cancel_my_booking),
+    ('confirm_cancel_my_booking', confirm_cancel_my_booking),
+    ('back', back_to_main_menu),
+):
+    callback_router.exact(key, handler)
+
+# هذه المعالجات تقرأ query.data بنفسها لأنها تُستخدم أيضاً داخل ConversationHandler
+for prefix, handler in (
+    (SERVICE_TOKEN, get_service),
+    ('type_', confirm_booking),
+    ('rate_', handle_rating),
+    ('faq_', show_faq_answer),
+    ('toggle_', toggle_preference),
+):
+    callback_router.prefix(prefix, handler)
+
+# أزرار المشرف
+for key, handler in (
+    ('admin_menu', admin_menu),
+    ('admin_view', admin_view_bookings),
+    ('admin_pending', admin_pending_bookings),
+    ('admin_stats', admin_statistics),
+    ('admin_ratings', admin_view_ratings),
+    ('admin_waiting_list', admin_waiting_list),
+    ('admin_user_data', admin_user_data),
+    ('admin_filters', admin_filters_menu),
+    ('admin_page_filtered', admin_filtered_bookings),
+):
+    callback_router.exact(key, handler, admin=True)
+
+callback_router.prefix('admin_page_', admin_bookings_page, parse=_page_args, admin=True)
+callback_router.prefix('admin_filter_', admin_set_filter, parse=_filter_args, admin=True)
+callback_router.prefix('admin_edit_', admin_edit_booking, parse=_user_id_arg, admin=True)
+callback_router.prefix('admin_confirm_delete_', admin_confirm_delete, parse=_user_id_arg, admin=True)
+callback_router.prefix('admin_delete_', admin_delete_booking, parse=_user_id_arg, admin=True)
+callback_router.prefix('admin_confirm_', admin_confirm_booking, parse=_user_id_arg, admin=True)
+callback_router.prefix('admin_set_done_', functools.partial(admin_set_status, new_status="تم التصوير"),
+                       parse=_user_id_arg, admin=True)
+callback_router.prefix('admin_set_absent_', functools.partial(admin_set_status, new_status="لم يحضر"),
+                       parse=_user_id_arg, admin=True)
+
+async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    return await callback_router.dispatch(update, context)
 
 # -----------------------
 # Cancel handler util
 # -----------------------
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await adb.release_slot_hold(update.effective_user.id)
     if update.message:
         await update.message.reply_text("تم الإلغاء.")
     elif update.callback_query:
@@ -1307,25 +1905,101 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # -----------------------
 # Main: register handlers and run
 # -----------------------
-def main():
-    application = Application.builder().token(BOT_TOKEN).build()
+metrics_server = None
 
-
-# Job queue للمهام المجدولة (إذا كان متاحاً)
+async def on_startup(application: Application):
+    """إعادة جدولة تذكيرات الحجوزات المؤكدة وتشغيل خادم /metrics عند تشغيل البوت"""
+    global metrics_server
+    await reminder_scheduler.rebuild(application.job_queue)
+    try:
+        metrics_server = await metrics.start_server()
+    except OSError as e:
+        logger.error(f"Could not start metrics server: {e}")
+
+async def on_stop(application: Application):
+    """إكمال التحديثات المقبولة في OrderedUpdateProcessor قبل إغلاق اتصال Bot API"""
+    processor = application.update_processor
+    if isinstance(processor, OrderedUpdateProcessor):
+        await processor.join()
+
+async def on_shutdown(application: Application):
+    """حفظ التغييرات المعلقة ثم إيقاف خيوط قاعدة البيانات وإغلاق اتصالاتها عند إيقاف البوت"""
+    if metrics_server:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+    await weather_manager.close()
+    await user_data_manager.cache.flush()
+    await notification_manager.cache.flush()
+    if wal_shipper:
+        # آخر شحنة قبل إغلاق الاتصالات (إغلاق آخر اتصال ينقل WAL إلى ملف القاعدة ويحذفه)
+        await asyncio.to_thread(wal_shipper.ship)
+        wal_shipper.close()
+    adb.shutdown()
+
+def build_application(token=None, base_url=None, concurrent_updates=None):
+    """
+    إنشاء Application بإعدادات البوت. base_url يسمح بتوجيه طلبات Bot API
+    لخادم آخر (مثل الخادم المحلي في benchmarks/bench_load.py).
+    """
+    concurrent_updates = concurrent_updates or CONCURRENT_UPDATES
+    builder = (
+        Application.builder()
+        .token(token or BOT_TOKEN)
+        .request(metrics.InstrumentedRequest(connection_pool_size=256))
+        .persistence(SQLitePersistence())
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    if concurrent_updates > 1:
+        # محادثات مختلفة بالتوازي، ونفس المحادثة بالترتيب؛ update_queue محدود حتى يتوقف
+        # Updater عن الجلب عندما يمتلئ المعالج (ضغط عكسي حتى Telegram)
+        # الحد من الإغراق داخل المعالج: التحديث المُهمل لا يدخل أي طابور
+        processor = OrderedUpdateProcessor(concurrent_updates, flood_control=flood_control)
+        builder = builder.concurrent_updates(processor).update_queue(asyncio.Queue(maxsize=processor.max_pending))
+    return builder.build()
+
+def register_jobs(application):
+    """المهام المجدولة (إذا كان JobQueue متاحاً)"""
     job_queue = application.job_queue
     if job_queue:
-        # التذكيرات الأساسية (كل 5 دقائق)
-        job_queue.run_repeating(send_reminders, interval=300, first=10)
-        
+        # التذكيرات تُجدول لكل حجز على حدة عبر ReminderScheduler (انظر on_startup)
+
+        # تحديث ذاكرة الطقس المؤقتة في الخلفية
+        job_queue.run_repeating(
+            metrics.track_job(weather_manager.refresh_job, "weather_refresh"),
+            interval=WeatherManager.CACHE_TTL.total_seconds(),
+            first=1,
+        )
+
+        # حفظ بيانات المستخدمين وتفضيلاتهم على دفعات
+        for cache in (user_data_manager.cache, notification_manager.cache):
+            job_queue.run_repeating(
+                metrics.track_job(cache.flush_job, f"{cache.name.replace(' ', '_')}_flush"),
+                interval=WriteBehindCache.FLUSH_INTERVAL,
+                first=WriteBehindCache.FLUSH_INTERVAL,
+            )
+
         # تنبيهات الطقس (كل 6 ساعات)
         job_queue.run_repeating(send_weather_alerts, interval=21600, first=60)
         
+        # تحرير الحجوزات المؤقتة المنتهية (كل دقيقة)
+        job_queue.run_repeating(purge_expired_slot_holds, interval=60, first=60)
+
+        # النسخ الاحتياطي: لقطة بعد التشغيل بدقيقة ثم كل BACKUP_INTERVAL_SECONDS
+        if backup.BACKUP_INTERVAL > 0:
+            job_queue.run_repeating(backup_snapshot, interval=backup.BACKUP_INTERVAL, first=60)
+        if wal_shipper:
+            job_queue.run_repeating(ship_wal, interval=backup.WAL_SHIP_INTERVAL, first=backup.WAL_SHIP_INTERVAL)
+
         # تحديث قائمة الانتظار (كل 30 دقيقة)
         job_queue.run_repeating(notify_waiting_list_updates, interval=1800, first=120)
     else:
         print("⚠️ JobQueue not available - scheduled tasks disabled")
 
-
+def register_handlers(application):
     # ConversationHandler للحجز الأساسي
     booking_conv = ConversationHandler(
         entry_points=[CallbackQueryHandler(book_appointment, pattern='^book$')],
@@ -1336,13 +2010,15 @@ def main():
                 CallbackQueryHandler(get_name, pattern='^update_data$')
             ],
             State.PHONE: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_phone)],
-            State.SERVICE: [CallbackQueryHandler(get_service, pattern='^service_')],
-            State.DAY: [CallbackQueryHandler(get_day, pattern='^day_')],
-            State.TIME_SLOT: [CallbackQueryHandler(get_time_slot, pattern='^time_')],
+            State.SERVICE: [CallbackQueryHandler(get_service, pattern=f'^{SERVICE_TOKEN}\\d+$')],
+            State.DAY: [CallbackQueryHandler(get_day, pattern=f'^{DAY_TOKEN}\\d+$')],
+            State.TIME_SLOT: [CallbackQueryHandler(get_time_slot, pattern=f'^{SLOT_TOKEN}\\d+$')],
             State.EMERGENCY: [CallbackQueryHandler(confirm_booking, pattern='^type_')],
             State.WAITING_LIST: [CallbackQueryHandler(join_waiting_list, pattern='^join_waiting_list$')],
         },
         fallbacks=[CommandHandler('cancel', cancel_command)],
+        name='booking_conv',
+        persistent=True,
     )
 
     # ConversationHandler للتقييم
@@ -1352,6 +2028,8 @@ def main():
             State.RATING_FEEDBACK: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_rating_feedback)],
         },
         fallbacks=[CommandHandler('cancel', cancel_command)],
+        name='rating_conv',
+        persistent=True,
     )
 
     # ConversationHandler للأسئلة الشائعة
@@ -1361,6 +2039,8 @@ def main():
             State.FAQ: [CallbackQueryHandler(show_faq_answer, pattern='^faq_')],
         },
         fallbacks=[CommandHandler('cancel', cancel_command)],
+        name='faq_conv',
+        persistent=True,
     )
 
     # ConversationHandler لتفضيلات المستخدم
@@ -1370,11 +2050,16 @@ def main():
             State.USER_PREFERENCES: [CallbackQueryHandler(toggle_preference, pattern='^toggle_')],
         },
         fallbacks=[CommandHandler('cancel', cancel_command)],
+        name='preferences_conv',
+        persistent=True,
     )
 
     # Register handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("admin", admin_command))
+    application.add_handler(CommandHandler("rebuild_stats", rebuild_stats_command))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("find", find_command))
     application.add_handler(booking_conv)
     application.add_handler(rating_conv)
     application.add_handler(faq_conv)
@@ -1383,6 +2068,19 @@ def main():
     # Generic CallbackQuery router for buttons
     application.add_handler(CallbackQueryHandler(button_handler))
 
+    # قياس زمن كل المعالجات المسجلة أعلاه
+    metrics.instrument_handlers(application)
+
+    # بدون OrderedUpdateProcessor (CONCURRENT_UPDATES=1) يُفحص الإغراق قبل كل المعالجات
+    # (المجموعة -1)؛ يُسجل بعد القياس لأن ApplicationHandlerStop الذي يرفعه ليس خطأً في معالج
+    if not isinstance(application.update_processor, OrderedUpdateProcessor):
+        application.add_handler(TypeHandler(Update, flood_control.check_update), group=-1)
+
+def main():
+    application = build_application()
+    register_jobs(application)
+    register_handlers(application)
+
     # تحديد وضع التشغيل بناءً على البيئة
     PORT = int(os.getenv('PORT', 8000))
     RENDER_EXTERNAL_URL = os.getenv('RENDER_EXTERNAL_URL')
@@ -1395,7 +2093,8 @@ def main():
             port=PORT,
             url_path=BOT_TOKEN,
             webhook_url=f"{RENDER_EXTERNAL_URL}/{BOT_TOKEN}",
-            drop_pending_updates=True
+            # الحالة محفوظة في قاعدة البيانات، فنكمل معالجة ما وصل أثناء إعادة التشغيل
+            drop_pending_updates=False
         )
     else:
         # وضع Polling للتطوير المحلي
@@ -1,44 +1,173 @@
 import sqlite3
 import os
-from datetime import datetime, timedelta
+import re
+import threading
+from datetime import datetime, timedelta, time as dt_time
 from contextlib import contextmanager
 
-DB_PATH = "bookings.db"
+DB_PATH = os.getenv("DB_PATH", "bookings.db")
+
+# المواعيد اليومية (موعد كل ساعة من 9 صباحاً حتى 8 مساءً)
+TIME_SLOTS = [
+    "9:00 صباحاً", "10:00 صباحاً", "11:00 صباحاً",
+    "12:00 ظهراً", "1:00 مساءً", "2:00 مساءً",
+    "3:00 مساءً", "4:00 مساءً", "5:00 مساءً",
+    "6:00 مساءً", "7:00 مساءً", "8:00 مساءً"
+]
+SLOT_HOURS = list(range(9, 21))  # ساعة كل موعد بنظام 24 ساعة، بنفس ترتيب TIME_SLOTS
+
+# نموذج السعة: اليوم مقسم إلى وحدات من TICK_MINUTES دقيقة، وكل حجز يشغل جهازاً واحداً
+# لعدد وحدات متتالية حسب مدة خدمته، فتعمل الأجهزة بالتوازي ويبدأ الموعد عند أي وحدة
+TICK_MINUTES = 15
+TICKS_PER_HOUR = 60 // TICK_MINUTES
+DAY_TICKS = len(SLOT_HOURS) * TICKS_PER_HOUR
+ALL_TICKS_MASK = (1 << DAY_TICKS) - 1
+# آخر بداية موعد 8:00 مساءً كما في ساعات العمل؛ وحدات ما بعدها لإكمال مواعيد تلك الساعة فقط
+START_TICKS = (len(SLOT_HOURS) - 1) * TICKS_PER_HOUR + 1
+START_TICKS_MASK = (1 << START_TICKS) - 1
+
+def _tick_label(tick):
+    hour, minute = SLOT_HOURS[0] + tick // TICKS_PER_HOUR, tick % TICKS_PER_HOUR * TICK_MINUTES
+    period = "صباحاً" if hour < 12 else "ظهراً" if hour == 12 else "مساءً"
+    return f"{(hour - 1) % 12 + 1}:{minute:02d} {period}"
+
+# أسماء بدايات المواعيد (بداية كل ساعة تطابق TIME_SLOTS، فتبقى الحجوزات القديمة صالحة)
+TICK_LABELS = [_tick_label(tick) for tick in range(DAY_TICKS)]
+TICK_INDEX = {label: tick for tick, label in enumerate(TICK_LABELS)}
+
+# أجهزة المركز؛ لإضافة جهاز ثانٍ من نفس النوع يُضاف بمعرف جديد (مثل "cbct-2") في خدماته
+DEVICES = ("panoramic", "cbct")
+
+# مدة كل خدمة بالوحدات (من أوقات الأسئلة الشائعة مع وقت التجهيز) والأجهزة التي تؤديها،
+# بترتيب التفضيل: الجهاز الأقل قدرة أولاً حتى يبقى CBCT متاحاً لما لا يؤديه غيره
+SERVICE_PROFILES = {
+    "تصوير بانورامي": (1, ("panoramic", "cbct")),
+    "تصوير CBCT ثلاثي الأبعاد": (2, ("cbct",)),
+    "تصوير الجيوب الأنفية": (1, ("panoramic", "cbct")),
+    "تصوير مفصل الفك": (1, ("panoramic", "cbct")),
+}
+# "غير متأكد" أو خدمة غير معروفة: أطول مدة على الجهاز الذي يؤدي كل الخدمات
+DEFAULT_SERVICE_PROFILE = (2, ("cbct",))
+
+WEEKDAY_NAMES = ["الاثنين", "الثلاثاء", "الأربعاء", "الخميس", "الجمعة", "السبت", "الأحد"]
+BOOKING_HORIZON_DAYS = 7  # عدد الأيام المعروضة للحجز بدءاً من اليوم
+WAITING_LIST_WINDOW_DAYS = 14  # المدة التي ينتظر فيها المريض في قائمة الانتظار
+
+# الحالات التي لا تشغل الموعد
+RELEASED_STATUSES = ('لم يحضر', 'ملغي', 'تم التصوير')
+
+# مدة حجز الموعد مؤقتاً بين اختيار الوقت وتأكيد الحجز
+SLOT_HOLD_SECONDS = int(os.getenv("SLOT_HOLD_SECONDS", 300))
+
+BOOKINGS_SCHEMA = """
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    service TEXT NOT NULL,
+    day TEXT NOT NULL,
+    time TEXT NOT NULL,
+    date TEXT NOT NULL,
+    type TEXT NOT NULL,
+    status TEXT DEFAULT 'قيد الانتظار',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    appointment_datetime TEXT,
+    reminder_sent_at TIMESTAMP,
+    is_current INTEGER NOT NULL DEFAULT 1
+"""
+
+class SlotTakenError(Exception):
+    """يُرفع عند محاولة حجز موعد محجوز مسبقاً في جدول التقويم."""
+
+# إعدادات مجمع الاتصالات
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))
+STATEMENT_CACHE_SIZE = 256
+
+# جداول حفظ user_data و chat_data الخاصة بالبوت
+PERSISTED_DATA_TABLES = ('persisted_user_data', 'persisted_chat_data')
+
+# مع شحن WAL (backup.py) لا تجري نقاط التفتيش إلا من الشاحن، فيُعطل التفتيش التلقائي
+WAL_SHIPPING = os.getenv("BACKUP_WAL_SHIPPING") == "1"
+WAL_AUTOCHECKPOINT = 0 if WAL_SHIPPING else 1000
+
+# اتصال واحد طويل العمر لكل خيط، يُفتح مرة واحدة ويُعاد استخدامه
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0  # يزداد عند إغلاق المجمع ليعيد كل خيط فتح اتصاله
+
+def _open_connection():
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,  # للسماح بإغلاقه من خيط الإيقاف
+    )
+    conn.row_factory = sqlite3.Row  # لتمكين الوصول بالاسم مثل dict
+    # WAL يسمح للقراء بالعمل أثناء وجود كاتب، و NORMAL كافٍ مع WAL لضمان سلامة البيانات
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA wal_autocheckpoint={WAL_AUTOCHECKPOINT}")
+    # دوال التطبيع لـ rebuild_search_index (الكتابة العادية تطبّع في Python، انظر _index_booking)
+    conn.create_function("search_text", 1, search_text, deterministic=True)
+    conn.create_function("phone_search_text", 1, phone_search_text, deterministic=True)
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
 
 @contextmanager
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row  # لتمكين الوصول بالاسم مثل dict
+    """
+    يعيد اتصال الخيط الحالي من المجمع (ويفتحه عند أول استخدام).
+    الاستدعاءات المتداخلة تشارك نفس المعاملة ولا يتم الحفظ إلا عند الخروج من الخارجية.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = _local.conn = _open_connection()
+        _local.generation = _generation
+        _local.depth = 0
+
+    outermost = _local.depth == 0
+    _local.depth += 1
     try:
         yield conn
-        conn.commit()
+        if outermost:
+            conn.commit()
     except Exception as e:
-        conn.rollback()
+        if outermost:
+            conn.rollback()
         raise e
     finally:
-        conn.close()
+        _local.depth -= 1
+
+def close_all_connections():
+    """إغلاق جميع اتصالات المجمع عند إيقاف التطبيق."""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        while _connections:
+            conn = _connections.pop()
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
 
 def init_database():
     with get_db_connection() as conn:
         cursor = conn.cursor()
         
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                service TEXT NOT NULL,
-                day TEXT NOT NULL,
-                time TEXT NOT NULL,
-                date TEXT NOT NULL,
-                type TEXT NOT NULL,
-                status TEXT DEFAULT 'قيد الانتظار',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                appointment_datetime TEXT
-            )
-        """)
+        # سجل الحجوزات (إضافة فقط): لكل مستخدم صفوف متعددة، حجزه الحالي هو is_current = 1
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS bookings ({BOOKINGS_SCHEMA})")
+        _migrate_bookings_to_history(cursor)
+        try:
+            cursor.execute("""
+                CREATE UNIQUE INDEX idx_bookings_current_user ON bookings(user_id)
+                WHERE is_current = 1
+            """)
+        except sqlite3.OperationalError:
+            pass
         
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS ratings (
@@ -78,81 +207,490 @@ def init_database():
         except sqlite3.OperationalError:
             pass
 
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS waiting_list (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER UNIQUE NOT NULL,
+                name TEXT,
+                phone TEXT,
+                service TEXT NOT NULL,
+                date_from TEXT NOT NULL,
+                date_to TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        try:
+            cursor.execute("CREATE INDEX idx_waiting_list_service_window ON waiting_list(service, date_from, date_to)")
+        except sqlite3.OperationalError:
+            pass
+        try:
+            cursor.execute("CREATE INDEX idx_waiting_list_created ON waiting_list(created_at, id)")
+        except sqlite3.OperationalError:
+            pass
+
+        # فهارس تصفح الحجوزات الحالية بالصفحات (keyset على created_at ثم id)
+        for index_sql in (
+            "CREATE INDEX idx_bookings_created ON bookings(created_at, id) WHERE is_current = 1",
+            "CREATE INDEX idx_bookings_status_created ON bookings(status, created_at, id) WHERE is_current = 1",
+            "CREATE INDEX idx_bookings_date_created ON bookings(date, created_at, id) WHERE is_current = 1",
+            "CREATE INDEX idx_bookings_service_created ON bookings(service, created_at, id) WHERE is_current = 1",
+        ):
+            try:
+                cursor.execute(index_sql)
+            except sqlite3.OperationalError:
+                pass
+
+        # وقت إرسال تذكير الموعد (لمنع تكرار التذكير)
+        try:
+            cursor.execute("ALTER TABLE bookings ADD COLUMN reminder_sent_at TIMESTAMP")
+        except sqlite3.OperationalError:
+            pass  # العمود موجود مسبقًا
+
+        # تقويم الأجهزة: صف لكل وحدة مشغولة، مفتاحه (التاريخ، الجهاز، الوحدة).
+        # held_until (وقت unix) لحجز مؤقت لم يُؤكد بعد، و NULL لحجز فعلي.
+        # التقويم القديم (موعد واحد لكل ساعة في المركز كله) يُحذف ويُعاد بناؤه من الحجوزات
+        cursor.execute("PRAGMA table_info(slot_calendar)")
+        calendar_columns = {row['name'] for row in cursor.fetchall()}
+        if calendar_columns and 'device' not in calendar_columns:
+            cursor.execute("DROP TABLE slot_calendar")
+            calendar_columns = set()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS slot_calendar (
+                slot_date TEXT NOT NULL,
+                device TEXT NOT NULL,
+                tick INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                booking_id INTEGER,
+                held_until REAL,
+                FOREIGN KEY(booking_id) REFERENCES bookings(id)
+            )
+        """)
+        try:
+            cursor.execute("CREATE UNIQUE INDEX idx_slot_calendar_slot ON slot_calendar(slot_date, device, tick)")
+        except sqlite3.OperationalError:
+            pass
+        try:
+            cursor.execute("CREATE INDEX idx_slot_calendar_user_id ON slot_calendar(user_id)")
+        except sqlite3.OperationalError:
+            pass
+        try:
+            cursor.execute("""
+                CREATE INDEX idx_slot_calendar_held_until ON slot_calendar(held_until)
+                WHERE held_until IS NOT NULL
+            """)
+        except sqlite3.OperationalError:
+            pass
+
+        if not calendar_columns:
+            _backfill_slot_calendar(cursor)
+
+        # بيانات المرضى المحفوظة وتفضيلات الإشعارات (تُكتب على دفعات من ذاكرة البوت)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_profiles (
+                user_id INTEGER PRIMARY KEY,
+                name TEXT,
+                phone TEXT,
+                booking_count INTEGER DEFAULT 0,
+                last_booking TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS notification_preferences (
+                user_id INTEGER PRIMARY KEY,
+                morning_notifications INTEGER NOT NULL DEFAULT 1,
+                evening_notifications INTEGER NOT NULL DEFAULT 1,
+                weather_alerts INTEGER NOT NULL DEFAULT 1,
+                promotions INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+
+        # حالة محادثات البوت وبيانات المستخدمين/المحادثات (انظر persistence.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS conversation_states (
+                name TEXT NOT NULL,
+                conversation_key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                PRIMARY KEY (name, conversation_key)
+            )
+        """)
+        for table in PERSISTED_DATA_TABLES:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    data TEXT NOT NULL
+                )
+            """)
+
+        # عدادات الإحصائيات (kind, key) → value، تحدّثها المشغلات في نفس معاملة الكتابة
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_counters'")
+        counters_exist = cursor.fetchone() is not None
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (kind, key)
+            ) WITHOUT ROWID
+        """)
+        for trigger_sql in STATS_TRIGGERS:
+            cursor.execute(trigger_sql)
+        if not counters_exist:
+            rebuild_statistics()
+
+        # فهرس البحث النصي (/find): صف لكل حجز، rowid = bookings.id، والنص مُطبّع مسبقاً
+        try:
+            # _index_feedback يجمع ملاحظات تقييمات الحجز بهذا الفهرس عند كل تقييم جديد
+            cursor.execute("CREATE INDEX idx_ratings_booking_id ON ratings(booking_id)")
+        except sqlite3.OperationalError:
+            pass
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bookings_search'")
+        search_exists = cursor.fetchone() is not None
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS bookings_search USING fts5(
+                name, phone, feedback,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        """)
+        cursor.execute(f"""
+            SELECT COUNT(*) FROM sqlite_master
+            WHERE type = 'trigger' AND name IN ({','.join('?' * len(_LEGACY_SEARCH_TRIGGERS))})
+        """, _LEGACY_SEARCH_TRIGGERS)
+        legacy_triggers = cursor.fetchone()[0] > 0
+        for name in _LEGACY_SEARCH_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for trigger_sql in SEARCH_TRIGGERS:
+            cursor.execute(trigger_sql)
+        # الإصدار السابق طبّع أرقام الجوال بمفتاح دولة آخر، فيُعاد بناء الفهرس مرة واحدة
+        if not search_exists or legacy_triggers:
+            rebuild_search_index()
+
+# إضافة قيم لعدادات الإحصائيات (القيمة قد تكون سالبة للإنقاص)
+_ADD_COUNTERS = "ON CONFLICT(kind, key) DO UPDATE SET value = value + excluded.value"
+
+STATS_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_bookings_insert AFTER INSERT ON bookings
+    BEGIN
+        INSERT INTO stats_counters (kind, key, value)
+        VALUES ('status', NEW.status, 1), ('service', NEW.service, 1), ('date', NEW.date, 1)
+        {_ADD_COUNTERS};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_bookings_update AFTER UPDATE OF status, service, date ON bookings
+    WHEN OLD.status IS NOT NEW.status OR OLD.service IS NOT NEW.service OR OLD.date IS NOT NEW.date
+    BEGIN
+        INSERT INTO stats_counters (kind, key, value)
+        VALUES ('status', OLD.status, -1), ('service', OLD.service, -1), ('date', OLD.date, -1),
+               ('status', NEW.status, 1), ('service', NEW.service, 1), ('date', NEW.date, 1)
+        {_ADD_COUNTERS};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_bookings_delete AFTER DELETE ON bookings
+    BEGIN
+        INSERT INTO stats_counters (kind, key, value)
+        VALUES ('status', OLD.status, -1), ('service', OLD.service, -1), ('date', OLD.date, -1)
+        {_ADD_COUNTERS};
+    END
+    """,
+    # المرضى المتكررون: يتغير العدد فقط عندما تصبح زيارة المريض المكتملة الثانية أو تعود واحدة
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_repeat_gained AFTER UPDATE OF status ON bookings
+    WHEN NEW.status = 'تم التصوير' AND OLD.status IS NOT 'تم التصوير'
+    AND (SELECT COUNT(*) FROM bookings WHERE user_id = NEW.user_id AND status = 'تم التصوير') = 2
+    BEGIN
+        INSERT INTO stats_counters (kind, key, value) VALUES ('patients', 'repeat', 1) {_ADD_COUNTERS};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_repeat_lost AFTER UPDATE OF status ON bookings
+    WHEN OLD.status = 'تم التصوير' AND NEW.status IS NOT 'تم التصوير'
+    AND (SELECT COUNT(*) FROM bookings WHERE user_id = NEW.user_id AND status = 'تم التصوير') = 1
+    BEGIN
+        INSERT INTO stats_counters (kind, key, value) VALUES ('patients', 'repeat', -1) {_ADD_COUNTERS};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_ratings_insert AFTER INSERT ON ratings
+    BEGIN
+        INSERT INTO stats_counters (kind, key, value)
+        VALUES ('ratings', 'count', 1), ('ratings', 'stars', NEW.stars)
+        {_ADD_COUNTERS};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_ratings_delete AFTER DELETE ON ratings
+    BEGIN
+        INSERT INTO stats_counters (kind, key, value)
+        VALUES ('ratings', 'count', -1), ('ratings', 'stars', -OLD.stars)
+        {_ADD_COUNTERS};
+    END
+    """,
+)
+
+def _migrate_bookings_to_history(cursor):
+    """
+    الجداول القديمة فيها user_id UNIQUE (حجز واحد لكل مستخدم يُستبدل بـ INSERT OR REPLACE).
+    SQLite لا يسمح بحذف القيد، لذا يُعاد بناء الجدول مرة واحدة بنفس المعرفات
+    (حتى تبقى ratings.booking_id و slot_calendar.booking_id صحيحة)، وكل صف قديم يصبح الحجز الحالي.
+    """
+    cursor.execute("PRAGMA index_list(bookings)")
+    legacy = any(
+        row['unique'] and row['origin'] == 'u'
+        and [col['name'] for col in cursor.execute(f"PRAGMA index_info({row['name']})").fetchall()] == ['user_id']
+        for row in cursor.fetchall()
+    )
+    if not legacy:
+        return
+
+    try:
+        cursor.execute("ALTER TABLE bookings ADD COLUMN reminder_sent_at TIMESTAMP")
+    except sqlite3.OperationalError:
+        pass
+    cursor.execute("PRAGMA table_info(bookings)")
+    columns = ", ".join(row['name'] for row in cursor.fetchall())
+    cursor.execute(f"CREATE TABLE bookings_history ({BOOKINGS_SCHEMA})")
+    cursor.execute(f"INSERT INTO bookings_history ({columns}) SELECT {columns} FROM bookings")
+    cursor.execute("DROP TABLE bookings")
+    cursor.execute("ALTER TABLE bookings_history RENAME TO bookings")
+
+def _backfill_slot_calendar(cursor):
+    """تعبئة التقويم من الحجوزات النشطة الموجودة مسبقاً (مرة واحدة عند إنشاء الجدول)."""
+    cursor.execute(f"""
+        SELECT id, user_id, service, date, time FROM bookings
+        WHERE is_current = 1 AND status NOT IN ({','.join('?' * len(RELEASED_STATUSES))})
+        ORDER BY id
+    """, RELEASED_STATUSES)
+    for booking_id, user_id, service, date_str, time_str in cursor.fetchall():
+        key = _slot_key(date_str, time_str)
+        if key:
+            try:
+                _reserve(cursor, *key, service, user_id, booking_id)
+            except SlotTakenError:
+                pass  # لا جهاز فارغ لهذا الحجز القديم؛ يبقى في السجل دون أن يشغل التقويم
+
+def _slot_key(date_str, time_str):
+    """تحويل تاريخ الحجز (dd/mm/yyyy) ونص الموعد إلى مفتاح التقويم (yyyy-mm-dd, رقم الوحدة)."""
+    if time_str not in TICK_INDEX:
+        return None
+    try:
+        slot_date = datetime.strptime(date_str, "%d/%m/%Y").date()
+    except (TypeError, ValueError):
+        return None
+    return slot_date.isoformat(), TICK_INDEX[time_str]
+
+def service_profile(service):
+    """(مدة الخدمة بالوحدات، الأجهزة التي تؤديها بترتيب التفضيل)."""
+    return SERVICE_PROFILES.get(service, DEFAULT_SERVICE_PROFILE)
+
+def tick_datetime(day, tick):
+    """وقت بداية الوحدة tick في اليوم day (date)."""
+    return datetime.combine(day, dt_time(SLOT_HOURS[0])) + timedelta(minutes=tick * TICK_MINUTES)
+
+def is_bookable(day, tick=None, now=None):
+    """هل التاريخ day (date) ضمن أيام الحجز المعروضة، والوحدة tick (إن حُددت) لم يبدأ وقتها بعد."""
+    now = now or datetime.now()
+    if not now.date() <= day < now.date() + timedelta(days=BOOKING_HORIZON_DAYS):
+        return False
+    return tick is None or tick_datetime(day, tick) > now
+
+def _reserve(cursor, slot_date, tick, service, user_id, booking_id=None, held_until=None):
+    """
+    تسجيل الموعد على أول جهاز يؤدي الخدمة وتكون وحداته [tick, tick + المدة) فارغة، ويعيد الجهاز.
+    تُستدعى بعد أول كتابة في المعاملة (قفل الكتابة محجوز) فلا يتغير التقويم بين القراءة والإدراج.
+    وحدات يشغلها المستخدم نفسه لا تُعتبر تعارضاً (حجز مؤقت يتداخل مع حجزه الحالي).
+    يرفع SlotTakenError إذا لم يتسع أي جهاز للموعد.
+    """
+    duration, devices = service_profile(service)
+    ticks = range(tick, tick + duration)
+    if not 0 <= tick < START_TICKS or ticks.stop > DAY_TICKS:
+        raise SlotTakenError(f"{duration} ticks from tick {tick} do not fit in the day")
+    cursor.execute("DELETE FROM slot_calendar WHERE slot_date = ? AND held_until <= ?",
+                   (slot_date, datetime.now().timestamp()))
+    cursor.execute("""
+        SELECT device, tick, user_id FROM slot_calendar
+        WHERE slot_date = ? AND tick >= ? AND tick < ?
+    """, (slot_date, ticks.start, ticks.stop))
+    occupied = {}
+    for device, occupied_tick, owner in cursor.fetchall():
+        occupied.setdefault(device, {})[occupied_tick] = owner
+    for device in devices:
+        owners = occupied.get(device, {})
+        if any(owner != user_id for owner in owners.values()):
+            continue
+        cursor.executemany("""
+            INSERT INTO slot_calendar (slot_date, device, tick, user_id, booking_id, held_until)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(slot_date, device, t, user_id, booking_id, held_until) for t in ticks if t not in owners])
+        return device
+    raise SlotTakenError(f"{TICK_LABELS[tick]} on {slot_date} is already booked")
+
 # === الدوال الأخرى (متوافقة مع SQLite) ===
 def create_booking(user_id, name, phone, service, day, time, date, booking_type, appointment_datetime=None):
+    """
+    إضافة حجز جديد للسجل وجعله الحجز الحالي للمستخدم، وتسجيل موعده في التقويم في نفس المعاملة.
+    الحجز السابق يبقى في السجل (ويصبح ملغياً إذا كان ما زال نشطاً).
+    الحجز المؤقت للمستخدم (hold_slot) يتحول إلى حجز فعلي على أول جهاز متاح للخدمة، والفهرس
+    الفريد على (التاريخ، الجهاز، الوحدة) هو ما يمنع الحجز المزدوج.
+    يرفع SlotTakenError إذا لم يتسع أي جهاز للخدمة في هذا الموعد.
+    """
+    key = _slot_key(date, time)
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        # حجز المستخدم السابق وحجزه المؤقت (وهذه الكتابة تحجز قفل الكتابة لبقية المعاملة)
+        cursor.execute("DELETE FROM slot_calendar WHERE user_id = ?", (user_id,))
+        cursor.execute(f"""
+            UPDATE bookings
+            SET is_current = 0,
+                status = CASE WHEN status IN ({','.join('?' * len(RELEASED_STATUSES))}) THEN status ELSE 'ملغي' END,
+                updated_at = datetime('now')
+            WHERE user_id = ? AND is_current = 1
+        """, (*RELEASED_STATUSES, user_id))
         cursor.execute("""
-            INSERT OR REPLACE INTO bookings 
+            INSERT INTO bookings
             (user_id, name, phone, service, day, time, date, type, appointment_datetime, status, updated_at)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'قيد الانتظار', datetime('now'))
         """, (user_id, name, phone, service, day, time, date, booking_type, appointment_datetime))
-        return cursor.lastrowid
+        booking_id = cursor.lastrowid
+        _index_booking(cursor, booking_id, name, phone)
+        if key:
+            _reserve(cursor, *key, service, user_id, booking_id)
+        return booking_id
 
 def get_booking(user_id):
+    """الحجز الحالي للمستخدم (بحث واحد على الفهرس idx_bookings_current_user)."""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM bookings WHERE user_id = ?", (user_id,))
+        cursor.execute("SELECT * FROM bookings WHERE user_id = ? AND is_current = 1", (user_id,))
         row = cursor.fetchone()
         return dict(row) if row else None
 
 def get_all_bookings():
+    """كل الحجوزات في السجل، بما فيها السابقة والملغاة."""
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM bookings ORDER BY created_at DESC")
         return [dict(row) for row in cursor.fetchall()]
 
+def get_bookings_page(limit, page_key=None, direction="next", status=None, date=None, service=None):
+    """
+    صفحة من الحجوزات الحالية مرتبة من الأحدث للأقدم، بترقيم keyset على (created_at, id).
+
+    page_key: (created_at, id) لآخر حجز في الصفحة الحالية (مع "next")
+            أو لأول حجز فيها (مع "prev").
+    يعيد (الحجوزات، هل توجد حجوزات أخرى في نفس الاتجاه).
+    """
+    conditions, params = ["is_current = 1"], []
+    for column, value in (("status", status), ("date", date), ("service", service)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+
+    newest_first = direction == "next"
+    if page_key is not None:
+        conditions.append("(created_at, id) < (?, ?)" if newest_first else "(created_at, id) > (?, ?)")
+        params.extend(page_key)
+
+    where = f"WHERE {' AND '.join(conditions)}"
+    order = "DESC" if newest_first else "ASC"
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT * FROM bookings
+            {where}
+            ORDER BY created_at {order}, id {order}
+            LIMIT ?
+        """, (*params, limit + 1))
+        rows = [dict(row) for row in cursor.fetchall()]
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not newest_first:
+        rows.reverse()
+    return rows, has_more
+
 def update_booking_status(user_id, status):
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             UPDATE bookings 
             SET status = ?, updated_at = datetime('now')
-            WHERE user_id = ?
+            WHERE user_id = ? AND is_current = 1
         """, (status, user_id))
+        if status in RELEASED_STATUSES:
+            cursor.execute("DELETE FROM slot_calendar WHERE user_id = ? AND held_until IS NULL", (user_id,))
 
 def delete_booking(user_id):
+    """إلغاء الحجز الحالي للمستخدم: يبقى في السجل بحالة 'ملغي' ويتحرر موعده."""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM bookings WHERE user_id = ?", (user_id,))
+        cursor.execute("DELETE FROM slot_calendar WHERE user_id = ? AND held_until IS NULL", (user_id,))
+        cursor.execute("""
+            UPDATE bookings
+            SET status = 'ملغي', is_current = 0, updated_at = datetime('now')
+            WHERE user_id = ? AND is_current = 1
+        """, (user_id,))
 
-def check_time_slot_available(day, time, exclude_user_id=None):
+def hold_slot(slot_date, tick, user_id, service=None, ttl_seconds=SLOT_HOLD_SECONDS):
+    """
+    حجز مؤقت للموعد الذي يبدأ عند الوحدة tick في التاريخ slot_date (date) حتى يؤكد المستخدم حجزه.
+    للمستخدم حجز مؤقت واحد فقط (يحل الجديد محل السابق)، وإعادة اختيار موعده الحالي تنجح.
+    يعيد الجهاز المحجوز، ويرفع SlotTakenError إذا لم يتسع أي جهاز للخدمة في هذا الموعد.
+    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        if exclude_user_id:
-            cursor.execute("""
-                SELECT COUNT(*) FROM bookings 
-                WHERE day = ? AND time = ? AND status NOT IN ('لم يحضر', 'ملغي', 'تم التصوير')
-                AND user_id != ?
-            """, (day, time, exclude_user_id))
-        else:
-            cursor.execute("""
-                SELECT COUNT(*) FROM bookings 
-                WHERE day = ? AND time = ? AND status NOT IN ('لم يحضر', 'ملغي', 'تم التصوير')
-            """, (day, time))
-        return cursor.fetchone()[0] == 0
+        cursor.execute("DELETE FROM slot_calendar WHERE user_id = ? AND held_until IS NOT NULL", (user_id,))
+        return _reserve(cursor, slot_date.isoformat(), tick, service, user_id,
+                        held_until=datetime.now().timestamp() + ttl_seconds)
 
-def get_booked_time_slots(day):
+def release_slot_hold(user_id):
+    """إلغاء الحجز المؤقت للمستخدم (إن وجد)."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM slot_calendar WHERE user_id = ? AND held_until IS NOT NULL", (user_id,))
+
+def purge_expired_slot_holds():
+    """حذف الحجوزات المؤقتة المنتهية، ويعيد عددها."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM slot_calendar WHERE held_until <= ?", (datetime.now().timestamp(),))
+        return cursor.rowcount
+
+def check_time_slot_available(slot_date, tick, exclude_user_id=None, service=None):
+    """هل يتسع جهاز للخدمة عند الوحدة tick في التاريخ slot_date (date)؟"""
+    masks = get_availability(slot_date, slot_date, exclude_user_id, service)
+    return bool(masks[slot_date] >> tick & 1)
+
+def get_booked_time_slots(slot_date):
+    """أسماء الوحدات المشغولة على جهاز واحد على الأقل في التاريخ slot_date (date)."""
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT time FROM bookings 
-            WHERE day = ? AND status NOT IN ('لم يحضر', 'ملغي', 'تم التصوير')
-        """, (day,))
-        return [row[0] for row in cursor.fetchall()]
+            SELECT DISTINCT tick FROM slot_calendar
+            WHERE slot_date = ?
+            AND (held_until IS NULL OR held_until > ?)
+            ORDER BY tick
+        """, (slot_date.isoformat(), datetime.now().timestamp()))
+        return [TICK_LABELS[row[0]] for row in cursor.fetchall()]
 
 def save_rating(user_id, stars, feedback=None):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        booking = get_booking(user_id)
-        booking_id = booking['id'] if booking else None
+        cursor.execute("SELECT id FROM bookings WHERE user_id = ? AND is_current = 1", (user_id,))
+        row = cursor.fetchone()
+        booking_id = row[0] if row else None
         cursor.execute("""
             INSERT INTO ratings (user_id, booking_id, stars, feedback)
             VALUES (?, ?, ?, ?)
         """, (user_id, booking_id, stars, feedback))
-        return cursor.lastrowid
+        rating_id = cursor.lastrowid
+        if booking_id is not None and feedback is not None:
+            _index_feedback(cursor, booking_id)
+        return rating_id
 
-def get_ratings():
+def get_ratings(limit=None):
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
@@ -160,47 +698,91 @@ def get_ratings():
             FROM ratings r
             LEFT JOIN bookings b ON r.booking_id = b.id
             ORDER BY r.created_at DESC
-        """)
+            LIMIT ?
+        """, (-1 if limit is None else limit,))
         return [dict(row) for row in cursor.fetchall()]
 
-def get_statistics():
+def rebuild_statistics():
+    """
+    إعادة حساب عدادات الإحصائيات من الجداول (عند أول إنشاء لها، أو يدوياً بأمر /rebuild_stats
+    بعد أي تعديل مباشر على قاعدة البيانات). يعيد عدد العدادات.
+    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        
+        cursor.execute("DELETE FROM stats_counters")
+        for column in ("status", "service", "date"):
+            cursor.execute(f"""
+                INSERT INTO stats_counters (kind, key, value)
+                SELECT '{column}', {column}, COUNT(*) FROM bookings
+                WHERE {column} IS NOT NULL
+                GROUP BY {column}
+            """)
         cursor.execute("""
-            SELECT 
-                COUNT(*) as total_bookings,
-                COUNT(CASE WHEN status = 'قيد الانتظار' THEN 1 END) as pending,
-                COUNT(CASE WHEN status = 'مؤكد' THEN 1 END) as confirmed,
-                COUNT(CASE WHEN status = 'تم التصوير' THEN 1 END) as completed,
-                COUNT(CASE WHEN status = 'لم يحضر' THEN 1 END) as no_show
-            FROM bookings
+            INSERT INTO stats_counters (kind, key, value)
+            SELECT 'patients', 'repeat', COUNT(*) FROM (
+                SELECT user_id FROM bookings
+                WHERE status = 'تم التصوير'
+                GROUP BY user_id
+                HAVING COUNT(*) > 1
+            )
         """)
-        stats = cursor.fetchone()
-        
         cursor.execute("""
-            SELECT service, COUNT(*) as count 
-            FROM bookings 
-            GROUP BY service 
-            ORDER BY count DESC
+            INSERT INTO stats_counters (kind, key, value)
+            SELECT 'ratings', 'count', COUNT(*) FROM ratings
+            UNION ALL
+            SELECT 'ratings', 'stars', COALESCE(SUM(stars), 0) FROM ratings
         """)
-        services = cursor.fetchall()
-        
-        cursor.execute("SELECT AVG(stars) as avg_rating, COUNT(*) as total_ratings FROM ratings")
-        rating_stats = cursor.fetchone()
-        
-        return {
-            'bookings': dict(stats),
-            'services': [dict(s) for s in services],
-            'ratings': dict(rating_stats) if rating_stats else {'avg_rating': 0, 'total_ratings': 0}
-        }
+        cursor.execute("SELECT COUNT(*) FROM stats_counters")
+        return cursor.fetchone()[0]
+
+def get_statistics():
+    """
+    إحصائيات لوحة المشرف من العدادات المحفوظة في stats_counters، بدون أي تجميع
+    على جداول الحجوزات والتقييمات (الكلفة لا تعتمد على حجم السجل).
+    """
+    today = datetime.now().strftime("%d/%m/%Y")
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT kind, key, value FROM stats_counters
+            WHERE kind IN ('status', 'service', 'patients', 'ratings')
+            OR (kind = 'date' AND key = ?)
+        """, (today,))
+        counters = {}
+        for kind, key, value in cursor.fetchall():
+            counters.setdefault(kind, {})[key] = value
+
+    statuses = counters.get('status', {})
+    ratings = counters.get('ratings', {})
+    total_ratings = ratings.get('count', 0)
+    return {
+        'bookings': {
+            'total_bookings': sum(statuses.values()),
+            'pending': statuses.get('قيد الانتظار', 0),
+            'confirmed': statuses.get('مؤكد', 0),
+            'completed': statuses.get('تم التصوير', 0),
+            'no_show': statuses.get('لم يحضر', 0),
+            'cancelled': statuses.get('ملغي', 0),
+            'repeat_patients': counters.get('patients', {}).get('repeat', 0),
+            'today': counters.get('date', {}).get(today, 0),
+        },
+        'services': [
+            {'service': service, 'count': count}
+            for service, count in sorted(counters.get('service', {}).items(), key=lambda item: -item[1])
+            if count > 0
+        ],
+        'ratings': {
+            'avg_rating': ratings.get('stars', 0) / total_ratings if total_ratings else None,
+            'total_ratings': total_ratings,
+        },
+    }
 
 def get_pending_bookings():
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             SELECT * FROM bookings 
-            WHERE status = 'قيد الانتظار'
+            WHERE is_current = 1 AND status = 'قيد الانتظار'
             ORDER BY created_at ASC
         """)
         return [dict(row) for row in cursor.fetchall()]
@@ -217,7 +799,7 @@ def get_confirmed_bookings_for_reminders():
         cursor = conn.cursor()
         cursor.execute("""
             SELECT * FROM bookings 
-            WHERE status = 'مؤكد' 
+            WHERE is_current = 1 AND status = 'مؤكد' 
             AND appointment_datetime IS NOT NULL
             AND appointment_datetime > ?
             AND appointment_datetime <= ?
@@ -225,94 +807,454 @@ def get_confirmed_bookings_for_reminders():
         """, (now_str, one_hour_later_str))
         return [dict(row) for row in cursor.fetchall()]
 
-# --- إضافة دالة لحساب الأيام المستقبلية المتاحة ---
-def get_available_days_for_booking():
+def get_upcoming_confirmed_bookings():
+    """الحجوزات المؤكدة القادمة التي لم يُرسل لها تذكير بعد (لإعادة جدولة التذكيرات عند التشغيل)."""
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM bookings
+            WHERE is_current = 1 AND status = 'مؤكد'
+            AND appointment_datetime > ?
+            AND reminder_sent_at IS NULL
+            ORDER BY appointment_datetime ASC
+        """, (now_str,))
+        return [dict(row) for row in cursor.fetchall()]
+
+def mark_reminder_sent(booking_id):
     """
-    Returns a list of day names starting from today, considering the current time.
-    This helps in generating the list of days for the user to choose from.
+    تسجيل إرسال التذكير. يعيد True فقط لأول استدعاء لنفس الحجز،
+    وبذلك لا يُرسل التذكير أكثر من مرة.
     """
-    now = datetime.now()
-    current_weekday = now.weekday() # Monday is 0, Sunday is 6
-    current_time_str = now.strftime("%H:%M") # Current time in HH:MM format
-
-    # Map weekday numbers to Arabic names
-    weekday_names = ["الاثنين", "الثلاثاء", "الأربعاء", "الخميس", "الجمعة", "السبت", "الأحد"]
-
-    # Generate the list of next 7 days starting from today
-    available_days = []
-    for i in range(7): # Next 7 days including today
-        day_offset = timedelta(days=i)
-        future_date = now + day_offset
-        future_weekday_num = future_date.weekday()
-        future_day_name = weekday_names[future_weekday_num]
-        future_date_str = future_date.strftime("%d/%m/%Y")
-
-        # Check if it's today, then filter based on time slots
-        if i == 0: # Today
-            # Get booked slots for today
-            booked_slots_today = set(get_booked_time_slots(future_day_name))
-            # Define all possible time slots
-            all_time_slots = [
-                "9:00 صباحاً", "10:00 صباحاً", "11:00 صباحاً",
-                "12:00 ظهراً", "1:00 مساءً", "2:00 مساءً",
-                "3:00 مساءً", "4:00 مساءً", "5:00 مساءً",
-                "6:00 مساءً", "7:00 مساءً", "8:00 مساءً"
-            ]
-
-            # Find the first available slot today after current time
-            first_available_slot_today = None
-            for slot in all_time_slots:
-                # Convert slot time to comparable format (HH:MM)
-                slot_hour_min = slot.split(" ")[0] # e.g., "9:00"
-                # Determine if AM or PM for comparison if needed, but for this logic, we assume PM starts at 12:00 PM and onwards until 8:00 PM
-                # For simplicity in this check, we just compare the HH:MM string if AM/PM is consistent or convert properly.
-                # A more robust way is to create datetime objects for the slot times of 'today'
-                slot_time_obj = datetime.strptime(f"{future_date_str} {slot_hour_min}", "%d/%m/%Y %H:%M")
-                if slot_time_obj.time() > now.time() and slot not in booked_slots_today:
-                     first_available_slot_today = slot
-                     break
-
-            # If there's an available slot today, include the day
-            if first_available_slot_today:
-                available_days.append(future_day_name)
-        else: # Not today, just add the day name
-            available_days.append(future_day_name)
-
-    return available_days
-
-# --- إضافة دالة لحساب الأوقات المتاحة لليوم المحدد، مع مراعاة الوقت الحالي ---
-def get_available_time_slots_for_day(day_name, exclude_user_id=None):
-    """
-    Returns a list of available time slots for a given day name.
-    Filters out booked slots and, if the day is today, filters out slots before the current time.
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE bookings
+            SET reminder_sent_at = datetime('now')
+            WHERE id = ? AND status = 'مؤكد' AND reminder_sent_at IS NULL
+        """, (booking_id,))
+        return cursor.rowcount == 1
+
+# === البحث النصي (FTS5) ===
+SEARCH_RESULTS_LIMIT = 20
+
+# توحيد أشكال الحروف التي يكتبها الناس بطرق مختلفة، وتحويل الأرقام العربية الهندية والفارسية
+_SEARCH_FOLD = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+    **{chr(0x0660 + d): str(d) for d in range(10)},
+    **{chr(0x06F0 + d): str(d) for d in range(10)},
+})
+# التشكيل (الحركات والشدة والسكون والألف الخنجرية) والتطويل
+_SEARCH_STRIP = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+_SEARCH_TOKEN = re.compile(r"[^\W_]+")
+_PHONE_CHARS = re.compile(r"[\s\-+().]")
+# أرقام المركز فلسطينية: مفتاح الدولة 970 أو 972 (مع 00 أو بدونها) أو الصفر المحلي
+_PHONE_PREFIX = re.compile(r"^(?:00970|970|00972|972|0)")
+
+def normalize_search_text(text):
+    """تطبيع النص العربي للفهرسة والبحث: حذف التشكيل والتطويل وتوحيد الألف والياء والتاء المربوطة."""
+    if not text:
+        return ""
+    return _SEARCH_STRIP.sub("", text).translate(_SEARCH_FOLD).lower()
+
+def _strip_article(token):
+    return token[2:] if token.startswith("ال") and len(token) > 3 else token
+
+def search_text(text):
+    """النص المُفهرس: النص المُطبّع، وبعده الكلمات المعرّفة بدون "ال" حتى يطابق البحث عن "موظف" كلمة "الموظفة"."""
+    normalized = normalize_search_text(text)
+    tokens = _SEARCH_TOKEN.findall(normalized)
+    stripped = [token[2:] for token in tokens if _strip_article(token) != token]
+    return f"{normalized} {' '.join(stripped)}" if stripped else normalized
+
+def phone_search_text(phone):
+    """رقم الجوال كأرقام فقط، مع شكله المحلي (بدون 0 أو 970/972) حتى يطابق البحث بأي من الصيغتين."""
+    digits = "".join(_SEARCH_TOKEN.findall(normalize_search_text(phone)))
+    local = _PHONE_PREFIX.sub("", digits)
+    return f"{digits} {local}" if local and local != digits else digits
+
+# ملاحظات التقييم تُفهرس مع الحجز الذي تتبعه (ratings.booking_id)
+_FEEDBACK_TEXT = """
+    (SELECT group_concat(search_text(feedback), ' ') FROM ratings
+     WHERE booking_id = {booking_id} AND feedback IS NOT NULL)
+"""
+
+# النص يُطبّع في Python عند الكتابة (_index_booking و _index_feedback) وليس في مشغلات تستدعي
+# search_text، لأن تلك الدوال مسجلة على اتصالات البوت فقط: أي كاتب آخر (sqlite3 أو متصفح
+# قواعد بيانات) كان سيفشل بـ "no such function". الحذف لا يحتاج تطبيعاً فيبقى مشغلاً.
+SEARCH_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_search_bookings_delete AFTER DELETE ON bookings
+    BEGIN
+        DELETE FROM bookings_search WHERE rowid = OLD.id;
+    END
+    """,
+)
+# مشغلات الإصدار السابق التي تستدعي دوال Python (تُحذف ويُعاد بناء الفهرس عند الترقية)
+_LEGACY_SEARCH_TRIGGERS = (
+    "trg_search_bookings_insert", "trg_search_bookings_update",
+    "trg_search_ratings_insert", "trg_search_ratings_update", "trg_search_ratings_delete",
+)
+
+def _index_booking(cursor, booking_id, name, phone):
+    cursor.execute("INSERT INTO bookings_search (rowid, name, phone) VALUES (?, ?, ?)",
+                   (booking_id, search_text(name), phone_search_text(phone)))
+
+def _index_feedback(cursor, booking_id):
+    cursor.execute("SELECT feedback FROM ratings WHERE booking_id = ? AND feedback IS NOT NULL ORDER BY id",
+                   (booking_id,))
+    feedback = " ".join(search_text(row[0]) for row in cursor.fetchall())
+    cursor.execute("UPDATE bookings_search SET feedback = ? WHERE rowid = ?", (feedback or None, booking_id))
+
+def rebuild_search_index():
+    """
+    إعادة بناء فهرس البحث من الحجوزات والتقييمات (عند أول إنشاء له، أو بعد تعديل مباشر
+    على القاعدة من خارج البوت، فتلك التعديلات لا تصل للفهرس). يعيد عدد الحجوزات المفهرسة.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM bookings_search")
+        cursor.execute(f"""
+            INSERT INTO bookings_search (rowid, name, phone, feedback)
+            SELECT id, search_text(name), phone_search_text(phone), {_FEEDBACK_TEXT.format(booking_id="bookings.id")}
+            FROM bookings
+        """)
+        cursor.execute("INSERT INTO bookings_search (bookings_search) VALUES ('optimize')")
+        cursor.execute("SELECT COUNT(*) FROM bookings_search")
+        return cursor.fetchone()[0]
+
+def _search_match_query(text):
+    """
+    تحويل نص البحث إلى استعلام FTS5: كل كلمة (بدون "ال") بادئة ("كلمة"*) والكلمات مجتمعة (AND).
+    نص من أرقام ورموز الهاتف فقط يُعامل كرقم جوال واحد بأي من صيغتيه.
+    """
+    normalized = normalize_search_text(text)
+    compact = _PHONE_CHARS.sub("", normalized)
+    if compact.isdigit():
+        local = _PHONE_PREFIX.sub("", compact)
+        if local and local != compact:
+            return f'phone : ("{compact}"* OR "{local}"*)'
+        return f'phone : "{compact}"*'
+    return " ".join(f'"{_strip_article(token)}"*' for token in _SEARCH_TOKEN.findall(normalized))
+
+def search_bookings(text, limit=SEARCH_RESULTS_LIMIT):
+    """
+    البحث في الحجوزات (الحالية والسابقة) بالاسم أو الجوال أو ملاحظات التقييم.
+    النتائج من الأحدث للأقدم، مع ملاحظات التقييم الخاصة بكل حجز.
+    """
+    match = _search_match_query(text)
+    if not match:
+        return []
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT b.*,
+                   (SELECT group_concat(feedback, ' | ') FROM ratings
+                    WHERE booking_id = b.id AND feedback IS NOT NULL) AS feedback
+            FROM bookings_search s
+            JOIN bookings b ON b.id = s.rowid
+            WHERE bookings_search MATCH ?
+            ORDER BY s.rowid DESC
+            LIMIT ?
+        """, (match, limit))
+        return [dict(row) for row in cursor.fetchall()]
+
+# === التصدير ===
+EXPORT_CHUNK_SIZE = 500
+
+# لكل نوع تصدير: الاستعلام، عمود التاريخ لفلتر المدة، والترتيب
+EXPORT_QUERIES = {
+    'bookings': ("""
+        SELECT id, user_id, name, phone, service, day, time, date, type, status,
+               appointment_datetime, created_at, updated_at, is_current
+        FROM bookings
+    """, "appointment_datetime", "appointment_datetime, id"),
+    'ratings': ("""
+        SELECT r.id, r.user_id, b.name, b.phone, b.service, b.date, r.stars, r.feedback, r.created_at
+        FROM ratings r
+        LEFT JOIN bookings b ON r.booking_id = b.id
+    """, "r.created_at", "r.id"),
+    'waiting_list': ("""
+        SELECT id, user_id, name, phone, service, date_from, date_to, created_at
+        FROM waiting_list
+    """, "created_at", "id"),
+}
+
+def iter_export_rows(kind, date_from=None, date_to=None, status=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    مولّد لصفوف التصدير: أول ما يعيده tuple بأسماء الأعمدة، ثم صف tuple لكل سجل.
+    يقرأ من المؤشر على دفعات (fetchmany) فلا تتجاوز الذاكرة دفعة واحدة مهما كان حجم السجل.
+
+    date_from/date_to (date) مدة شاملة على تاريخ الموعد للحجوزات، وتاريخ الإنشاء لغيرها.
+    status لفلترة الحجوزات فقط. يجب استهلاك المولد على نفس الخيط.
+    """
+    sql, date_column, order = EXPORT_QUERIES[kind]
+    conditions, params = [], []
+    if date_from is not None:
+        conditions.append(f"{date_column} >= ?")
+        params.append(date_from.isoformat())
+    if date_to is not None:
+        conditions.append(f"{date_column} < ?")
+        params.append((date_to + timedelta(days=1)).isoformat())
+    if status is not None:
+        if kind != 'bookings':
+            raise ValueError("Status filter applies to bookings only")
+        conditions.append("status = ?")
+        params.append(status)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"{sql} {where} ORDER BY {order}", params)
+        yield tuple(column[0] for column in cursor.description)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(row)
+
+# === قائمة الانتظار ===
+def add_to_waiting_list(user_id, name, phone, service, date_from, date_to):
+    """إضافة مريض لقائمة الانتظار للفترة [date_from, date_to]. الانضمام مجدداً يعيده لآخر الطابور."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO waiting_list (user_id, name, phone, service, date_from, date_to)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (user_id, name, phone, service, date_from.isoformat(), date_to.isoformat()))
+        return cursor.lastrowid
+
+def remove_from_waiting_list(user_id):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM waiting_list WHERE user_id = ?", (user_id,))
+        return cursor.rowcount > 0
+
+def get_waiting_list():
+    """قائمة الانتظار بترتيب الانضمام (الأقدم أولاً)."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM waiting_list ORDER BY created_at, id")
+        return [dict(row) for row in cursor.fetchall()]
+
+def match_waiting_list(start_date, end_date):
+    """
+    توزيع السعة المتاحة في [start_date, end_date] على المنتظرين حسب خدماتهم:
+    لكل يوم يُعرض على المنتظرين بالترتيب (FIFO) ممن تشمل فترتهم ذلك اليوم أبكر موعد
+    يتسع لخدمة كل منهم، ويُخصم من سعة الجهاز حتى لا يُعرض نفس الوقت على اثنين. لكل منتظر عرض واحد.
+
+    يستخدم استعلام تقويم واحداً ثم يقرأ المنتظرين لكل يوم حتى لا تتسع السعة المتبقية لأي خدمة.
+    يعيد قائمة (المنتظر، التاريخ، الوحدة). لا يحذف المنتظرين؛ يتم ذلك بعد نجاح الإشعار.
     """
     now = datetime.now()
-    current_weekday = now.weekday()
-    weekday_names = ["الاثنين", "الثلاثاء", "الأربعاء", "الخميس", "الجمعة", "السبت", "الأحد"]
-    today_name = weekday_names[current_weekday]
-    current_time_str = now.strftime("%H:%M")
+    busy = _busy_masks(start_date, end_date, None, now)
+    profiles = set(SERVICE_PROFILES.values()) | {DEFAULT_SERVICE_PROFILE}
+    offers = []
+    matched_ids = set()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for offset in range((end_date - start_date).days + 1):
+            day = start_date + timedelta(days=offset)
+            past = _past_ticks_mask(day, now)
+            free = {device: ALL_TICKS_MASK & ~busy.get((day.isoformat(), device), 0) & ~past for device in DEVICES}
+            exhausted = set()  # خدمات لم يعد لها مكان في هذا اليوم
+            cursor.execute("""
+                SELECT * FROM waiting_list
+                WHERE date_from <= ? AND date_to >= ?
+                ORDER BY created_at, id
+            """, (day.isoformat(), day.isoformat()))
+            for waiter in cursor:
+                if len(exhausted) == len(profiles):
+                    break
+                profile = service_profile(waiter['service'])
+                if waiter['id'] in matched_ids or profile in exhausted:
+                    continue
+                placement = _first_fit(free, *profile)
+                if placement is None:
+                    exhausted.add(profile)
+                    continue
+                device, tick = placement
+                free[device] &= ~(((1 << profile[0]) - 1) << tick)
+                offers.append((dict(waiter), day, tick))
+                matched_ids.add(waiter['id'])
+    return offers
+
+# === بيانات المستخدمين وتفضيلات الإشعارات ===
+NOTIFICATION_PREFERENCE_KEYS = ('morning_notifications', 'evening_notifications', 'weather_alerts', 'promotions')
+
+def get_user_profile(user_id):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM user_profiles WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+def save_user_profiles(profiles):
+    """حفظ دفعة من بيانات المستخدمين {user_id: profile} في معاملة واحدة."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT OR REPLACE INTO user_profiles (user_id, name, phone, booking_count, last_booking)
+            VALUES (?, ?, ?, ?, ?)
+        """, [
+            (user_id, p.get('name'), p.get('phone'), p.get('booking_count', 0), p.get('last_booking'))
+            for user_id, p in profiles.items()
+        ])
+
+def get_user_profile_stats():
+    """يعيد (عدد المستخدمين المحفوظين، عدد من حجز أكثر من مرة)."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*), COALESCE(SUM(booking_count > 1), 0) FROM user_profiles
+        """)
+        total, frequent = cursor.fetchone()
+        return total, frequent
 
-    all_time_slots = [
-        "9:00 صباحاً", "10:00 صباحاً", "11:00 صباحاً",
-        "12:00 ظهراً", "1:00 مساءً", "2:00 مساءً",
-        "3:00 مساءً", "4:00 مساءً", "5:00 مساءً",
-        "6:00 مساءً", "7:00 مساءً", "8:00 مساءً"
-    ]
+def get_notification_preferences(user_id):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM notification_preferences WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {key: bool(row[key]) for key in NOTIFICATION_PREFERENCE_KEYS}
 
-    booked_slots = set(get_booked_time_slots(day_name))
+def save_notification_preferences(preferences):
+    """حفظ دفعة من التفضيلات {user_id: preferences} في معاملة واحدة."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(f"""
+            INSERT OR REPLACE INTO notification_preferences (user_id, {', '.join(NOTIFICATION_PREFERENCE_KEYS)})
+            VALUES (?, ?, ?, ?, ?)
+        """, [
+            (user_id, *(int(prefs[key]) for key in NOTIFICATION_PREFERENCE_KEYS))
+            for user_id, prefs in preferences.items()
+        ])
 
-    available_slots = []
-    for slot in all_time_slots:
-        slot_hour_min = slot.split(" ")[0] # e.g., "9:00"
-        slot_time_obj = datetime.strptime(f"{now.strftime('%d/%m/%Y')} {slot_hour_min}", "%d/%m/%Y %H:%M")
+# === حفظ حالة البوت (persistence.py) ===
+def get_persisted_data(table):
+    """كل صفوف user_data أو chat_data المحفوظة: {id: نص JSON}."""
+    if table not in PERSISTED_DATA_TABLES:
+        raise ValueError(f"Unknown persistence table: {table}")
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT id, data FROM {table}")
+        return {row['id']: row['data'] for row in cursor.fetchall()}
+
+def get_conversation_states():
+    """كل حالات المحادثات المحفوظة: {(اسم المحادثة، المفتاح): الحالة} كنصوص JSON."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name, conversation_key, state FROM conversation_states")
+        return {(row['name'], row['conversation_key']): row['state'] for row in cursor.fetchall()}
+
+def save_persistence_batch(data, conversations):
+    """
+    حفظ دفعة من التغييرات في معاملة واحدة.
+    data: {(table, id): نص JSON أو None للحذف}
+    conversations: {(name, key): نص JSON أو None لإنهاء المحادثة}
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for table in PERSISTED_DATA_TABLES:
+            rows = [(row_id, value) for (t, row_id), value in data.items() if t == table]
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)",
+                [row for row in rows if row[1] is not None]
+            )
+            cursor.executemany(
+                f"DELETE FROM {table} WHERE id = ?",
+                [(row_id,) for row_id, value in rows if value is None]
+            )
+        cursor.executemany("""
+            INSERT OR REPLACE INTO conversation_states (name, conversation_key, state) VALUES (?, ?, ?)
+        """, [(name, key, state) for (name, key), state in conversations.items() if state is not None])
+        cursor.executemany(
+            "DELETE FROM conversation_states WHERE name = ? AND conversation_key = ?",
+            [(name, key) for (name, key), state in conversations.items() if state is None]
+        )
 
-        is_available = check_time_slot_available(day_name, slot, exclude_user_id)
-        is_after_current_time = True # Assume true for future days
+# === محرك توفر المواعيد ===
+def ticks_from_mask(mask):
+    """أرقام الوحدات المضبوطة في القناع بالترتيب."""
+    return [tick for tick in range(DAY_TICKS) if mask >> tick & 1]
 
-        if day_name == today_name: # If it's today, check time
-            is_after_current_time = slot_time_obj.time() > now.time()
+def slots_from_mask(mask):
+    """تحويل قناع التوفر (bit لكل وحدة) إلى قائمة أسماء المواعيد المتاحة."""
+    return [TICK_LABELS[tick] for tick in ticks_from_mask(mask)]
 
-        if is_available and is_after_current_time:
-            available_slots.append(slot)
+def _fit_mask(free, duration):
+    """بدايات الوحدات التي تليها duration وحدة فارغة متتالية في القناع free."""
+    mask = free
+    for shift in range(1, duration):
+        mask &= free >> shift
+    return mask
 
-    return available_slots
+def _first_fit(free, duration, devices):
+    """أبكر (جهاز، وحدة) يتسع للخدمة، بترتيب تفضيل الأجهزة، أو None."""
+    for device in devices:
+        mask = _fit_mask(free.get(device, 0), duration) & START_TICKS_MASK
+        if mask:
+            return device, (mask & -mask).bit_length() - 1
+    return None
+
+def _past_ticks_mask(day, now):
+    """الوحدات التي بدأ وقتها (كل اليوم لتاريخ مضى)."""
+    elapsed = (now - datetime.combine(day, dt_time(SLOT_HOURS[0]))).total_seconds()
+    if elapsed < 0:
+        return 0
+    return (1 << min(DAY_TICKS, int(elapsed // (TICK_MINUTES * 60)) + 1)) - 1
+
+def _busy_masks(start_date, end_date, exclude_user_id, now):
+    """قناع الوحدات المشغولة لكل (تاريخ ISO، جهاز) في المدى، باستعلام واحد على idx_slot_calendar_slot."""
+    busy = {}
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT slot_date, device, tick FROM slot_calendar
+            WHERE slot_date BETWEEN ? AND ?
+            AND user_id != ?
+            AND (held_until IS NULL OR held_until > ?)
+        """, (start_date.isoformat(), end_date.isoformat(), exclude_user_id or 0, now.timestamp()))
+        for slot_date, device, tick in cursor.fetchall():
+            busy[slot_date, device] = busy.get((slot_date, device), 0) | 1 << tick
+    return busy
+
+def get_availability(start_date, end_date, exclude_user_id=None, service=None):
+    """
+    يحسب لكل يوم في المدى [start_date, end_date] الأوقات التي يمكن أن تبدأ فيها الخدمة:
+    وحدة البداية متاحة إذا كان لأحد أجهزة الخدمة مدتها كاملة فارغة منها (عمليات bit على قناع كل جهاز).
+
+    يعيد dict من date إلى قناع (int): البت i مضبوط إذا أمكن بدء الخدمة عند TICK_LABELS[i].
+    الوحدات التي مضى وقتها والمحجوزة (ولو مؤقتاً) لمستخدم آخر غير متاحة.
+    """
+    now = datetime.now()
+    duration, devices = service_profile(service)
+    busy = _busy_masks(start_date, end_date, exclude_user_id, now)
+    masks = {}
+    for offset in range((end_date - start_date).days + 1):
+        day = start_date + timedelta(days=offset)
+        mask = 0
+        for device in devices:
+            mask |= _fit_mask(ALL_TICKS_MASK & ~busy.get((day.isoformat(), device), 0), duration)
+        masks[day] = mask & START_TICKS_MASK & ~_past_ticks_mask(day, now)
+    return masks
+
+def get_available_days_for_booking(service=None):
+    """
+    يعيد قائمة التواريخ (date) خلال الأيام القادمة التي يمكن فيها بدء الخدمة مرة واحدة على الأقل.
+    """
+    today = datetime.now().date()
+    masks = get_availability(today, today + timedelta(days=BOOKING_HORIZON_DAYS - 1), service=service)
+    return [day for day, mask in masks.items() if mask]
+
+def get_available_time_slots_for_day(day_date, exclude_user_id=None, service=None):
+    """
+    يعيد قائمة أوقات البداية المتاحة للخدمة في التاريخ المحدد (date)،
+    مع استبعاد الأوقات التي مضت إذا كان التاريخ هو اليوم.
+    """
+    masks = get_availability(day_date, day_date, exclude_user_id, service)
+    return slots_from_mask(masks[day_date])
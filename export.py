@@ -0,0 +1,138 @@
+"""
+export.py — تصدير الحجوزات والتقييمات وقائمة الانتظار للمشرفين (/export)
+
+الصفوف تُقرأ من SQLite على دفعات عبر المولد db.iter_export_rows وتُكتب مباشرة إلى
+SpooledTemporaryFile (في الذاكرة حتى SPOOL_MAX_BYTES ثم على القرص)، فيبقى استهلاك
+الذاكرة ثابتاً مهما كانت مدة التصدير. XLSX يتطلب openpyxl (اختياري) ويُكتب بوضع write_only.
+
+يُستدعى write_export على خيط قاعدة البيانات: await adb.run(export.write_export, ...).
+"""
+
+import csv
+import io
+import re
+import tempfile
+from datetime import date
+
+import database as db
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # بدون openpyxl يتوفر CSV فقط
+    Workbook = None
+
+SPOOL_MAX_BYTES = 1 << 20
+
+EXPORT_KINDS = {'bookings': 'bookings', 'ratings': 'ratings', 'waiting': 'waiting_list', 'waiting_list': 'waiting_list'}
+EXPORT_FORMATS = ('csv', 'xlsx')
+STATUS_ALIASES = {
+    'pending': 'قيد الانتظار',
+    'confirmed': 'مؤكد',
+    'done': 'تم التصوير',
+    'absent': 'لم يحضر',
+    'cancelled': 'ملغي',
+}
+
+USAGE = (
+    "📤 **تصدير البيانات**\n\n"
+    "`/export [bookings|ratings|waiting] [csv|xlsx] [من YYYY-MM-DD] [إلى YYYY-MM-DD] [الحالة]`\n\n"
+    "الحالة (للحجوزات فقط): " + ", ".join(f"`{alias}`" for alias in STATUS_ALIASES) + "\n"
+    "مثال: `/export bookings xlsx 2026-01-01 2026-03-31 done`"
+)
+
+_DATE_ARG = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+# خلايا تبدأ بهذه الرموز يفسرها Excel كمعادلات (CSV injection)
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def parse_export_args(args):
+    """
+    تحويل معاملات الأمر إلى معاملات write_export.
+    يرفع ValueError برسالة للمشرف عند معامل غير معروف.
+    """
+    options = {'kind': 'bookings', 'fmt': 'csv', 'date_from': None, 'date_to': None, 'status': None}
+    dates = []
+    for arg in args:
+        value = arg.strip().lower()
+        if value in EXPORT_KINDS:
+            options['kind'] = EXPORT_KINDS[value]
+        elif value in EXPORT_FORMATS:
+            options['fmt'] = value
+        elif value in STATUS_ALIASES:
+            options['status'] = STATUS_ALIASES[value]
+        elif arg in STATUS_ALIASES.values():
+            options['status'] = arg
+        elif _DATE_ARG.match(value):
+            try:
+                dates.append(date.fromisoformat(value))
+            except ValueError:
+                raise ValueError(f"تاريخ غير صالح: {arg}")
+        else:
+            raise ValueError(f"معامل غير معروف: {arg}")
+
+    if len(dates) > 2:
+        raise ValueError("يمكن تحديد تاريخين على الأكثر (من، إلى).")
+    if dates:
+        options['date_from'] = dates[0]
+    if len(dates) == 2:
+        options['date_to'] = dates[1]
+        if dates[1] < dates[0]:
+            raise ValueError("تاريخ النهاية قبل تاريخ البداية.")
+    if options['status'] and options['kind'] != 'bookings':
+        raise ValueError("فلتر الحالة متاح للحجوزات فقط.")
+    if options['fmt'] == 'xlsx' and Workbook is None:
+        raise ValueError("تصدير XLSX غير متاح على الخادم (openpyxl غير مثبت)، استخدم csv.")
+    return options
+
+
+def _cell(value):
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _write_csv(spool, rows):
+    # utf-8-sig حتى يعرض Excel النص العربي بشكل صحيح
+    text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(next(rows))
+    count = 0
+    for row in rows:
+        writer.writerow([_cell(value) for value in row])
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+
+def _write_xlsx(spool, rows, title):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(next(rows))
+    count = 0
+    for row in rows:
+        sheet.append([_cell(value) for value in row])
+        count += 1
+    workbook.save(spool)
+    return count
+
+
+def write_export(kind, fmt="csv", date_from=None, date_to=None, status=None):
+    """يكتب التصدير ويعيد (الملف المؤقت عند بدايته، عدد الصفوف، اسم الملف)."""
+    rows = db.iter_export_rows(kind, date_from, date_to, status)
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        count = _write_csv(spool, rows) if fmt == "csv" else _write_xlsx(spool, rows, kind)
+    except BaseException:
+        spool.close()
+        raise
+    finally:
+        rows.close()
+    spool.seek(0)
+
+    parts = [kind]
+    if date_from:
+        parts.append(date_from.isoformat())
+    if date_to:
+        parts.append(date_to.isoformat())
+    return spool, count, f"{'_'.join(parts)}.{fmt}"
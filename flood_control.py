@@ -0,0 +1,181 @@
+"""
+flood_control.py — الحد من إغراق البوت بالتحديثات (مستخدم يكرر /start أو يضغط الأزرار بسرعة)
+
+FloodControl.admit يستدعيه OrderedUpdateProcessor.do_process_update لكل تحديث قبل أن
+يدخل طابور محادثته، فالتحديث المُهمل لا يأخذ مكاناً في الطوابير ولا عاملاً. لكل مستخدم دلو
+رموز (token bucket)، وهناك دلو عام لكل التحديثات. الفحص كله في الذاكرة ولا ينتظر، ورسالة
+الحظر تُرسل في مهمة خلفية حتى لا يتوقف جالب التحديثات على طلب HTTP. بدون المعالج المتوازي
+(CONCURRENT_UPDATES=1) يؤدي check_update نفس الفحص كمعالج TypeHandler في المجموعة -1.
+
+    - الأوامر (/start وغيرها) تكلف COMMAND_COST رموز لأنها أغلى من ضغطة زر
+    - من يتجاوز حده BAN_AFTER مرة خلال STRIKE_WINDOW ثانية يُحظر مؤقتاً BAN_SECONDS
+      ثانية، وتتضاعف المدة مع كل حظر متكرر حتى MAX_BAN_SECONDS، مع رسالة واحدة تخبره بذلك
+    - المشرفون (exempt_ids) مستثنون من الحد الخاص بالمستخدم ومن الحظر
+    - حالة المستخدمين في OrderedDict محدود بـ MAX_TRACKED_USERS (الأقدم نشاطاً يُحذف أولاً)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+USER_RATE = float(os.getenv("FLOOD_USER_RATE", 1))  # رموز في الثانية لكل مستخدم
+USER_BURST = float(os.getenv("FLOOD_USER_BURST", 10))
+GLOBAL_RATE = float(os.getenv("FLOOD_GLOBAL_RATE", 100))  # 0 لتعطيل الحد العام
+GLOBAL_BURST = float(os.getenv("FLOOD_GLOBAL_BURST", 300))
+COMMAND_COST = 3
+BAN_AFTER = int(os.getenv("FLOOD_BAN_AFTER", 15))
+STRIKE_WINDOW = 60
+BAN_SECONDS = float(os.getenv("FLOOD_BAN_SECONDS", 60))
+MAX_BAN_SECONDS = 3600
+MAX_TRACKED_USERS = 50000
+
+BAN_NOTICE = "⏳ رسائل كثيرة في وقت قصير. يرجى الانتظار {seconds} ثانية ثم المحاولة مجدداً."
+
+UPDATES_THROTTLED = metrics.Counter(
+    "bot_updates_throttled_total", "Updates dropped by flood control before reaching any handler", ("reason",)
+)
+USERS_BANNED = metrics.Counter(
+    "bot_flood_bans_total", "Temporary bans issued by flood control", ()
+)
+
+
+class _Bucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, cost, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+
+class _UserState(_Bucket):
+    __slots__ = ("strikes", "first_strike", "banned_until", "bans")
+
+    def __init__(self, rate, capacity, now):
+        super().__init__(rate, capacity, now)
+        self.strikes = 0
+        self.first_strike = 0.0
+        self.banned_until = 0.0
+        self.bans = 0
+
+
+class FloodControl:
+    def __init__(self, user_rate=USER_RATE, user_burst=USER_BURST, global_rate=GLOBAL_RATE,
+                 global_burst=GLOBAL_BURST, exempt_ids=(), clock=time.monotonic):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.exempt_ids = exempt_ids
+        self.clock = clock
+        self._global = _Bucket(global_rate, global_burst, clock()) if global_rate > 0 else None
+        self._users = OrderedDict()
+        self._notices = set()  # مراجع مهام رسائل الحظر حتى لا تُحذف قبل انتهائها
+
+    @staticmethod
+    def update_cost(update):
+        message = update.effective_message if update.callback_query is None else None
+        if message is not None and message.text and message.text.startswith("/"):
+            return COMMAND_COST
+        return 1
+
+    def _user_state(self, user_id, now):
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState(self.user_rate, self.user_burst, now)
+            if len(self._users) > MAX_TRACKED_USERS:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return state
+
+    def _strike(self, user_id, state, now):
+        """تسجيل تجاوز؛ يعيد True إذا بلغ المستخدم BAN_AFTER تجاوزاً داخل النافذة فحُظر."""
+        if now - state.first_strike > STRIKE_WINDOW:
+            state.strikes = 0
+            state.first_strike = now
+        state.strikes += 1
+        if state.strikes < BAN_AFTER:
+            return False
+
+        # من التزم مدة طويلة بعد آخر حظر يبدأ التصعيد من جديد
+        if now - state.banned_until > MAX_BAN_SECONDS:
+            state.bans = 0
+        duration = min(BAN_SECONDS * 2 ** state.bans, MAX_BAN_SECONDS)
+        state.bans += 1
+        state.banned_until = now + duration
+        state.strikes = 0
+        USERS_BANNED.inc()
+        logger.warning(f"Flood control: user {user_id} banned for {duration:.0f}s (ban #{state.bans})")
+        return True
+
+    def check(self, user_id, cost=1):
+        """
+        يعيد None إذا سُمح بالتحديث، وإلا سبب الإهمال: "user" (تجاوز حده)، "ban" (تجاوز
+        بدأ به حظر جديد)، "banned" (محظور حالياً) أو "global" (تجاوز الحد العام).
+        """
+        now = self.clock()
+        state = None
+        if user_id is not None and user_id not in self.exempt_ids:
+            state = self._user_state(user_id, now)
+            if now < state.banned_until:
+                return "banned"
+            if not state.take(cost, now):
+                return "ban" if self._strike(user_id, state, now) else "user"
+
+        if self._global is not None and not self._global.take(cost, now):
+            if state is not None:
+                state.tokens += cost  # لم يُعالج التحديث، فلا يُحسب على المستخدم
+            return "global"
+        return None
+
+    def ban_remaining(self, user_id):
+        state = self._users.get(user_id)
+        return max(0.0, state.banned_until - self.clock()) if state else 0.0
+
+    def admit(self, update):
+        """True إذا سُمح بالتحديث؛ وإلا يُحسب في UPDATES_THROTTLED ويعيد False (يُستدعى داخل حلقة asyncio)."""
+        if not isinstance(update, Update):
+            return True
+        user = update.effective_user
+        reason = self.check(user.id if user else None, self.update_cost(update))
+        if reason is None:
+            return True
+
+        UPDATES_THROTTLED.inc(reason)
+        if reason == "ban":
+            task = asyncio.create_task(self._notify_ban(update, self.ban_remaining(user.id)))
+            self._notices.add(task)
+            task.add_done_callback(self._notices.discard)
+        return False
+
+    async def check_update(self, update, context):
+        if not self.admit(update):
+            raise ApplicationHandlerStop
+
+    @staticmethod
+    async def _notify_ban(update, duration):
+        text = BAN_NOTICE.format(seconds=int(duration))
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(text, show_alert=True)
+            elif update.effective_message:
+                await update.effective_message.reply_text(text)
+        except Exception as e:
+            logger.error(f"Failed to send flood-control notice: {e}")
@@ -0,0 +1,233 @@
+"""
+metrics.py — قياس أداء البوت بصيغة Prometheus
+
+مقاييس خفيفة بدون مكتبات خارجية: مدرجات (histograms) لزمن المعالجات واستعلامات
+قاعدة البيانات وطلبات Telegram API والمهام المجدولة، وعدادات للأخطاء.
+تُعرض على /metrics عبر خادم HTTP صغير يعمل في نفس حلقة الأحداث بجانب البوت.
+
+كلفة كل قياس: قراءتان لـ perf_counter وبحث ثنائي في حدود المدرج (بضع ميكروثوانٍ على الأكثر).
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import time
+from bisect import bisect_left
+
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+_registry = []
+
+
+class _HistogramChild:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._children = {}
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        child = self._children.get(labels)
+        if child is None:
+            child = self._children[labels] = _HistogramChild(len(self.buckets) + 1)
+        child.counts[bisect_left(self.buckets, value)] += 1
+        child.sum += value
+        child.count += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, child in sorted(self._children.items()):
+            base = _format_labels(self.labelnames, labels)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), child.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="{bound}"}} {cumulative}')
+            suffix = f"{{{base}}}" if base else ""
+            lines.append(f"{self.name}_sum{suffix} {child.sum}")
+            lines.append(f"{self.name}_count{suffix} {child.count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            base = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}{{{base}}} {value}" if base else f"{self.name} {value}")
+        return lines
+
+
+def _format_labels(names, values):
+    return ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# === المقاييس ===
+HANDLER_LATENCY = Histogram("bot_handler_duration_seconds", "Handler latency", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handlers that raised", ("handler",))
+DB_LATENCY = Histogram("bot_db_query_duration_seconds", "Database call latency, including executor wait", ("function",))
+DB_QUERIES_PER_UPDATE = Histogram(
+    "bot_db_queries_per_update", "Database calls made while handling one update", ("handler",), COUNT_BUCKETS
+)
+TELEGRAM_LATENCY = Histogram("bot_telegram_api_duration_seconds", "Bot API request latency", ("method",))
+TELEGRAM_ERRORS = Counter("bot_telegram_api_errors_total", "Failed Bot API requests", ("method", "reason"))
+JOB_DURATION = Histogram("bot_job_duration_seconds", "Scheduled job run time", ("job",))
+JOB_ERRORS = Counter("bot_job_errors_total", "Scheduled jobs that raised", ("job",))
+
+# عداد استعلامات التحديث الحالي (لكل مهمة asyncio قيمتها الخاصة)
+_update_queries = contextvars.ContextVar("update_queries", default=None)
+
+
+# === المعالجات ===
+def track_handler(callback):
+    name = getattr(callback, "__name__", None) or getattr(getattr(callback, "func", None), "__name__", repr(callback))
+
+    @functools.wraps(callback)
+    async def wrapper(update, context, *args, **kwargs):
+        queries = [0]
+        token = _update_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            return await callback(update, context, *args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, name)
+            DB_QUERIES_PER_UPDATE.observe(queries[0], name)
+            _update_queries.reset(token)
+
+    wrapper.__wrapped_by_metrics__ = True
+    return wrapper
+
+
+def instrument_handlers(application):
+    """تغليف callback لكل معالج مسجل في Application، بما فيها حالات ConversationHandler."""
+    def instrument(handler):
+        if isinstance(handler, ConversationHandler):
+            for inner in handler.entry_points + handler.fallbacks:
+                instrument(inner)
+            for handlers in handler.states.values():
+                for inner in handlers:
+                    instrument(inner)
+        elif not getattr(handler.callback, "__wrapped_by_metrics__", False):
+            handler.callback = track_handler(handler.callback)
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            instrument(handler)
+
+
+# === قاعدة البيانات ===
+def observe_db_call(function_name, duration):
+    DB_LATENCY.observe(duration, function_name)
+    queries = _update_queries.get()
+    if queries is not None:
+        queries[0] += 1
+
+
+# === المهام المجدولة ===
+def track_job(callback, name=None):
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(context):
+        start = time.perf_counter()
+        try:
+            return await callback(context)
+        except Exception:
+            JOB_ERRORS.inc(name)
+            raise
+        finally:
+            JOB_DURATION.observe(time.perf_counter() - start, name)
+
+    return wrapper
+
+
+# === Telegram Bot API ===
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest يسجل زمن كل طلب لـ Bot API ونتيجته."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            status, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception as e:
+            TELEGRAM_ERRORS.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_LATENCY.observe(time.perf_counter() - start, api_method)
+        if status >= 400:
+            TELEGRAM_ERRORS.inc(api_method, str(status))
+        return status, payload
+
+
+# === خادم /metrics ===
+async def _handle_http(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # تجاهل بقية الترويسات
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body, content_type = "200 OK", render().encode(), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            status, body, content_type = "404 Not Found", b"Not Found\n", "text/plain"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host=METRICS_HOST, port=METRICS_PORT):
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info(f"Metrics available on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,139 @@
+"""
+persistence.py — حفظ حالة البوت في SQLite
+
+يحفظ حالة المحادثات (ConversationHandler) و user_data و chat_data في نفس
+قاعدة بيانات الحجوزات، حتى يكمل المريض الحجز من حيث توقف بعد إعادة تشغيل البوت.
+
+لا يُعاد حفظ كل شيء في كل مرة: Application يمرر فقط المفاتيح التي تغيرت،
+ونجمعها هنا ونكتبها في معاملة واحدة. عند التشغيل تُقرأ كل البيانات باستعلام واحد لكل جدول.
+"""
+
+import asyncio
+import json
+import logging
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import async_database as adb
+import database as db
+
+logger = logging.getLogger(__name__)
+
+USER_DATA_TABLE, CHAT_DATA_TABLE = db.PERSISTED_DATA_TABLES
+
+
+def _encode_key(key):
+    return json.dumps(list(key))
+
+
+def _decode_key(text):
+    return tuple(json.loads(text))
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    تخزين conversations و user_data و chat_data في SQLite بصيغة JSON لكل مفتاح.
+    bot_data و callback_data غير مستخدمة في البوت فلا تُحفظ.
+    """
+
+    def __init__(self, update_interval=5):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self._conversations = None
+        self._pending_data = {}
+        self._pending_conversations = {}
+        self._writer = None
+
+    # --- القراءة عند التشغيل ---
+    async def _load_data(self, table):
+        rows = await adb.get_persisted_data(table)
+        return {row_id: json.loads(data) for row_id, data in rows.items()}
+
+    async def get_user_data(self):
+        return await self._load_data(USER_DATA_TABLE)
+
+    async def get_chat_data(self):
+        return await self._load_data(CHAT_DATA_TABLE)
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        # استعلام واحد لكل المحادثات، ثم توزيعها على ConversationHandler حسب الاسم
+        if self._conversations is None:
+            self._conversations = {}
+            for (conv_name, key), state in (await adb.get_conversation_states()).items():
+                self._conversations.setdefault(conv_name, {})[_decode_key(key)] = json.loads(state)
+            logger.info(f"Loaded {sum(map(len, self._conversations.values()))} persisted conversations")
+        return self._conversations.pop(name, {})
+
+    # --- الكتابة: تُجمع التغييرات وتُكتب دفعة واحدة ---
+    async def _write_pending(self):
+        await asyncio.sleep(0)  # انتظار بقية تغييرات نفس الدورة
+        while self._pending_data or self._pending_conversations:
+            data, self._pending_data = self._pending_data, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            try:
+                await adb.save_persistence_batch(data, conversations)
+            except Exception:
+                # إعادة التغييرات للدفعة التالية دون الكتابة فوق ما تغيّر بعدها
+                for key, value in data.items():
+                    self._pending_data.setdefault(key, value)
+                for key, value in conversations.items():
+                    self._pending_conversations.setdefault(key, value)
+                raise
+            logger.debug(f"Persisted {len(data)} data entries and {len(conversations)} conversation states")
+
+    async def _schedule_write(self):
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending())
+        await asyncio.shield(self._writer)
+
+    async def update_conversation(self, name, key, new_state):
+        self._pending_conversations[(name, _encode_key(key))] = (
+            None if new_state is None else json.dumps(new_state)
+        )
+        await self._schedule_write()
+
+    async def update_user_data(self, user_id, data):
+        self._pending_data[(USER_DATA_TABLE, user_id)] = json.dumps(data, ensure_ascii=False)
+        await self._schedule_write()
+
+    async def update_chat_data(self, chat_id, data):
+        self._pending_data[(CHAT_DATA_TABLE, chat_id)] = json.dumps(data, ensure_ascii=False)
+        await self._schedule_write()
+
+    async def drop_user_data(self, user_id):
+        self._pending_data[(USER_DATA_TABLE, user_id)] = None
+        await self._schedule_write()
+
+    async def drop_chat_data(self, chat_id):
+        self._pending_data[(CHAT_DATA_TABLE, chat_id)] = None
+        await self._schedule_write()
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        """يُستدعى عند إيقاف البوت بعد آخر تحديث للحالة."""
+        if self._pending_data or self._pending_conversations:
+            await self._schedule_write()
+        elif self._writer is not None:
+            await self._writer
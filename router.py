@@ -0,0 +1,91 @@
+"""
+router.py — موجه أزرار callback_data
+
+يستبدل سلسلة if/elif الطويلة: المفاتيح الثابتة (مثل 'admin_stats') تُطابق
+بقاموس، والبادئات (مثل 'admin_edit_') بشجرة (trie) على أجزاء النص المفصولة بـ '_'
+تختار أطول بادئة مطابقة، فلا تعتمد كلفة التوجيه على ترتيب الأزرار أو عددها.
+
+لكل مسار دالة تحليل اختيارية تحوّل باقي النص إلى معاملات مكتوبة (int، ...)
+تُمرر للمعالج مباشرة، وعلامة admin للتحقق من صلاحية المشرف قبل التنفيذ.
+"""
+
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+Route = namedtuple("Route", ["handler", "parse", "admin"])
+
+ADMIN_ONLY_MESSAGE = "❌ هذه الميزة مخصصة للمشرفين فقط."
+SEPARATOR = "_"
+
+
+class CallbackRouter:
+    def __init__(self, admin_ids, fallback=None, on_invalid=None):
+        self.admin_ids = admin_ids
+        self.fallback = fallback
+        self.on_invalid = on_invalid
+        self._exact = {}
+        self._trie = {}
+
+    def exact(self, key, handler, admin=False):
+        self._exact[key] = Route(handler, None, admin)
+
+    def prefix(self, prefix, handler, parse=None, admin=False):
+        """
+        البادئة تنتهي بـ '_' (مثل 'admin_edit_').
+        parse(باقي النص) تعيد tuple من المعاملات أو ترفع ValueError/KeyError/IndexError.
+        """
+        if not prefix.endswith(SEPARATOR):
+            raise ValueError(f"Callback prefix must end with '{SEPARATOR}': {prefix}")
+        node = self._trie
+        for part in prefix[:-1].split(SEPARATOR):
+            node = node.setdefault(part, {})
+        node[None] = Route(handler, parse, admin)
+
+    def resolve(self, data):
+        """يعيد (المسار، المعاملات) أو (None، None). قد يرفع خطأ التحليل."""
+        route = self._exact.get(data)
+        if route is not None:
+            return route, ()
+
+        # مسح واحد للنص بـ find بدل split، والتوقف عند أول جزء لا يطابق الشجرة؛
+        # الجزء الأخير لا يكون بادئة (كل بادئة تنتهي بفاصل)
+        node = self._trie
+        match, match_end = None, 0
+        start = 0
+        end = data.find(SEPARATOR)
+        while end >= 0:
+            node = node.get(data[start:end])
+            if node is None:
+                break
+            start = end + 1
+            route = node.get(None)
+            if route is not None:
+                match, match_end = route, start
+            end = data.find(SEPARATOR, start)
+        if match is None:
+            return None, None
+        if match.parse is None:
+            return match, ()
+        return match, match.parse(data[match_end:])
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        try:
+            route, args = self.resolve(query.data or "")
+        except (ValueError, KeyError, IndexError):
+            logger.error(f"Invalid callback data: {query.data}")
+            if self.on_invalid:
+                return await self.on_invalid(update, context)
+            return None
+
+        if route is None:
+            return await self.fallback(update, context) if self.fallback else None
+
+        if route.admin and update.effective_user.id not in self.admin_ids:
+            logger.warning(f"User {update.effective_user.id} tried admin callback {query.data}")
+            await query.answer(ADMIN_ONLY_MESSAGE, show_alert=True)
+            return None
+
+        return await route.handler(update, context, *args)
@@ -0,0 +1,156 @@
+"""
+update_processor.py — معالجة التحديثات بالتوازي مع الحفاظ على ترتيب كل محادثة
+
+تحديثات المحادثات المختلفة تُعالج بالتوازي (concurrency عامل ثابت)، أما تحديثات نفس
+المحادثة فتُعالج واحداً تلو الآخر بترتيب وصولها، حتى تبقى حالة ConversationHandler
+متسقة (مثلاً لا تُعالج رسالة رقم الجوال قبل رسالة الاسم).
+
+لماذا لا نترك PTB ينشئ المهام: إذا كان max_concurrent_updates > 1 ينشئ جالب التحديثات
+في Application مهمة لكل تحديث فور سحبه من update_queue دون أي حد، فيتفرغ الطابور وتتراكم
+المهام في الذاكرة مهما كانت الحدود داخل المعالج. لذلك يعلن هذا المعالج 1 فينتظر الجالب
+process_update لكل تحديث، وهي تضع التحديث في طابور محادثته وتعود فوراً، أو تنتظر إذا
+امتلأت الطوابير؛ عندها يتوقف سحب update_queue (المحدود في build_application) فيتوقف
+Updater عن جلب تحديثات جديدة من Telegram. العمال (concurrency مهمة) يأخذون المحادثات
+الجاهزة بالتناوب، تحديثاً واحداً من كل محادثة في كل دور.
+
+الحدود:
+    - flood_control (FloodControl): يُفحص كل تحديث قبل أي طابور أو انتظار، فتحديثات
+      المستخدم المُغرق تُهمل دون أن تأخذ مكاناً أو توقف الجالب.
+    - max_pending: أقصى عدد تحديثات مقبولة (قيد التنفيذ أو تنتظر دور محادثتها)؛
+      ما زاد عنها يوقف الجالب حتى يفرغ مكان.
+    - max_pending_per_chat: أقصى عدد تحديثات تنتظر في طابور محادثة واحدة؛ ما زاد يُهمل
+      فوراً حتى لا تستهلك محادثة واحدة (إغراق بالرسائل) كل الأماكن.
+
+عند الإيقاف: join() ينتظر انتهاء كل التحديثات المقبولة (bot.on_stop يستدعيها قبل إغلاق
+اتصال Bot API)، و shutdown() يوقف العمال ويغلق ما بقي دون معالجة.
+"""
+
+import asyncio
+import logging
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+UPDATES_DROPPED = metrics.Counter(
+    "bot_updates_dropped_total", "Updates dropped because their chat had too many pending", ()
+)
+CHAT_WAIT = metrics.Histogram(
+    "bot_update_chat_wait_seconds", "Time an update waited in its chat queue before a worker took it", ()
+)
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, concurrency, max_pending=None, max_pending_per_chat=20, flood_control=None):
+        # 1 حتى ينتظر جالب PTB كل process_update بدل إنشاء مهمة لكل تحديث (انظر أعلى الملف)
+        super().__init__(1)
+        self.concurrency = concurrency
+        self.max_pending = max_pending or concurrency * 8
+        self.max_pending_per_chat = max_pending_per_chat
+        self.flood_control = flood_control
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._chains = {}  # مفتاح المحادثة → deque من (update, coroutine, queued_at)
+        self._ready = asyncio.Queue()  # محادثات لها تحديثات ولا يعالجها عامل الآن
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = []
+
+    @staticmethod
+    def _chat_key(update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _drop(self, update, key, coroutine, chain):
+        UPDATES_DROPPED.inc()
+        logger.warning(f"Dropping update {getattr(update, 'update_id', '?')}: chat {key} has {len(chain)} pending updates")
+        coroutine.close()
+
+    async def do_process_update(self, update, coroutine):
+        if self.flood_control is not None and not self.flood_control.admit(update):
+            coroutine.close()
+            return
+
+        key = self._chat_key(update)
+        if key is None:
+            key = object()  # بلا محادثة: لا ترتيب مطلوب، طابور خاص به
+
+        chain = self._chains.get(key)
+        if chain is not None and len(chain) >= self.max_pending_per_chat:
+            self._drop(update, key, coroutine, chain)
+            return
+
+        # هنا يتوقف الجالب عند امتلاء max_pending (ضغط عكسي على update_queue)
+        await self._slots.acquire()
+        chain = self._chains.get(key)
+        if chain is None:
+            chain = self._chains[key] = deque()
+            self._ready.put_nowait(key)
+        elif len(chain) >= self.max_pending_per_chat:
+            self._slots.release()
+            self._drop(update, key, coroutine, chain)
+            return
+        chain.append((update, coroutine, asyncio.get_running_loop().time()))
+        self._pending += 1
+        self._idle.clear()
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key = await self._ready.get()
+            chain = self._chains[key]
+            update, coroutine, queued_at = chain.popleft()
+            CHAT_WAIT.observe(loop.time() - queued_at)
+            try:
+                await coroutine
+            except Exception:
+                # Application.process_update يعالج أخطاء المعالجات بنفسه؛ هذا لأي خطأ خارجها
+                logger.exception(f"Unhandled error while processing update {getattr(update, 'update_id', '?')}")
+            finally:
+                self._slots.release()
+                self._pending -= 1
+                if self._pending == 0:
+                    self._idle.set()
+            # تحديث واحد لكل دور، ثم تعود المحادثة لآخر الطابور حتى لا تحجز عاملاً
+            if chain:
+                self._ready.put_nowait(key)
+            else:
+                del self._chains[key]
+
+    async def join(self):
+        """انتظار انتهاء كل التحديثات المقبولة."""
+        await self._idle.wait()
+
+    async def initialize(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker(), name=f"update-worker-{i}")
+                             for i in range(self.concurrency)]
+
+    async def shutdown(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for chain in self._chains.values():
+            for _, coroutine, _ in chain:
+                coroutine.close()
+        if self._pending:
+            logger.warning(f"Update processor shut down with {self._pending} unprocessed updates")
+        self._chains.clear()
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._pending = 0
+        self._idle.set()